@@ -1,15 +1,26 @@
 -- PostgreSQL with pgvector initialization script for CommandCore
+-- Safe to re-run against an existing database.
 
 -- Create necessary extensions
 CREATE EXTENSION IF NOT EXISTS vector;
 
+-- Create documents table holding each document's metadata once
+CREATE TABLE IF NOT EXISTS documents (
+    id UUID PRIMARY KEY,
+    source_info JSONB NOT NULL,  -- Title, author, publication date, url
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    deleted_at TIMESTAMP WITH TIME ZONE  -- Set when queued for deletion
+);
+
 -- Create knowledge_chunks table for storing document chunks and embeddings
 CREATE TABLE IF NOT EXISTS knowledge_chunks (
     id SERIAL PRIMARY KEY,
     chunk_text TEXT NOT NULL,
     embedding vector(1536) NOT NULL,  -- Using 1536 dimensions for OpenAI embeddings
-    source_info JSONB NOT NULL,
+    document_id UUID NOT NULL REFERENCES documents (id) ON DELETE CASCADE,
     domain TEXT NOT NULL,
+    chunk_metadata JSONB NOT NULL DEFAULT '{}',  -- Token positions of the chunk
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
@@ -33,56 +44,11 @@ USING GIN (to_tsvector('english', chunk_text));
 CREATE INDEX IF NOT EXISTS knowledge_chunks_domain_idx 
 ON knowledge_chunks (domain);
 
--- Create helpful view
-CREATE OR REPLACE VIEW knowledge_chunks_view AS
-SELECT
-    id,
-    chunk_text,
-    embedding,
-    source_info,
-    domain,
-    created_at,
-    updated_at,
-    source_info->>'title' as title,
-    source_info->>'author' as author,
-    (source_info->>'publication_date')::date as publication_date
-FROM
-    knowledge_chunks;
+-- The document_id index and knowledge_chunks_view are created in
+-- 04_documents.sql, which first adds document_id to databases from before
+-- the documents table
 
--- Function to find similar chunks to a query
-CREATE OR REPLACE FUNCTION find_similar_chunks(
-    query_text TEXT,
-    query_embedding vector(1536),
-    domain_filter TEXT DEFAULT NULL,
-    similarity_threshold FLOAT DEFAULT 0.7,
-    max_results INT DEFAULT 5
-)
-RETURNS TABLE (
-    id INT,
-    chunk_text TEXT,
-    source_info JSONB,
-    similarity FLOAT
-)
-LANGUAGE plpgsql
-AS $$
-BEGIN
-    -- Return similar chunks
-    RETURN QUERY
-    SELECT
-        kc.id,
-        kc.chunk_text,
-        kc.source_info,
-        1 - (kc.embedding <=> query_embedding) AS similarity
-    FROM
-        knowledge_chunks kc
-    WHERE
-        (domain_filter IS NULL OR kc.domain = domain_filter)
-        AND 1 - (kc.embedding <=> query_embedding) > similarity_threshold
-    ORDER BY
-        kc.embedding <=> query_embedding
-    LIMIT max_results;
-END;
-$$;
+-- find_similar_chunks is defined in 05_find_similar_chunks.sql
 
 -- Function to update embeddings when source text changes
 CREATE OR REPLACE FUNCTION update_embedding_on_text_change()
@@ -96,6 +62,7 @@ END;
 $$ LANGUAGE plpgsql;
 
 -- Create trigger for timestamp updates
+DROP TRIGGER IF EXISTS update_timestamp ON knowledge_chunks;
 CREATE TRIGGER update_timestamp
     BEFORE UPDATE ON knowledge_chunks
     FOR EACH ROW
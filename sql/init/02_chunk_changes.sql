@@ -0,0 +1,52 @@
+-- Change log for knowledge_chunks, read by the orchestrator's in-process
+-- vector index replica to stay in sync without rescanning the table.
+-- Sequence numbers are handed out at insert time, not commit time, so
+-- readers follow the log by writing transaction id instead: every change
+-- from a transaction older than their snapshot's xmin is already visible.
+-- The ingestion service's maintenance job prunes rows past their retention.
+-- Safe to re-run against an existing database.
+
+CREATE TABLE IF NOT EXISTS knowledge_chunk_changes (
+    seq BIGSERIAL PRIMARY KEY,
+    chunk_id INT NOT NULL,
+    operation CHAR(1) NOT NULL,  -- I = insert, U = update, D = delete
+    changed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE knowledge_chunk_changes
+ADD COLUMN IF NOT EXISTS xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+
+CREATE INDEX IF NOT EXISTS knowledge_chunk_changes_xid_idx
+ON knowledge_chunk_changes (xid, seq);
+
+-- Rows are appended in time order, so a BRIN index serves the pruning scan
+CREATE INDEX IF NOT EXISTS knowledge_chunk_changes_changed_at_idx
+ON knowledge_chunk_changes USING brin (changed_at);
+
+-- Newest position pruned so far; a reader behind it has missed changes
+CREATE TABLE IF NOT EXISTS knowledge_chunk_changes_pruned (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    pruned_xid xid8 NOT NULL DEFAULT '0',
+    pruned_seq BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO knowledge_chunk_changes_pruned DEFAULT VALUES ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION record_chunk_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO knowledge_chunk_changes (chunk_id, operation) VALUES (OLD.id, 'D');
+        RETURN OLD;
+    END IF;
+    INSERT INTO knowledge_chunk_changes (chunk_id, operation) VALUES (NEW.id, LEFT(TG_OP, 1));
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS record_chunk_change ON knowledge_chunks;
+CREATE TRIGGER record_chunk_change
+    AFTER INSERT OR UPDATE OR DELETE ON knowledge_chunks
+    FOR EACH ROW
+    EXECUTE FUNCTION record_chunk_change();
+
@@ -0,0 +1,5 @@
+-- pg_prewarm lets the orchestrator load the HNSW index into shared buffers
+-- at startup (DB_PREWARM_ENABLED) instead of faulting it in under traffic.
+-- Safe to re-run against an existing database.
+
+CREATE EXTENSION IF NOT EXISTS pg_prewarm;
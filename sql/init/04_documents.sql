@@ -0,0 +1,77 @@
+-- Move per-document metadata out of knowledge_chunks into a documents table
+-- that chunks reference by id, so every chunk row no longer carries its own
+-- copy of source_info. Existing chunks are grouped by the document id in
+-- their chunk_metadata or, for older rows, by identical source_info.
+-- Safe to re-run against an existing database.
+
+-- Chunk positions are stored alongside each chunk so neighbouring chunks can be merged
+ALTER TABLE knowledge_chunks ADD COLUMN IF NOT EXISTS chunk_metadata JSONB NOT NULL DEFAULT '{}';
+
+CREATE TABLE IF NOT EXISTS documents (
+    id UUID PRIMARY KEY,
+    source_info JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE knowledge_chunks ADD COLUMN IF NOT EXISTS document_id UUID REFERENCES documents (id) ON DELETE CASCADE;
+
+CREATE INDEX IF NOT EXISTS knowledge_chunks_document_idx
+ON knowledge_chunks (document_id);
+
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'knowledge_chunks' AND column_name = 'source_info'
+    ) THEN
+        CREATE TEMP TABLE chunk_documents ON COMMIT DROP AS
+        SELECT
+            id AS chunk_id,
+            CASE
+                WHEN chunk_metadata->>'document_id' ~* '^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$'
+                    THEN (chunk_metadata->>'document_id')::uuid
+                ELSE md5(source_info::text)::uuid
+            END AS document_id,
+            source_info
+        FROM knowledge_chunks
+        WHERE document_id IS NULL;
+
+        INSERT INTO documents (id, source_info)
+        SELECT DISTINCT ON (document_id) document_id, source_info
+        FROM chunk_documents
+        ORDER BY document_id, chunk_id
+        ON CONFLICT (id) DO NOTHING;
+
+        UPDATE knowledge_chunks kc
+        SET document_id = cd.document_id
+        FROM chunk_documents cd
+        WHERE kc.id = cd.chunk_id;
+
+        -- The view reads source_info, so it is rebuilt on top of documents below
+        DROP VIEW IF EXISTS knowledge_chunks_view;
+        ALTER TABLE knowledge_chunks DROP COLUMN source_info;
+    END IF;
+END $$;
+
+ALTER TABLE knowledge_chunks ALTER COLUMN document_id SET NOT NULL;
+
+CREATE OR REPLACE VIEW knowledge_chunks_view AS
+SELECT
+    kc.id,
+    kc.chunk_text,
+    kc.embedding,
+    kc.document_id,
+    d.source_info,
+    kc.domain,
+    kc.created_at,
+    kc.updated_at,
+    d.source_info->>'title' as title,
+    d.source_info->>'author' as author,
+    (d.source_info->>'publication_date')::date as publication_date
+FROM
+    knowledge_chunks kc
+    JOIN documents d ON d.id = kc.document_id;
+
+-- Dropping source_info does not shrink existing rows; once, after upgrading,
+-- run VACUUM FULL knowledge_chunks; (takes an exclusive lock) to reclaim it.
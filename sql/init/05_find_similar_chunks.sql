@@ -0,0 +1,55 @@
+-- Canonical definition of find_similar_chunks, the only retrieval function.
+-- Earlier installs created several overloads with different signatures and
+-- column orders; they are all dropped here. Written in plain SQL so the
+-- planner inlines it and can use the HNSW index on knowledge_chunks.
+-- Chunks of documents queued for deletion are skipped until the ingestion
+-- service's maintenance job removes them.
+-- Safe to re-run against an existing database.
+
+-- Also added by 06_document_retention.sql, which runs after this file
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE;
+
+-- The return type changes over time, so every earlier signature is dropped first
+DROP FUNCTION IF EXISTS find_similar_chunks(TEXT, vector, TEXT, NUMERIC, INTEGER);
+DROP FUNCTION IF EXISTS find_similar_chunks(TEXT, vector, TEXT, FLOAT, INTEGER);
+DROP FUNCTION IF EXISTS find_similar_chunks(TEXT, vector, TEXT, NUMERIC, INTEGER, BOOLEAN);
+DROP FUNCTION IF EXISTS find_similar_chunks(TEXT, vector, TEXT, FLOAT, INTEGER, BOOLEAN);
+
+CREATE FUNCTION find_similar_chunks(
+    query_text TEXT,
+    query_embedding vector(1536),
+    domain_filter TEXT DEFAULT NULL,
+    similarity_threshold FLOAT DEFAULT 0.7,
+    max_results INT DEFAULT 5,
+    include_embeddings BOOLEAN DEFAULT FALSE
+)
+RETURNS TABLE (
+    id INT,
+    chunk_text TEXT,
+    document_id UUID,  -- Metadata lives in documents, fetched once per document
+    similarity FLOAT,
+    chunk_metadata JSONB,
+    embedding vector(1536)
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        kc.id,
+        kc.chunk_text,
+        kc.document_id,
+        1 - (kc.embedding <=> query_embedding) AS similarity,
+        kc.chunk_metadata,
+        -- Embeddings are only shipped back when the caller reranks candidates
+        CASE WHEN include_embeddings THEN kc.embedding ELSE NULL END
+    FROM
+        knowledge_chunks kc
+        JOIN documents d ON d.id = kc.document_id
+    WHERE
+        (domain_filter IS NULL OR kc.domain = domain_filter)
+        AND d.deleted_at IS NULL
+        AND 1 - (kc.embedding <=> query_embedding) > similarity_threshold
+    ORDER BY
+        kc.embedding <=> query_embedding
+    LIMIT max_results;
+$$;
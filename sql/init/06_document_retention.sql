@@ -0,0 +1,18 @@
+-- Support for document deletion, TTL expiry and vector index maintenance.
+-- Deleting a document only marks it, which hides its chunks from retrieval;
+-- the ingestion service's maintenance job removes them in batches and
+-- rebuilds the HNSW index when it bloats.
+-- Safe to re-run against an existing database.
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE;
+
+CREATE INDEX IF NOT EXISTS documents_pending_delete_idx
+ON documents (deleted_at)
+WHERE deleted_at IS NOT NULL;
+
+-- Index size per live row right after the last rebuild, the baseline for bloat checks
+CREATE TABLE IF NOT EXISTS index_maintenance (
+    index_name TEXT PRIMARY KEY,
+    bytes_per_row FLOAT NOT NULL,
+    reindexed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
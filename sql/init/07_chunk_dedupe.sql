@@ -0,0 +1,22 @@
+-- MinHash signatures and LSH band buckets for ingest-time near-duplicate
+-- detection. Buckets are scoped per domain; rows follow their chunk on delete.
+-- Safe to re-run against an existing database.
+
+CREATE TABLE IF NOT EXISTS chunk_signatures (
+    chunk_id INT PRIMARY KEY REFERENCES knowledge_chunks (id) ON DELETE CASCADE,
+    signature BYTEA NOT NULL  -- uint32 MinHash values
+);
+
+CREATE TABLE IF NOT EXISTS chunk_lsh_buckets (
+    domain TEXT NOT NULL,
+    band SMALLINT NOT NULL,
+    bucket BIGINT NOT NULL,  -- Hash of the band's MinHash values
+    chunk_id INT NOT NULL REFERENCES knowledge_chunks (id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS chunk_lsh_buckets_lookup_idx
+ON chunk_lsh_buckets (domain, band, bucket);
+
+-- Cascading deletes from knowledge_chunks look rows up by chunk
+CREATE INDEX IF NOT EXISTS chunk_lsh_buckets_chunk_idx
+ON chunk_lsh_buckets (chunk_id);
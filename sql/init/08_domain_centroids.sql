@@ -0,0 +1,18 @@
+-- Running sum of chunk embeddings per domain. The orchestrator normalises
+-- the sums into centroids to route unscoped queries to their likely domains.
+-- Ingestion adds each job's embeddings; the maintenance job recomputes the
+-- sums after deletes. Safe to re-run against an existing database.
+
+CREATE TABLE IF NOT EXISTS domain_centroids (
+    domain TEXT PRIMARY KEY,
+    embedding_sum vector(1536) NOT NULL,
+    chunk_count BIGINT NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+INSERT INTO domain_centroids (domain, embedding_sum, chunk_count)
+SELECT domain, SUM(embedding), COUNT(*)
+FROM knowledge_chunks
+GROUP BY domain
+ON CONFLICT (domain) DO UPDATE
+SET embedding_sum = EXCLUDED.embedding_sum, chunk_count = EXCLUDED.chunk_count, updated_at = NOW();
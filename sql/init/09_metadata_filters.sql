@@ -0,0 +1,43 @@
+-- Indexed document metadata for filtered retrieval. The fields queries can
+-- filter on are copied out of documents.source_info into generated columns,
+-- so the orchestrator can push date, author and classification filters down
+-- to SQL instead of reading every chunk's JSONB.
+-- Safe to re-run against an existing database.
+
+-- Generated columns need an immutable expression, which ::date is not
+CREATE OR REPLACE FUNCTION iso_date(value TEXT)
+RETURNS DATE
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+BEGIN
+    IF value ~ '^\d{4}-\d{2}-\d{2}' THEN
+        RETURN make_date(substr(value, 1, 4)::int, substr(value, 6, 2)::int, substr(value, 9, 2)::int);
+    END IF;
+    RETURN NULL;
+EXCEPTION WHEN others THEN
+    -- Not a real date, e.g. 2023-02-30
+    RETURN NULL;
+END;
+$$;
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS author TEXT
+GENERATED ALWAYS AS (source_info->>'author') STORED;
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS classification TEXT
+GENERATED ALWAYS AS (source_info->>'classification') STORED;
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS publication_date DATE
+GENERATED ALWAYS AS (iso_date(source_info->>'publication_date')) STORED;
+
+-- Authors and classifications are matched case-insensitively
+CREATE INDEX IF NOT EXISTS documents_author_idx
+ON documents (lower(author));
+
+CREATE INDEX IF NOT EXISTS documents_classification_idx
+ON documents (lower(classification));
+
+CREATE INDEX IF NOT EXISTS documents_publication_date_idx
+ON documents (publication_date);
+
+ANALYZE documents;
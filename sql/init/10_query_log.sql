@@ -0,0 +1,46 @@
+-- Query log and precomputed answers for the most frequent questions.
+-- The orchestrator appends one row per /v1/query request in batches; a
+-- periodic job mines the log for each domain's most asked questions and
+-- keeps their answers in precomputed_answers, recomputing them when the
+-- chunks they were built from change.
+-- Safe to re-run against an existing database.
+
+CREATE TABLE IF NOT EXISTS query_log (
+    id BIGSERIAL PRIMARY KEY,
+    logged_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    query TEXT NOT NULL,
+    query_key TEXT NOT NULL,           -- Normalized query text
+    domain TEXT NOT NULL DEFAULT '',   -- '' for unscoped queries
+    filtered BOOLEAN NOT NULL DEFAULT FALSE,
+    served_from TEXT NOT NULL,         -- pipeline, coalesced or precomputed
+    status INT NOT NULL,
+    chunk_ids INT[] NOT NULL DEFAULT '{}',
+    timings JSONB NOT NULL DEFAULT '{}',
+    prompt_tokens INT NOT NULL DEFAULT 0,
+    completion_tokens INT NOT NULL DEFAULT 0,
+    latency_ms FLOAT
+);
+
+-- The log is append-only, so a BRIN index keeps time-window scans cheap
+CREATE INDEX IF NOT EXISTS query_log_logged_at_idx
+ON query_log USING brin (logged_at);
+
+CREATE TABLE IF NOT EXISTS precomputed_answers (
+    domain TEXT NOT NULL,              -- '' for unscoped queries
+    query_key TEXT NOT NULL,
+    query TEXT NOT NULL,
+    embedding vector(1536) NOT NULL,
+    response JSONB NOT NULL,           -- QueryResponse without per-request fields
+    chunk_ids INT[] NOT NULL DEFAULT '{}',
+    profile TEXT NOT NULL,             -- Settings and prompt version it was computed with
+    change_xid xid8 NOT NULL DEFAULT '0',  -- Changes committed before this xid were checked against it
+    stale BOOLEAN NOT NULL DEFAULT FALSE,
+    request_count BIGINT NOT NULL DEFAULT 0,
+    computed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (domain, query_key)
+);
+
+-- Answers from before staleness was tracked incrementally start over as stale
+ALTER TABLE precomputed_answers ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT '0';
+ALTER TABLE precomputed_answers ADD COLUMN IF NOT EXISTS stale BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE precomputed_answers DROP COLUMN IF EXISTS change_seq;
@@ -0,0 +1,14 @@
+-- Generated answers shared by every orchestrator worker. Rows are keyed by a
+-- digest of the answer's cache key (query, model, prompt version, domain and
+-- packed context); maintenance deletes them once expired and keeps at most
+-- ANSWER_CACHE_MAX_ROWS of them.
+-- Safe to re-run against an existing database.
+
+CREATE TABLE IF NOT EXISTS answer_cache (
+    key_digest TEXT PRIMARY KEY,
+    answer TEXT NOT NULL,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS answer_cache_expires_at_idx
+ON answer_cache (expires_at);
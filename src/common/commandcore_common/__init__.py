@@ -0,0 +1 @@
+# Code shared by the CommandCore services, mounted into each one as a top-level package
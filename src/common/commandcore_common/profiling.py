@@ -0,0 +1,254 @@
+"""
+Request and job profiling shared by the CommandCore services.
+
+A trace is captured in one of two ways. Asked for explicitly (the X-Profile
+header), the block runs under a stack sampler: a daemon thread records the
+coroutine chain of the traced task and of the tasks it started. Otherwise,
+a block slower than the service's slow threshold keeps only its stage
+timings, which costs a timer instead of a sampler per request.
+"""
+import asyncio
+import contextvars
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+
+def _frame_label(frame) -> str:
+    module = frame.f_globals.get("__name__", "?")
+    # ';' separates frames in collapsed stacks
+    return f"{module}:{frame.f_code.co_name}".replace(";", ":")
+
+
+def _coroutine_chain(task: asyncio.Task, thread_frame) -> Tuple[List[str], bool]:
+    """
+    Root-first frames of a task's chain of awaiting coroutines, followed by
+    the synchronous frames below it when it is the one running on the event
+    loop thread. Also returns whether the task is suspended on a future.
+    """
+    labels: List[str] = []
+    innermost = None
+    running = False
+    awaitable: Any = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            break
+        labels.append(_frame_label(frame))
+        innermost = frame
+        running = running or bool(getattr(awaitable, "cr_running", False) or getattr(awaitable, "gi_running", False))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+
+    if running and thread_frame is not None and innermost is not None:
+        below = []
+        frame = thread_frame
+        while frame is not None and frame is not innermost:
+            below.append(_frame_label(frame))
+            frame = frame.f_back
+        if frame is innermost:
+            labels.extend(reversed(below))
+    return labels, not running and awaitable is not None
+
+
+class Trace:
+    """Stack samples (when sampled) and stage timings of one request or job."""
+
+    def __init__(
+        self,
+        name: str,
+        labels: Dict[str, Any],
+        forced: bool,
+        trace_id: Optional[str] = None,
+        sample_interval_ms: Optional[float] = None
+    ):
+        self.id = trace_id or uuid.uuid4().hex[:12]
+        self.name = name
+        self.labels = labels
+        self.forced = forced
+        self.sample_interval_ms = sample_interval_ms
+        self.task = asyncio.current_task()
+        self.thread_id = threading.get_ident()
+        self.started_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.duration_ms = 0.0
+        self.timings: Dict[str, float] = {}
+        self.samples: Counter = Counter()
+        # Tasks started inside the trace (gather, wait_for, ...) by their parent task
+        self.children: Dict[int, List[asyncio.Task]] = {}
+
+    def _stacks(self, task: asyncio.Task, thread_frame, prefix: Tuple[str, ...]) -> List[Tuple[str, ...]]:
+        labels, waiting = _coroutine_chain(task, thread_frame)
+        stack = prefix + tuple(labels)
+        if not waiting:
+            return [stack]
+        # A suspended task is waiting on its live child tasks, if it has any
+        stacks = []
+        for child in list(self.children.get(id(task), ())):
+            if not child.done():
+                stacks.extend(self._stacks(child, thread_frame, stack))
+        return stacks or [stack + ("[waiting on I/O or a thread]",)]
+
+    def sample(self, frames: Dict[int, Any]):
+        if self.task is not None and not self.task.done():
+            for stack in self._stacks(self.task, frames.get(self.thread_id), ()):
+                self.samples[stack] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "labels": self.labels,
+            "reason": "requested" if self.forced else "slow",
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration_ms, 1),
+            "samples": sum(self.samples.values()),
+            "sample_interval_ms": self.sample_interval_ms,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self.summary(), "timings": self.timings, "collapsed": self.collapsed()}
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed stack format, readable by flamegraph.pl and speedscope."""
+        return "\n".join(
+            f"{';'.join(stack) or '[idle]'} {count}"
+            for stack, count in sorted(self.samples.items(), key=lambda item: item[1], reverse=True)
+        )
+
+
+class _Sampler:
+    """One daemon thread sampling every active trace each `interval_ms`."""
+
+    def __init__(self, interval_ms: float):
+        self.interval_ms = interval_ms
+        self._active: Dict[str, Trace] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, trace: Trace):
+        with self._condition:
+            self._active[trace.id] = trace
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def remove(self, trace: Trace):
+        with self._condition:
+            self._active.pop(trace.id, None)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._active:
+                    self._condition.wait()
+                traces = list(self._active.values())
+            frames = sys._current_frames()
+            for trace in traces:
+                try:
+                    trace.sample(frames)
+                except Exception:
+                    # Frames change under us while the loop runs; skip this sample
+                    pass
+            del frames
+            time.sleep(self.interval_ms / 1000)
+
+
+class TraceBuffer:
+    """The most recent captured traces, oldest dropped first."""
+
+    def __init__(self, size: int):
+        self._traces: Deque[Trace] = deque(maxlen=size)
+
+    def add(self, trace: Trace):
+        self._traces.append(trace)
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        return next((trace for trace in self._traces if trace.id == trace_id), None)
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        return [trace.summary() for trace in reversed(self._traces)]
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+
+
+def _task_factory(loop, coro, **kwargs):
+    """Create tasks as usual, recording ones started inside a trace under their parent."""
+    task = asyncio.Task(coro, loop=loop, **kwargs)
+    trace = _current_trace.get()
+    parent = asyncio.current_task(loop)
+    if trace is not None and parent is not None:
+        trace.children.setdefault(id(parent), []).append(task)
+    return task
+
+
+def profiling_requested(value: Optional[str]) -> bool:
+    """Interpret an X-Profile header."""
+    return (value or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+class Profiler:
+    """
+    A service's profiler: the sampler, its captured traces and the settings
+    they are taken with. Stack sampling only runs for blocks entered with
+    force=True; with `slow_threshold_ms` above 0 other blocks are timed and
+    kept, with their stage timings only, when they take at least that long.
+    """
+
+    def __init__(self, slow_threshold_ms: float, sample_interval_ms: float, trace_buffer: int):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.traces = TraceBuffer(trace_buffer)
+        self._sampler = _Sampler(sample_interval_ms)
+
+    @classmethod
+    def from_settings(cls, settings) -> "Profiler":
+        """Configure a profiler from a service's PROFILE_* settings."""
+        return cls(
+            slow_threshold_ms=settings.PROFILE_SLOW_THRESHOLD_MS,
+            sample_interval_ms=settings.PROFILE_SAMPLE_INTERVAL_MS,
+            trace_buffer=settings.PROFILE_TRACE_BUFFER
+        )
+
+    @contextmanager
+    def profiled(
+        self,
+        name: str,
+        timings: Optional[Dict[str, float]] = None,
+        force: bool = False,
+        trace_id: Optional[str] = None,
+        **labels: Any
+    ) -> Iterator[Optional[Trace]]:
+        """
+        Trace the block: sampled when profiling was requested (`force`),
+        otherwise timed and kept if slow. `timings` are stored with a kept
+        trace as its spans.
+        """
+        if not force and self.slow_threshold_ms <= 0:
+            yield None
+            return
+        trace = Trace(name, labels, force, trace_id, self._sampler.interval_ms if force else None)
+        token = None
+        if force:
+            loop = asyncio.get_running_loop()
+            if loop.get_task_factory() is None:
+                loop.set_task_factory(_task_factory)
+            token = _current_trace.set(trace)
+            self._sampler.add(trace)
+        try:
+            yield trace
+        finally:
+            if force:
+                self._sampler.remove(trace)
+                _current_trace.reset(token)
+            trace.children = {}
+            trace.duration_ms = (time.perf_counter() - trace.started) * 1000
+            if force or trace.duration_ms >= self.slow_threshold_ms:
+                trace.task = None
+                trace.timings = dict(timings or {})
+                self.traces.add(trace)
@@ -0,0 +1,258 @@
+"""
+Deadlines, hedging, retries and circuit breaking for the OpenAI calls of the
+CommandCore services. Each service configures an OpenAICaller from its own
+settings; the request budget is shared by every call made inside it.
+"""
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+import openai
+
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying or hedging; anything else (bad request, auth) is final
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("openai_deadline", default=None)
+
+
+class UpstreamUnavailable(Exception):
+    """An OpenAI call failed, timed out or was refused by an open circuit."""
+
+
+@contextmanager
+def request_budget(seconds: float):
+    """Give every OpenAI call made inside the block a share of one deadline."""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def _remaining_budget() -> Optional[float]:
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+class LatencyTracker:
+    """Recent successful call latencies per (operation, model)."""
+
+    def __init__(self, min_samples: int, window: int = 200):
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+        self._window = window
+        self.min_samples = min_samples
+
+    def record(self, operation: str, model: str, seconds: float):
+        self._samples.setdefault((operation, model), deque(maxlen=self._window)).append(seconds)
+
+    def percentile(self, operation: str, model: str, q: float) -> Optional[float]:
+        samples = self._samples.get((operation, model))
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """
+    Per (operation, model) breaker over a sliding window of the last `window`
+    call outcomes. Opens when at least `min_calls` were made and the error
+    rate crosses `error_rate`, and lets a single trial call through after
+    `cooldown` seconds.
+    """
+
+    def __init__(self, window: int, min_calls: int, error_rate: float, cooldown: float):
+        self._outcomes: Dict[Tuple[str, str], Deque[bool]] = {}
+        self._open_until: Dict[Tuple[str, str], float] = {}
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+
+    def allow(self, operation: str, model: str) -> bool:
+        open_until = self._open_until.get((operation, model))
+        if open_until is None:
+            return True
+        if time.monotonic() >= open_until:
+            # Half-open: allow one trial and keep the rest waiting on it
+            self._open_until[(operation, model)] = time.monotonic() + self.cooldown
+            return True
+        return False
+
+    def record(self, operation: str, model: str, success: bool):
+        key = (operation, model)
+        outcomes = self._outcomes.setdefault(key, deque(maxlen=self.window))
+        outcomes.append(success)
+        if success and key in self._open_until:
+            del self._open_until[key]
+            outcomes.clear()
+            return
+        failures = outcomes.count(False)
+        if len(outcomes) >= self.min_calls and failures / len(outcomes) >= self.error_rate:
+            if key not in self._open_until:
+                logger.warning("Circuit opened for OpenAI %s calls to %s", operation, model)
+            self._open_until[key] = time.monotonic() + self.cooldown
+
+    def state(self) -> Dict[str, str]:
+        now = time.monotonic()
+        return {
+            f"{operation}:{model}": "open" if until > now else "half_open"
+            for (operation, model), until in self._open_until.items()
+        }
+
+
+class OpenAICaller:
+    """
+    Makes OpenAI calls with deadlines, hedging, retries and circuit
+    breaking. Operations listed in `hedge_operations` get a duplicate
+    request once they run past their p95 latency; retryable failures are
+    retried up to `max_retries` times, backing off from `retry_backoff`
+    seconds.
+    """
+
+    def __init__(
+        self,
+        hedge_operations: str,
+        hedge_min_samples: int,
+        max_retries: int,
+        retry_backoff: float,
+        breaker_window: int,
+        breaker_min_calls: int,
+        breaker_error_rate: float,
+        breaker_cooldown: float
+    ):
+        self.hedge_operations = set(hedge_operations.split(","))
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.latencies = LatencyTracker(hedge_min_samples)
+        self.breaker = CircuitBreaker(breaker_window, breaker_min_calls, breaker_error_rate, breaker_cooldown)
+
+    @classmethod
+    def from_settings(cls, settings) -> "OpenAICaller":
+        """Configure a caller from a service's OPENAI_* settings."""
+        return cls(
+            hedge_operations=settings.OPENAI_HEDGE_OPERATIONS,
+            hedge_min_samples=settings.OPENAI_HEDGE_MIN_SAMPLES,
+            max_retries=settings.OPENAI_MAX_RETRIES,
+            retry_backoff=settings.OPENAI_RETRY_BACKOFF,
+            breaker_window=settings.OPENAI_BREAKER_WINDOW,
+            breaker_min_calls=settings.OPENAI_BREAKER_MIN_CALLS,
+            breaker_error_rate=settings.OPENAI_BREAKER_ERROR_RATE,
+            breaker_cooldown=settings.OPENAI_BREAKER_COOLDOWN
+        )
+
+    async def _timed(self, operation: str, model: str, call: Callable[[str, float], Awaitable[Any]], timeout: float) -> Any:
+        started = time.monotonic()
+        result = await asyncio.wait_for(call(model, timeout), timeout)
+        self.latencies.record(operation, model, time.monotonic() - started)
+        return result
+
+    async def _hedged_attempt(self, operation: str, model: str, call: Callable[[str, float], Awaitable[Any]], timeout: float) -> Any:
+        """
+        Run one attempt; if it is still running after the p95 latency, send a
+        duplicate request and take whichever finishes first. Requests still
+        running when the attempt ends, cancelled callers included, are
+        cancelled.
+        """
+        delay = None
+        if operation in self.hedge_operations:
+            delay = self.latencies.percentile(operation, model, 0.95)
+        first = asyncio.ensure_future(self._timed(operation, model, call, timeout))
+        tasks = [first]
+        try:
+            if delay is None or delay >= timeout:
+                return await first
+
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done:
+                return first.result()
+
+            second = asyncio.ensure_future(self._timed(operation, model, call, timeout - delay))
+            tasks.append(second)
+            pending = {first, second}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _call_model(self, operation: str, model: str, call: Callable[[str, float], Awaitable[Any]], call_timeout: float) -> Any:
+        """Retry one model with backoff, within the per-call timeout and request budget."""
+        last_error: Optional[BaseException] = None
+        for attempt in range(self.max_retries + 1):
+            timeout = call_timeout
+            remaining = _remaining_budget()
+            if remaining is not None:
+                timeout = min(timeout, remaining)
+            if timeout <= 0:
+                break
+            if not self.breaker.allow(operation, model):
+                raise UpstreamUnavailable(f"Circuit open for {operation} calls to {model}")
+            try:
+                result = await self._hedged_attempt(operation, model, call, timeout)
+                self.breaker.record(operation, model, True)
+                return result
+            except RETRYABLE_ERRORS as e:
+                self.breaker.record(operation, model, False)
+                last_error = e
+                if attempt == self.max_retries:
+                    break
+                backoff = self.retry_backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                remaining = _remaining_budget()
+                if remaining is not None and backoff >= remaining:
+                    break
+                await asyncio.sleep(backoff)
+        reason = (str(last_error) or type(last_error).__name__) if last_error else "request budget exhausted"
+        raise UpstreamUnavailable(f"OpenAI {operation} call to {model} failed: {reason}")
+
+    async def call(
+        self,
+        operation: str,
+        model: str,
+        call: Callable[[str, float], Awaitable[Any]],
+        timeout: float,
+        fallback_model: Optional[str] = None
+    ) -> Any:
+        """
+        Make an OpenAI call with deadlines, hedging, retries and circuit breaking.
+
+        `call(model, timeout)` performs the request; each attempt gets at most
+        `timeout` seconds and never more than what is left of the request
+        budget. When the primary model's circuit is open or its attempts fail,
+        `fallback_model` is tried instead. Raises UpstreamUnavailable when no
+        model produced a result.
+        """
+        try:
+            return await self._call_model(operation, model, call, timeout)
+        except UpstreamUnavailable as e:
+            if not fallback_model or fallback_model == model:
+                raise
+            logger.warning("%s; falling back to %s", e, fallback_model)
+            return await self._call_model(operation, fallback_model, call, timeout)
+
+
+def openai_client(settings) -> openai.AsyncOpenAI:
+    """A service's shared OpenAI client. Retries are left to OpenAICaller, so the SDK adds none."""
+    return openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
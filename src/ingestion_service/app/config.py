@@ -1,4 +1,5 @@
 import os
+from typing import Dict
 from pydantic import BaseSettings
 
 
@@ -9,19 +10,74 @@ class Settings(BaseSettings):
     POSTGRES_USER: str = os.getenv("POSTGRES_USER", "postgres")
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "postgrespassword")
     POSTGRES_DB: str = os.getenv("POSTGRES_DB", "commandcore")
+    WARMUP_RETRY_SECONDS: float = 2.0  # Delay between attempts to reach the database at startup
     
     # OpenAI settings
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
+    OPENAI_EMBEDDING_MODEL: str = "text-embedding-ada-002"
+    
+    # Upstream resilience settings
+    OPENAI_EMBEDDING_TIMEOUT: float = 10.0   # Per-attempt timeout for embeddings
+    OPENAI_MAX_RETRIES: int = 4              # Ingestion can afford to wait longer than queries
+    OPENAI_RETRY_BACKOFF: float = 0.5        # Seconds, doubled per retry
+    OPENAI_HEDGE_OPERATIONS: str = "embedding"  # Calls that get a hedged duplicate after their p95
+    OPENAI_HEDGE_MIN_SAMPLES: int = 20       # Latency samples needed before hedging starts
+    OPENAI_BREAKER_WINDOW: int = 20          # Recent calls considered by the circuit breaker
+    OPENAI_BREAKER_MIN_CALLS: int = 10
+    OPENAI_BREAKER_ERROR_RATE: float = 0.5
+    OPENAI_BREAKER_COOLDOWN: float = 30.0    # Seconds an open circuit fails fast
+    
+    # Logging settings
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")  # "json" or "text"
     
     # Application settings
     UPLOAD_DIR: str = "/app/data/uploads"
     MAX_CHUNK_SIZE: int = 1000  # Maximum characters per chunk
     CHUNK_OVERLAP: int = 200    # Character overlap between chunks
     
+    # PDF extraction
+    PDF_EXTRACTION_WORKERS: int = 0     # Worker processes for page extraction; 0 means one per CPU
+    PDF_PARALLEL_MIN_PAGES: int = 40    # Smaller PDFs are extracted in-process
+    PDF_PAGES_PER_TASK: int = 20        # Pages handed to a worker at a time
+    
+    # Extraction cache
+    EXTRACTION_CACHE_ENABLED: bool = True
+    EXTRACTION_CACHE_DIR: str = "/app/data/extraction_cache"
+    EXTRACTION_CACHE_MAX_BYTES: int = 2 * 1024 ** 3  # Least recently used entries are evicted past this
+    
     # Token-based chunking settings
     MAX_TOKENS_PER_CHUNK: int = 512  # Maximum tokens per chunk
     OVERLAP_TOKENS: int = 50        # Token overlap between chunks
     
+    # Near-duplicate chunk detection (MinHash/LSH, checked before embedding)
+    DEDUP_MODE: str = "link"         # "skip" drops duplicates, "link" stores them reusing the original's embedding, "off"
+    DEDUP_THRESHOLD: float = 0.85    # Estimated Jaccard similarity of word shingles
+    DEDUP_NUM_PERM: int = 128        # MinHash values per signature
+    DEDUP_BANDS: int = 16            # LSH bands; 16 x 8 rows finds pairs above ~0.7 reliably
+    DEDUP_SHINGLE_SIZE: int = 5      # Words per shingle
+    
+    # Retention and index maintenance
+    RETENTION_POLICIES: Dict[str, int] = {}  # Days to keep documents, keyed "domain:<id>" or "classification:<name>" (JSON in env)
+    MAINTENANCE_INTERVAL: float = 300.0      # Seconds between maintenance runs
+    MAINTENANCE_DELETE_BATCH: int = 1000     # Chunks deleted per transaction
+    MAINTENANCE_BATCH_PAUSE: float = 0.1     # Seconds between delete batches to spread WAL and vacuum load
+    MAINTENANCE_MIN_ROWS: int = 1000         # Skip vacuum/reindex decisions on tables smaller than this
+    MAINTENANCE_DEAD_TUPLE_RATIO: float = 0.2   # VACUUM knowledge_chunks above this share of dead rows
+    MAINTENANCE_INDEX_BLOAT_RATIO: float = 0.3  # REINDEX CONCURRENTLY once index bytes per row grew this much
+    MAINTENANCE_WORK_MEM: str = "512MB"      # Used while rebuilding the HNSW index
+    ANSWER_CACHE_MAX_ROWS: int = 100000      # Orchestrator answer_cache rows kept; the soonest to expire go first
+    CHANGE_LOG_RETENTION_HOURS: float = 24.0  # knowledge_chunk_changes kept for orchestrator replicas; ones further behind rebuild
+    
+    # Snapshot import (python -m app.snapshot)
+    SNAPSHOT_INDEX_BUILD_WORKERS: int = 4    # max_parallel_maintenance_workers for the HNSW rebuild
+    SNAPSHOT_MAINTENANCE_WORK_MEM: str = "2GB"  # Keep the HNSW graph build in memory
+    
+    # Sampling profiler for slow or explicitly profiled (X-Profile: 1) ingestion jobs
+    PROFILE_SLOW_THRESHOLD_MS: float = 120000.0  # Jobs slower than this keep their stage timings as a trace; 0 disables. Stacks are only sampled with X-Profile
+    PROFILE_SAMPLE_INTERVAL_MS: float = 10.0     # Stack sampling period
+    PROFILE_TRACE_BUFFER: int = 50               # Traces kept for /v1/system/traces
+    
     # Rate limiting (for future implementation)
     RATE_LIMIT_UPLOADS: int = 10  # uploads per minute
     RATE_LIMIT_QUERIES: int = 100  # queries per minute
@@ -1,14 +1,25 @@
 import psycopg2
 from psycopg2.extras import Json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import json
+import time
+import uuid
 import numpy as np
-import openai
 from .config import settings
 from .schemas import DocumentChunk
+from .resilience import client, call_openai
+from .metrics import STAGE_LATENCY, EMBEDDING_LATENCY, EMBEDDED_TOKENS, CHUNKS_STORED, DEDUP_CHUNKS
+from .dedupe import DuplicateIndex, minhash_signature
+
+
+EMBEDDING_DIMENSIONS = 1536
 
 
 def get_db_connection():
-    """Create a connection to the PostgreSQL database."""
+    """
+    Create a connection to the PostgreSQL database.
+    Ingestion only writes, so this always targets the primary (POSTGRES_HOST).
+    """
     conn = psycopg2.connect(
         host=settings.POSTGRES_HOST,
         port=settings.POSTGRES_PORT,
@@ -19,51 +30,161 @@ def get_db_connection():
     return conn
 
 
-async def generate_embedding(text: str) -> List[float]:
-    """Generate embeddings for text using OpenAI API."""
+def get_commit_lsn(conn) -> str:
+    """
+    Return the primary's current WAL position. Taken after a job commits, it
+    lets query callers ask for a replica that has already replayed the job.
+    """
+    cursor = conn.cursor()
     try:
-        client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-        response = await client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=text
-        )
-        return response.data[0].embedding
-    except Exception as e:
-        print(f"Error generating embedding: {str(e)}")
-        # Return a zero vector as fallback
-        return [0.0] * 1536
+        cursor.execute("SELECT pg_current_wal_lsn()::text")
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
 
+async def generate_embedding(text: str) -> List[float]:
+    """
+    Generate embeddings for text using OpenAI API.
+    Raises UpstreamUnavailable so a failed job is retried rather than storing zero vectors.
+    """
+    async def call(model: str, timeout: float):
+        return await client.embeddings.create(model=model, input=text, timeout=timeout)
+    
+    response = await call_openai(
+        "embedding",
+        settings.OPENAI_EMBEDDING_MODEL,
+        call,
+        timeout=settings.OPENAI_EMBEDDING_TIMEOUT
+    )
+    return response.data[0].embedding
 
-async def store_chunks_in_db(conn, chunks: List[DocumentChunk], domain: str, source_info: Dict[str, Any]) -> int:
-    """Store document chunks in the database."""
+
+async def store_chunks_in_db(
+    conn,
+    chunks: List[DocumentChunk],
+    domain: str,
+    source_info: Dict[str, Any],
+    document_id: Optional[str] = None,
+    dedupe_stats: Optional[Dict[str, int]] = None
+) -> int:
+    """
+    Store document chunks in the database. The document's metadata is written
+    once to the documents table and every chunk references it by id.
+    
+    Unless DEDUP_MODE is "off", each chunk is first compared against the
+    domain's MinHash/LSH index; near-duplicates of an existing chunk are
+    skipped or stored with the original's embedding ("link"), and counted in
+    `dedupe_stats`. Returns the number of chunks stored.
+    """
     cursor = conn.cursor()
     stored_count = 0
+    embedding_seconds = 0.0
+    write_seconds = 0.0
+    document_id = document_id or str(uuid.uuid4())
+    dedupe_stats = dedupe_stats if dedupe_stats is not None else {}
+    duplicates = DuplicateIndex(cursor, domain) if settings.DEDUP_MODE != "off" else None
+    # Added to the domain's centroid sum for query routing in the orchestrator
+    embedding_sum = np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float64)
     
     try:
-        for chunk in chunks:
-            # Generate embedding using OpenAI API
-            embedding = await generate_embedding(chunk.text)
+        started = time.perf_counter()
+        cursor.execute(
+            """
+            INSERT INTO documents (id, source_info)
+            VALUES (%s, %s)
+            ON CONFLICT (id) DO UPDATE SET source_info = EXCLUDED.source_info, updated_at = NOW(), deleted_at = NULL
+            """,
+            (document_id, Json(source_info))
+        )
+        write_seconds += time.perf_counter() - started
+        
+        for chunk_index, chunk in enumerate(chunks):
+            # Token positions let the orchestrator merge overlapping chunks
+            chunk_metadata = dict(chunk.metadata)
+            chunk_metadata["chunk_index"] = chunk_index
+            
+            # Check for a near-duplicate before paying for an embedding
+            signature, duplicate = None, None
+            if duplicates is not None:
+                started = time.perf_counter()
+                signature = minhash_signature(chunk.text)
+                if signature is not None:
+                    duplicate = duplicates.find(signature)
+                    dedupe_stats["checked"] = dedupe_stats.get("checked", 0) + 1
+                write_seconds += time.perf_counter() - started
+            
+            if duplicate is not None:
+                original_id, similarity = duplicate
+                outcome = "linked" if settings.DEDUP_MODE == "link" else "skipped"
+                dedupe_stats[outcome] = dedupe_stats.get(outcome, 0) + 1
+                DEDUP_CHUNKS.labels(outcome=outcome).inc()
+                if outcome == "skipped":
+                    continue
+                embedding = duplicates.embedding_of(original_id)
+                embedding_sum += np.asarray(json.loads(embedding))
+                chunk_metadata["duplicate_of"] = original_id
+                chunk_metadata["duplicate_similarity"] = round(similarity, 3)
+            else:
+                if signature is not None:
+                    dedupe_stats["unique"] = dedupe_stats.get("unique", 0) + 1
+                    DEDUP_CHUNKS.labels(outcome="unique").inc()
+                # Generate embedding using OpenAI API
+                started = time.perf_counter()
+                embedding = await generate_embedding(chunk.text)
+                elapsed = time.perf_counter() - started
+                EMBEDDING_LATENCY.observe(elapsed)
+                EMBEDDED_TOKENS.inc(chunk.token_count or 0)
+                embedding_seconds += elapsed
+                embedding_sum += np.asarray(embedding)
+            started = time.perf_counter()
             
-            # Insert the chunk with source info
+            # Insert the chunk referencing its document
             cursor.execute(
                 """
                 INSERT INTO knowledge_chunks 
-                (chunk_text, embedding, source_info, domain)
+                (chunk_text, embedding, document_id, domain, chunk_metadata)
                 VALUES 
-                (%s, %s, %s, %s)
+                (%s, %s, %s, %s, %s)
                 RETURNING id
                 """,
                 (
                     chunk.text,
                     embedding,  # OpenAI embedding
-                    Json(source_info),
-                    domain
+                    document_id,
+                    domain,
+                    Json(chunk_metadata)
                 )
             )
+            chunk_id = cursor.fetchone()[0]
+            # Only originals are indexed, so every match points at first-seen text
+            if signature is not None and duplicate is None:
+                duplicates.add(chunk_id, signature)
+            write_seconds += time.perf_counter() - started
             stored_count += 1
         
+        if stored_count:
+            started = time.perf_counter()
+            cursor.execute(
+                """
+                INSERT INTO domain_centroids (domain, embedding_sum, chunk_count)
+                VALUES (%s, %s::vector, %s)
+                ON CONFLICT (domain) DO UPDATE
+                SET embedding_sum = domain_centroids.embedding_sum + EXCLUDED.embedding_sum,
+                    chunk_count = domain_centroids.chunk_count + EXCLUDED.chunk_count,
+                    updated_at = NOW()
+                """,
+                (domain, embedding_sum.tolist(), stored_count)
+            )
+            write_seconds += time.perf_counter() - started
+        
         # Commit the transaction
+        started = time.perf_counter()
         conn.commit()
+        write_seconds += time.perf_counter() - started
+        STAGE_LATENCY.labels(stage="embedding").observe(embedding_seconds)
+        STAGE_LATENCY.labels(stage="db_write").observe(write_seconds)
+        CHUNKS_STORED.inc(stored_count)
     
     except Exception as e:
         # Rollback in case of error
@@ -0,0 +1,122 @@
+import hashlib
+import re
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .config import settings
+
+
+# Mersenne prime 2**61 - 1 for the universal hash family
+_PRIME = (1 << 61) - 1
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+_rng = np.random.default_rng(20240601)
+# Fixed seeds: signatures stored in the database must stay comparable
+_A = _rng.integers(1, 1 << 31, size=settings.DEDUP_NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 31, size=settings.DEDUP_NUM_PERM, dtype=np.uint64)
+
+
+def _shingles(text: str) -> List[bytes]:
+    """Word n-grams of the lowercased text; dates and punctuation changes only touch a few."""
+    words = _TOKEN_PATTERN.findall(text.lower())
+    size = settings.DEDUP_SHINGLE_SIZE
+    if len(words) <= size:
+        return [" ".join(words).encode()] if words else []
+    return [" ".join(words[i:i + size]).encode() for i in range(len(words) - size + 1)]
+
+
+def minhash_signature(text: str) -> Optional[np.ndarray]:
+    """DEDUP_NUM_PERM MinHash values of the text's shingles, or None for empty text."""
+    shingles = _shingles(text)
+    if not shingles:
+        return None
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s, digest_size=4).digest(), "little") for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles)
+    )
+    # a < 2**31 and x < 2**32 keep a * x + b inside uint64
+    permuted = (np.outer(hashes, _A) + _B) % np.uint64(_PRIME) & _MAX_HASH
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def band_buckets(signature: np.ndarray) -> List[Tuple[int, int]]:
+    """(band, bucket) pairs; chunks sharing any pair are duplicate candidates."""
+    rows = len(signature) // settings.DEDUP_BANDS
+    buckets = []
+    for band in range(settings.DEDUP_BANDS):
+        digest = hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, "little", signed=True)))
+    return buckets
+
+
+def estimated_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return float(np.mean(a == b))
+
+
+class DuplicateIndex:
+    """
+    Per-domain LSH index over chunk MinHash signatures, stored in Postgres
+    (chunk_signatures, chunk_lsh_buckets) so every ingestion worker shares
+    it. Lookups run in the caller's transaction and therefore also see the
+    chunks stored earlier in the same job.
+    """
+
+    def __init__(self, cursor, domain: str):
+        self.cursor = cursor
+        self.domain = domain
+
+    def find(self, signature: np.ndarray) -> Optional[Tuple[int, float]]:
+        """
+        The most similar indexed chunk at or above DEDUP_THRESHOLD, with its
+        similarity. Chunks of documents queued for deletion are not
+        candidates: maintenance is about to remove them.
+        """
+        bands, buckets = zip(*band_buckets(signature))
+        self.cursor.execute(
+            """
+            SELECT DISTINCT s.chunk_id, s.signature
+            FROM chunk_lsh_buckets b
+            JOIN chunk_signatures s ON s.chunk_id = b.chunk_id
+            JOIN knowledge_chunks kc ON kc.id = b.chunk_id
+            JOIN documents d ON d.id = kc.document_id
+            WHERE b.domain = %s
+              AND d.deleted_at IS NULL
+              AND (b.band, b.bucket) IN (SELECT * FROM unnest(%s::smallint[], %s::bigint[]))
+            """,
+            (self.domain, list(bands), list(buckets))
+        )
+        best: Optional[Tuple[int, float]] = None
+        for chunk_id, stored in self.cursor.fetchall():
+            candidate = np.frombuffer(bytes(stored), dtype=np.uint32)
+            if len(candidate) != len(signature):
+                # Written with a different DEDUP_NUM_PERM
+                continue
+            similarity = estimated_similarity(signature, candidate)
+            if similarity >= settings.DEDUP_THRESHOLD and (best is None or similarity > best[1]):
+                best = (chunk_id, similarity)
+        return best
+
+    def add(self, chunk_id: int, signature: np.ndarray):
+        self.cursor.execute(
+            "INSERT INTO chunk_signatures (chunk_id, signature) VALUES (%s, %s) ON CONFLICT (chunk_id) DO NOTHING",
+            (chunk_id, signature.tobytes())
+        )
+        bands, buckets = zip(*band_buckets(signature))
+        self.cursor.execute(
+            """
+            INSERT INTO chunk_lsh_buckets (domain, band, bucket, chunk_id)
+            SELECT %s, band, bucket, %s FROM unnest(%s::smallint[], %s::bigint[]) AS t (band, bucket)
+            """,
+            (self.domain, chunk_id, list(bands), list(buckets))
+        )
+
+    def embedding_of(self, chunk_id: int) -> str:
+        """The stored embedding of a chunk, as pgvector text, for linked duplicates."""
+        self.cursor.execute("SELECT embedding::text FROM knowledge_chunks WHERE id = %s", (chunk_id,))
+        return self.cursor.fetchone()[0]
+
+
+def empty_stats() -> Dict[str, int]:
+    return {"checked": 0, "unique": 0, "skipped": 0, "linked": 0}
@@ -1,52 +1,126 @@
+import bisect
+import logging
+import multiprocessing
 import os
 import pdfplumber
 import docx2txt
-from typing import List, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
 import tiktoken
 import re
 from datetime import datetime
 from .config import settings
-from .schemas import DocumentChunk
+from .schemas import DocumentChunk, ExtractedText
 
 
-def extract_text_from_file(file_path: str) -> str:
-    """Extract text from various file formats."""
+logger = logging.getLogger(__name__)
+
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """Worker processes for PDF page extraction, started on first use."""
+    global _pdf_pool
+    if _pdf_pool is None:
+        workers = settings.PDF_EXTRACTION_WORKERS or os.cpu_count() or 1
+        # spawn, not fork: the service process runs threads and holds DB sockets
+        _pdf_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pdf_pool
+
+
+def shutdown_pdf_pool():
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(wait=False, cancel_futures=True)
+        _pdf_pool = None
+
+
+def _extract_pdf_pages(file_path: str, start: int, end: int) -> Tuple[List[str], List[int]]:
+    """
+    Extract pages [start, end) of a PDF. A page that fails is returned empty
+    and its 1-based number reported, so one bad page doesn't lose the rest.
+    Runs in a worker process for large documents.
+    """
+    texts, failed = [], []
+    with pdfplumber.open(file_path) as pdf:
+        for number in range(start, end):
+            page = pdf.pages[number]
+            try:
+                texts.append(page.extract_text() or "")
+            except Exception as e:
+                logger.warning("Error extracting text from PDF page %d: %s", number + 1, e)
+                texts.append("")
+                failed.append(number + 1)
+            finally:
+                # Parsed page objects are large; keep memory flat over long documents
+                page.close()
+    return texts, failed
+
+
+def _extract_pdf(file_path: str) -> ExtractedText:
+    """Extract a PDF page by page, fanning page ranges out to worker processes when it is large."""
+    with pdfplumber.open(file_path) as pdf:
+        page_count = len(pdf.pages)
+
+    if page_count < settings.PDF_PARALLEL_MIN_PAGES:
+        page_texts, failed_pages = _extract_pdf_pages(file_path, 0, page_count)
+    else:
+        step = settings.PDF_PAGES_PER_TASK
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        pool = _get_pdf_pool()
+        futures = [pool.submit(_extract_pdf_pages, file_path, start, end) for start, end in ranges]
+        page_texts, failed_pages = [], []
+        # Collected in submission order, so pages are reassembled in document order
+        for (start, end), future in zip(ranges, futures):
+            try:
+                texts, failed = future.result()
+            except Exception as e:
+                logger.warning("Error extracting PDF pages %d-%d: %s", start + 1, end, e)
+                texts, failed = [""] * (end - start), list(range(start + 1, end + 1))
+            page_texts.extend(texts)
+            failed_pages.extend(failed)
+
+    if page_count and len(failed_pages) == page_count:
+        raise ValueError("No page of the PDF could be extracted")
+    if failed_pages:
+        logger.warning("Skipped %d of %d PDF pages that failed to extract", len(failed_pages), page_count)
+
+    text, page_offsets = "", []
+    for page_text in page_texts:
+        page_offsets.append(len(text))
+        text += page_text + "\n\n"  # Add spacing between pages
+    return ExtractedText(text=text, page_offsets=page_offsets, failed_pages=failed_pages)
+
+
+def extract_document(file_path: str) -> ExtractedText:
+    """Extract text from various file formats, with page offsets for PDFs."""
     file_extension = os.path.splitext(file_path)[1].lower()
     
     if file_extension == '.txt':
         with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
+            return ExtractedText(text=f.read())
     
     elif file_extension == '.pdf':
-        text = ""
-        try:
-            with pdfplumber.open(file_path) as pdf:
-                # Try to extract title and metadata
-                metadata = {}
-                if pdf.metadata:
-                    metadata = pdf.metadata
-                
-                # Extract text from each page
-                for page in pdf.pages:
-                    extracted_text = page.extract_text() or ""
-                    text += extracted_text + "\n\n"  # Add spacing between pages
-        except Exception as e:
-            print(f"Error extracting text from PDF: {str(e)}")
-            text = "Error extracting text from PDF file."
-        
-        return text
+        return _extract_pdf(file_path)
     
     elif file_extension == '.docx':
         try:
-            return docx2txt.process(file_path)
+            return ExtractedText(text=docx2txt.process(file_path))
         except Exception as e:
-            print(f"Error extracting text from DOCX: {str(e)}")
-            return "Error extracting text from DOCX file."
+            logger.error("Error extracting text from DOCX: %s", e)
+            return ExtractedText(text="Error extracting text from DOCX file.")
     
     else:
         raise ValueError(f"Unsupported file format: {file_extension}")
 
 
+def extract_text_from_file(file_path: str) -> str:
+    """Extract text from various file formats."""
+    return extract_document(file_path).text
+
+
 def extract_metadata_from_file(file_path: str) -> Dict[str, Any]:
     """
     Extract metadata from document files (PDF, DOCX)
@@ -97,7 +171,7 @@ def extract_metadata_from_file(file_path: str) -> Dict[str, Any]:
                 metadata["title"] = lines[0].strip()
                 
     except Exception as e:
-        print(f"Error extracting metadata: {str(e)}")
+        logger.warning("Error extracting metadata: %s", e)
     
     # Set current date as fallback for publication date
     if not metadata["publication_date"]:
@@ -106,23 +180,38 @@ def extract_metadata_from_file(file_path: str) -> Dict[str, Any]:
     return metadata
 
 
-def process_document(text: str) -> List[DocumentChunk]:
+@lru_cache(maxsize=1)
+def get_encoder():
+    """Tokenizer used for chunking; loaded once and preloaded at startup."""
+    return tiktoken.encoding_for_model("gpt-3.5-turbo")
+
+
+def process_document(text: str, page_offsets: Optional[List[int]] = None) -> List[DocumentChunk]:
     """
     Process document text into chunks suitable for storage and retrieval.
     Uses simple sliding window chunking with token-based sizing.
+    With page_offsets (where each page starts in `text`), every chunk also
+    records the pages it spans as page_start and page_end.
     """
     # Initialize the encoder
-    encoder = tiktoken.encoding_for_model("gpt-3.5-turbo")
+    encoder = get_encoder()
     
     # Define chunking parameters
     max_tokens_per_chunk = settings.MAX_TOKENS_PER_CHUNK
     overlap_tokens = settings.OVERLAP_TOKENS
     
-    # Preprocess text - clean up newlines, extra spaces, etc.
-    cleaned_text = re.sub(r'\s+', ' ', text).strip()
+    # Split at page boundaries so each token can be traced back to its page
+    boundaries = list(page_offsets or [0]) + [len(text)]
+    segments = [text[start:end] for start, end in zip(boundaries, boundaries[1:])]
     
-    # Tokenize the text
-    tokens = encoder.encode(cleaned_text)
+    # Preprocess text - clean up newlines, extra spaces, etc. - and tokenize it
+    tokens: List[int] = []
+    page_token_starts: List[int] = []
+    for segment in segments:
+        cleaned_segment = re.sub(r'\s+', ' ', segment).strip()
+        page_token_starts.append(len(tokens))
+        if cleaned_segment:
+            tokens.extend(encoder.encode(cleaned_segment if not tokens else " " + cleaned_segment))
     
     # Initialize chunk list
     chunks = []
@@ -139,17 +228,22 @@ def process_document(text: str) -> List[DocumentChunk]:
         # Decode tokens back to text
         chunk_text = encoder.decode(chunk_tokens)
         
+        metadata = {
+            "start_token": i,
+            "end_token": i + len(chunk_tokens)
+        }
+        if page_offsets:
+            metadata["page_start"] = bisect.bisect_right(page_token_starts, i)
+            metadata["page_end"] = bisect.bisect_right(page_token_starts, i + len(chunk_tokens) - 1)
+        
         # Create chunk object with unique ID and position information
         chunk = DocumentChunk(
             text=chunk_text,
             token_count=len(chunk_tokens),
             position=i,
-            metadata={
-                "start_token": i,
-                "end_token": i + len(chunk_tokens)
-            }
+            metadata=metadata
         )
         
         chunks.append(chunk)
     
-    return chunks
\ No newline at end of file
+    return chunks
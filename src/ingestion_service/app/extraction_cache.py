@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from typing import Any, Dict, Optional, Tuple
+import docx2txt
+import pdfplumber
+from .config import settings
+from .schemas import ExtractedText
+from .metrics import EXTRACTION_CACHE
+
+
+logger = logging.getLogger(__name__)
+
+
+# Bump when extraction output changes for the same input file
+EXTRACTOR_VERSION = "2"
+_EXTRACTOR_TAG = f"{EXTRACTOR_VERSION}:pdfplumber-{pdfplumber.__version__}:docx2txt-{getattr(docx2txt, '__version__', '0')}"
+
+_ENTRY_SUFFIX = ".json.z"
+
+
+def content_key(file_path: str) -> str:
+    """Hash of the file's bytes and the extractor version."""
+    digest = hashlib.sha256(_EXTRACTOR_TAG.encode())
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Extracted text, page offsets and metadata per file, on disk.
+
+    Entries are zlib-compressed JSON named by content_key(), so the same file
+    uploaded again, a retried job or a re-chunking run skips extraction.
+    A hit refreshes the entry's mtime; once the directory grows past
+    EXTRACTION_CACHE_MAX_BYTES the least recently used entries are removed.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        # Two-level fan-out keeps directories small on large corpora
+        return os.path.join(self.directory, key[:2], key + _ENTRY_SUFFIX)
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(_ENTRY_SUFFIX):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def get(self, key: str) -> Optional[Tuple[ExtractedText, Dict[str, Any]]]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = json.loads(zlib.decompress(f.read()))
+            os.utime(path)
+        except FileNotFoundError:
+            EXTRACTION_CACHE.labels(result="miss").inc()
+            return None
+        except (OSError, ValueError, zlib.error) as e:
+            logger.warning("Discarding unreadable extraction cache entry %s: %s", key, e)
+            self._remove(path)
+            EXTRACTION_CACHE.labels(result="miss").inc()
+            return None
+        EXTRACTION_CACHE.labels(result="hit").inc()
+        return ExtractedText(**entry["extracted"]), entry["metadata"]
+
+    def put(self, key: str, extracted: ExtractedText, metadata: Dict[str, Any]):
+        payload = zlib.compress(
+            json.dumps({"extracted": extracted.dict(), "metadata": metadata}, separators=(",", ":"), default=str).encode(),
+            6
+        )
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(payload)
+        os.replace(temp_path, path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += len(payload)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _remove(self, path: str) -> int:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except FileNotFoundError:
+            return 0
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is at 90% of its budget."""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        # Rescan rather than trust the running total; other workers share the volume
+        self._size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for path, size, _ in entries:
+            if self._size <= target:
+                break
+            self._size -= self._remove(path)
+            evicted += 1
+        EXTRACTION_CACHE.labels(result="evicted").inc(evicted)
+
+
+extraction_cache = ExtractionCache(settings.EXTRACTION_CACHE_DIR, settings.EXTRACTION_CACHE_MAX_BYTES)
@@ -1,20 +1,32 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks, Response, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel, ValidationError
 import uuid
 import json
 import os
 import asyncio
+import logging
+import time
 from datetime import datetime, timezone
 import psycopg2
 from psycopg2.extras import Json
 from typing import Dict, List, Optional, Any
 import shutil
 
-from .document_processor import process_document, extract_text_from_file, extract_metadata_from_file
-from .db_utils import get_db_connection, store_chunks_in_db
-from .schemas import SourceInfo, ProcessingStatus, JobStatus, SupportedFileType, Domain
+from .document_processor import process_document, extract_document, extract_metadata_from_file, shutdown_pdf_pool
+from .db_utils import get_db_connection, store_chunks_in_db, get_commit_lsn
+from .schemas import SourceInfo, ProcessingStatus, JobStatus, SupportedFileType, Domain, DeleteDocumentsRequest
 from .config import settings
+from .logging_config import configure_logging
+from .warmup import warm_up, is_ready, readiness
+from .extraction_cache import extraction_cache, content_key
+from .maintenance import mark_document_deleted, mark_documents_deleted, request_maintenance, run_maintenance_loop, last_run
+from .profiling import profiled, profiling_requested, traces
+from .metrics import render_metrics, timed_stage, JOBS, ERRORS, JOBS_IN_PROGRESS
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="CommandCore Ingestion Service")
 
@@ -32,6 +44,23 @@ app.add_middleware(
 job_statuses = {}
 
 
+@app.on_event("startup")
+async def start_background_tasks():
+    app.state.background_tasks = [
+        # Wait for the database and load the tokenizer before /ready lets traffic in
+        asyncio.create_task(warm_up()),
+        # Batched deletes, retention expiry and index upkeep
+        asyncio.create_task(run_maintenance_loop()),
+    ]
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in app.state.background_tasks:
+        task.cancel()
+    shutdown_pdf_pool()
+
+
 @app.get("/")
 async def root():
     return {"message": "CommandCore Ingestion Service"}
@@ -43,13 +72,32 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.now(timezone.utc).isoformat()}
 
 
+@app.get("/ready")
+async def readiness_check():
+    # Ready only once the startup warm-up has finished
+    status_code = 200 if is_ready() else 503
+    return JSONResponse(
+        status_code=status_code,
+        content={"status": "ready" if status_code == 200 else "starting", "checks": readiness}
+    )
+
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus scrape endpoint
+    body, content_type = render_metrics()
+    return Response(content=body, headers={"Content-Type": content_type})
+
+
 @app.post("/v1/documents/upload")
 async def upload_document(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     domain: str = Form(...),
-    source_info: str = Form(...)
+    source_info: str = Form(...),
+    x_profile: Optional[str] = Header(None)
 ):
+    # With X-Profile: 1 the processing job runs under the sampling profiler
     # Validate domain
     if domain not in ["ai", "cloud", "virt-os"]:
         raise HTTPException(
@@ -102,6 +150,7 @@ async def upload_document(
     
     # Generate a job ID
     job_id = str(uuid.uuid4())
+    profile_id = uuid.uuid4().hex[:12] if profiling_requested(x_profile) else None
     
     # Create upload directory if it doesn't exist
     upload_dir = os.path.join(settings.UPLOAD_DIR, job_id)
@@ -134,16 +183,21 @@ async def upload_document(
         job_id=job_id,
         file_path=file_path,
         domain=domain,
-        source_info=source_info_dict
+        source_info=source_info_dict,
+        profile_id=profile_id
     )
     
     # Return accepted response with job ID
-    return {
+    accepted = {
         "status": "processing",
         "message": "Document upload accepted and processing started",
         "job_id": job_id,
         "estimated_completion_time": datetime.now(timezone.utc).isoformat()
     }
+    if profile_id:
+        # Available from /v1/system/traces once the job finishes
+        accepted["trace_id"] = profile_id
+    return accepted
 
 
 @app.get("/v1/documents/status/{job_id}")
@@ -162,6 +216,97 @@ async def check_status(job_id: str):
     return job_statuses[job_id]
 
 
+def _delete_document(document_id: str) -> bool:
+    conn = get_db_connection()
+    try:
+        return mark_document_deleted(conn, document_id)
+    except psycopg2.DataError:
+        # Not a valid UUID, so it cannot name a document
+        return False
+    finally:
+        conn.close()
+
+
+def _delete_documents(request: DeleteDocumentsRequest) -> int:
+    conn = get_db_connection()
+    try:
+        return mark_documents_deleted(conn, request.filter, dry_run=request.dry_run)
+    finally:
+        conn.close()
+
+
+@app.delete("/v1/documents/{document_id}", status_code=202)
+async def delete_document(document_id: str):
+    # Retrieval skips the document's chunks from now on (the orchestrator's vector
+    # index replica and precomputed answers from their next sync); the rows
+    # themselves are removed by the maintenance job
+    if not await asyncio.to_thread(_delete_document, document_id):
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "error": {
+                    "code": "DOCUMENT_NOT_FOUND",
+                    "message": "Document ID not found"
+                }
+            }
+        )
+    request_maintenance()
+    return {"document_id": document_id, "status": "pending_deletion"}
+
+
+@app.post("/v1/documents/delete", status_code=202)
+async def delete_documents(request: DeleteDocumentsRequest):
+    if not any(request.filter.dict().values()):
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "error": {
+                    "code": "EMPTY_FILTER",
+                    "message": "At least one filter field is required"
+                }
+            }
+        )
+    matched = await asyncio.to_thread(_delete_documents, request)
+    if matched and not request.dry_run:
+        request_maintenance()
+    return {
+        "matched_documents": matched,
+        "dry_run": request.dry_run,
+        "status": "dry_run" if request.dry_run else "pending_deletion"
+    }
+
+
+@app.get("/v1/system/maintenance")
+async def maintenance_status():
+    # Outcome of the most recent maintenance run
+    return {"last_run": last_run or None}
+
+
+@app.get("/v1/system/traces")
+async def list_traces():
+    # Recently captured slow or requested ingestion job profiles, newest first
+    return {"traces": traces.summaries()}
+
+
+@app.get("/v1/system/traces/{trace_id}")
+async def get_trace(trace_id: str, format: str = "json"):
+    # format=collapsed returns folded stacks for flamegraph.pl or speedscope
+    trace = traces.get(trace_id)
+    if trace is None:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "error": {
+                    "code": "TRACE_NOT_FOUND",
+                    "message": "Trace not found; it may still be running or have been evicted"
+                }
+            }
+        )
+    if format == "collapsed":
+        return PlainTextResponse(trace.collapsed())
+    return trace.to_dict()
+
+
 @app.get("/v1/system/supported-file-types")
 async def get_supported_file_types():
     supported_types = [
@@ -219,7 +364,23 @@ async def get_domains():
     }
 
 
-async def process_document_task(job_id: str, file_path: str, domain: str, source_info: Dict):
+async def process_document_task(
+    job_id: str,
+    file_path: str,
+    domain: str,
+    source_info: Dict,
+    profile_id: Optional[str] = None
+):
+    # Profiled when requested at upload; a slow job keeps its stage timings as a trace anyway
+    timings = {}
+    with profiled("ingestion_job", timings, force=profile_id is not None, trace_id=profile_id, job_id=job_id, domain=domain):
+        await _process_document(job_id, file_path, domain, source_info, timings)
+
+
+async def _process_document(job_id: str, file_path: str, domain: str, source_info: Dict, timings: Dict[str, float]):
+    started = time.perf_counter()
+    stage = "metadata_extraction"
+    JOBS_IN_PROGRESS.inc()
     try:
         # Update job status to text extraction
         job_statuses[job_id]["status"] = "processing"
@@ -228,8 +389,35 @@ async def process_document_task(job_id: str, file_path: str, domain: str, source
             "current_stage": "text_extraction"
         }
         
-        # Extract metadata from file
-        extracted_metadata = extract_metadata_from_file(file_path)
+        # Reuse an earlier extraction of the same file (retries, re-chunking runs)
+        cache_key, cached = None, None
+        if settings.EXTRACTION_CACHE_ENABLED:
+            stage = "extraction_cache"
+            with timed_stage(stage, timings):
+                cache_key = await asyncio.to_thread(content_key, file_path)
+                cached = await asyncio.to_thread(extraction_cache.get, cache_key)
+        
+        if cached:
+            extracted, extracted_metadata = cached
+        else:
+            # Extract metadata from file
+            stage = "metadata_extraction"
+            with timed_stage(stage, timings):
+                extracted_metadata = await asyncio.to_thread(extract_metadata_from_file, file_path)
+            
+            # Extract text from file
+            stage = "text_extraction"
+            with timed_stage(stage, timings):
+                # Off the event loop; large PDFs are split across worker processes
+                extracted = await asyncio.to_thread(extract_document, file_path)
+            if extracted.failed_pages:
+                ERRORS.labels(stage="pdf_page").inc(len(extracted.failed_pages))
+            elif cache_key:
+                # Failed pages may be transient, so only complete extractions are kept
+                try:
+                    await asyncio.to_thread(extraction_cache.put, cache_key, extracted, extracted_metadata)
+                except OSError as e:
+                    logger.warning("Could not write extraction cache entry: %s", e)
         
         # Update source_info with extracted metadata if available
         if extracted_metadata:
@@ -247,9 +435,6 @@ async def process_document_task(job_id: str, file_path: str, domain: str, source
             job_statuses[job_id]["extracted_metadata"] = extracted_metadata
             job_statuses[job_id]["source_info"] = source_info
         
-        # Extract text from file
-        text = extract_text_from_file(file_path)
-        
         # Update job status to chunking
         job_statuses[job_id]["progress"] = {
             "percentage": 30,
@@ -257,7 +442,9 @@ async def process_document_task(job_id: str, file_path: str, domain: str, source
         }
         
         # Process document into chunks
-        chunks = process_document(text)
+        stage = "chunking"
+        with timed_stage(stage, timings):
+            chunks = process_document(extracted.text, page_offsets=extracted.page_offsets)
         
         # Update job status to embedding generation
         job_statuses[job_id]["progress"] = {
@@ -265,10 +452,17 @@ async def process_document_task(job_id: str, file_path: str, domain: str, source
             "current_stage": "embedding_generation"
         }
         
-        # Store chunks in database
-        conn = get_db_connection()
-        stored_count = await store_chunks_in_db(conn, chunks, domain, source_info)
-        conn.close()
+        # Store chunks in database; embedding and write time are recorded per stage inside
+        stage = "embedding_and_storage"
+        conn = await asyncio.to_thread(get_db_connection)
+        try:
+            dedupe_stats = {}
+            stage_started = time.perf_counter()
+            stored_count = await store_chunks_in_db(conn, chunks, domain, source_info, document_id=job_id, dedupe_stats=dedupe_stats)
+            timings["embedding_and_storage_ms"] = (time.perf_counter() - stage_started) * 1000
+            commit_lsn = get_commit_lsn(conn)
+        finally:
+            conn.close()
         
         # Update job status to completed
         job_statuses[job_id] = {
@@ -277,14 +471,27 @@ async def process_document_task(job_id: str, file_path: str, domain: str, source
             "completed_at": datetime.now(timezone.utc).isoformat(),
             "details": {
                 "chunks_created": stored_count,
+                "chunks_total": len(chunks),
+                # Near-duplicates of chunks already in the domain (checked, unique, skipped, linked)
+                "dedupe": dedupe_stats,
+                # Pass as read_after_lsn to query this document from a read replica
+                "commit_lsn": commit_lsn,
                 "domain": domain,
                 "document_title": source_info.get("title", "Unknown"),
                 "document_author": source_info.get("author", "Unknown"),
                 "document_date": source_info.get("publication_date", "Unknown"),
                 "metadata_extracted": bool(extracted_metadata),
-                "processing_time": "N/A"  # Could calculate actual time in production
+                "extraction_cached": bool(cached),
+                "pages": len(extracted.page_offsets) or None,
+                "failed_pages": extracted.failed_pages,
+                "processing_time": f"{time.perf_counter() - started:.2f}s"
             }
         }
+        JOBS.labels(status="completed").inc()
+        logger.info(
+            "Document processed",
+            extra={"job_id": job_id, "chunks": stored_count, "seconds": round(time.perf_counter() - started, 3)}
+        )
         
     except Exception as e:
         # Update job status to failed
@@ -296,5 +503,9 @@ async def process_document_task(job_id: str, file_path: str, domain: str, source
                 "message": str(e)
             }
         }
-        # In a production environment, we would log this error
-        print(f"Error processing document: {str(e)}")
+        JOBS.labels(status="failed").inc()
+        ERRORS.labels(stage=stage).inc()
+        logger.exception("Error processing document", extra={"job_id": job_id, "stage": stage})
+    
+    finally:
+        JOBS_IN_PROGRESS.dec()
@@ -0,0 +1,336 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from .config import settings
+from .db_utils import get_db_connection
+from .schemas import DocumentFilter
+from .metrics import STAGE_LATENCY, MAINTENANCE_DELETED, MAINTENANCE_ACTIONS, DEAD_TUPLE_RATIO, INDEX_BLOAT_RATIO
+
+
+logger = logging.getLogger(__name__)
+
+
+EMBEDDING_INDEX = "knowledge_chunks_embedding_idx"
+# Session advisory lock so only one ingestion worker runs maintenance at a time
+MAINTENANCE_LOCK_ID = 7303201
+
+_wake = asyncio.Event()
+last_run: Dict[str, Any] = {}
+
+
+def request_maintenance():
+    """Start the next maintenance run now instead of at the next interval."""
+    _wake.set()
+
+
+def _filter_clause(document_filter: DocumentFilter) -> Tuple[str, List[Any]]:
+    """SQL conditions on documents `d` matching the filter, and their parameters."""
+    clauses, params = [], []
+    if document_filter.domain:
+        clauses.append("EXISTS (SELECT 1 FROM knowledge_chunks kc WHERE kc.document_id = d.id AND kc.domain = %s)")
+        params.append(document_filter.domain)
+    for field in ("classification", "author", "title"):
+        value = getattr(document_filter, field)
+        if value:
+            clauses.append(f"d.source_info->>'{field}' = %s")
+            params.append(value)
+    if document_filter.created_before:
+        clauses.append("d.created_at < %s")
+        params.append(document_filter.created_before)
+    if document_filter.created_after:
+        clauses.append("d.created_at >= %s")
+        params.append(document_filter.created_after)
+    return " AND ".join(clauses), params
+
+
+def mark_document_deleted(conn, document_id: str) -> bool:
+    """Queue one document for deletion. Returns False if it doesn't exist."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "UPDATE documents SET deleted_at = NOW() WHERE id = %s::uuid AND deleted_at IS NULL RETURNING id",
+            (document_id,)
+        )
+        found = cursor.fetchone() is not None
+        conn.commit()
+        return found
+    finally:
+        cursor.close()
+
+
+def mark_documents_deleted(conn, document_filter: DocumentFilter, dry_run: bool = False) -> int:
+    """Queue every document matching the filter for deletion; returns how many matched."""
+    clause, params = _filter_clause(document_filter)
+    if not clause:
+        raise ValueError("At least one filter field is required")
+    cursor = conn.cursor()
+    try:
+        if dry_run:
+            cursor.execute(f"SELECT COUNT(*) FROM documents d WHERE d.deleted_at IS NULL AND {clause}", params)
+            return cursor.fetchone()[0]
+        cursor.execute(f"UPDATE documents d SET deleted_at = NOW() WHERE d.deleted_at IS NULL AND {clause}", params)
+        matched = cursor.rowcount
+        conn.commit()
+        return matched
+    finally:
+        cursor.close()
+
+
+def _apply_retention(cursor) -> int:
+    """Queue documents older than their domain or classification TTL."""
+    expired = 0
+    for policy, days in settings.RETENTION_POLICIES.items():
+        kind, _, value = policy.partition(":")
+        if kind not in ("domain", "classification") or not value:
+            logger.warning("Ignoring retention policy '%s'; expected domain:<id> or classification:<name>", policy)
+            continue
+        clause, params = _filter_clause(DocumentFilter(**{kind: value}))
+        cursor.execute(
+            f"""
+            UPDATE documents d SET deleted_at = NOW()
+            WHERE d.deleted_at IS NULL AND d.created_at < NOW() - make_interval(days => %s) AND {clause}
+            """,
+            [days] + params
+        )
+        expired += cursor.rowcount
+    MAINTENANCE_DELETED.labels(kind="expired_documents").inc(expired)
+    return expired
+
+
+def _delete_pending(cursor) -> Tuple[int, int]:
+    """
+    Delete chunks of queued documents in small transactions, then the
+    documents themselves. Short batches keep locks and WAL bursts small
+    while queries keep running.
+    """
+    chunks = 0
+    while True:
+        cursor.execute(
+            """
+            DELETE FROM knowledge_chunks WHERE id IN (
+                SELECT kc.id FROM knowledge_chunks kc
+                JOIN documents d ON d.id = kc.document_id
+                WHERE d.deleted_at IS NOT NULL
+                LIMIT %s
+            )
+            """,
+            (settings.MAINTENANCE_DELETE_BATCH,)
+        )
+        chunks += cursor.rowcount
+        if cursor.rowcount < settings.MAINTENANCE_DELETE_BATCH:
+            break
+        time.sleep(settings.MAINTENANCE_BATCH_PAUSE)
+
+    cursor.execute(
+        """
+        DELETE FROM documents d
+        WHERE d.deleted_at IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM knowledge_chunks kc WHERE kc.document_id = d.id)
+        """
+    )
+    documents = cursor.rowcount
+    MAINTENANCE_DELETED.labels(kind="chunks").inc(chunks)
+    MAINTENANCE_DELETED.labels(kind="documents").inc(documents)
+    return chunks, documents
+
+
+def _prune_change_log(cursor) -> int:
+    """
+    Delete knowledge_chunk_changes rows older than CHANGE_LOG_RETENTION_HOURS
+    in batches, recording the newest position deleted so an orchestrator
+    replica that had not read that far rebuilds instead of missing changes.
+    """
+    pruned = 0
+    while True:
+        cursor.execute(
+            """
+            WITH pruned AS (
+                DELETE FROM knowledge_chunk_changes WHERE seq IN (
+                    SELECT seq FROM knowledge_chunk_changes
+                    WHERE changed_at < NOW() - make_interval(hours => %s)
+                    LIMIT %s
+                )
+                RETURNING xid, seq
+            ), marked AS (
+                UPDATE knowledge_chunk_changes_pruned
+                SET pruned_xid = GREATEST(pruned_xid, (SELECT xid FROM pruned ORDER BY xid DESC LIMIT 1)),
+                    pruned_seq = GREATEST(pruned_seq, (SELECT MAX(seq) FROM pruned))
+            )
+            SELECT COUNT(*) FROM pruned
+            """,
+            (settings.CHANGE_LOG_RETENTION_HOURS, settings.MAINTENANCE_DELETE_BATCH)
+        )
+        batch = cursor.fetchone()[0]
+        pruned += batch
+        if batch < settings.MAINTENANCE_DELETE_BATCH:
+            break
+        time.sleep(settings.MAINTENANCE_BATCH_PAUSE)
+    MAINTENANCE_DELETED.labels(kind="chunk_changes").inc(pruned)
+    return pruned
+
+
+def _prune_answer_cache(cursor) -> int:
+    """
+    Delete expired rows of the orchestrator's shared answer cache in batches,
+    then the soonest to expire beyond ANSWER_CACHE_MAX_ROWS.
+    """
+    pruned = 0
+    while True:
+        cursor.execute(
+            """
+            DELETE FROM answer_cache WHERE key_digest IN (
+                SELECT key_digest FROM answer_cache WHERE expires_at < NOW() LIMIT %s
+            )
+            """,
+            (settings.MAINTENANCE_DELETE_BATCH,)
+        )
+        pruned += cursor.rowcount
+        if cursor.rowcount < settings.MAINTENANCE_DELETE_BATCH:
+            break
+        time.sleep(settings.MAINTENANCE_BATCH_PAUSE)
+
+    cursor.execute("SELECT COUNT(*) FROM answer_cache")
+    excess = cursor.fetchone()[0] - settings.ANSWER_CACHE_MAX_ROWS
+    while excess > 0:
+        cursor.execute(
+            """
+            DELETE FROM answer_cache WHERE key_digest IN (
+                SELECT key_digest FROM answer_cache ORDER BY expires_at LIMIT %s
+            )
+            """,
+            (min(excess, settings.MAINTENANCE_DELETE_BATCH),)
+        )
+        if not cursor.rowcount:
+            break
+        pruned += cursor.rowcount
+        excess -= cursor.rowcount
+        time.sleep(settings.MAINTENANCE_BATCH_PAUSE)
+    MAINTENANCE_DELETED.labels(kind="cached_answers").inc(pruned)
+    return pruned
+
+
+def refresh_domain_centroids(cursor):
+    """Recompute the per-domain embedding sums used for query routing from scratch."""
+    cursor.execute(
+        """
+        INSERT INTO domain_centroids (domain, embedding_sum, chunk_count)
+        SELECT domain, SUM(embedding), COUNT(*) FROM knowledge_chunks GROUP BY domain
+        ON CONFLICT (domain) DO UPDATE
+        SET embedding_sum = EXCLUDED.embedding_sum, chunk_count = EXCLUDED.chunk_count, updated_at = NOW()
+        """
+    )
+    # Domains whose chunks are all gone
+    cursor.execute("DELETE FROM domain_centroids dc WHERE NOT EXISTS (SELECT 1 FROM knowledge_chunks kc WHERE kc.domain = dc.domain)")
+
+
+def _index_bytes_per_row(cursor) -> Tuple[float, int]:
+    cursor.execute("SELECT n_live_tup FROM pg_stat_user_tables WHERE relname = 'knowledge_chunks'")
+    row = cursor.fetchone()
+    live = row[0] if row else 0
+    cursor.execute("SELECT pg_relation_size(%s::regclass)", (EMBEDDING_INDEX,))
+    return cursor.fetchone()[0] / max(live, 1), live
+
+
+def _maintain_index(cursor) -> Dict[str, Any]:
+    """
+    VACUUM knowledge_chunks when dead rows pile up, and rebuild the HNSW
+    index with REINDEX CONCURRENTLY once its size per live row has grown
+    MAINTENANCE_INDEX_BLOAT_RATIO past the size right after the last rebuild.
+    """
+    report: Dict[str, Any] = {"vacuumed": False, "reindexed": False}
+
+    cursor.execute("SELECT n_live_tup, n_dead_tup FROM pg_stat_user_tables WHERE relname = 'knowledge_chunks'")
+    live, dead = cursor.fetchone() or (0, 0)
+    dead_ratio = dead / max(live + dead, 1)
+    DEAD_TUPLE_RATIO.set(dead_ratio)
+    report["dead_tuple_ratio"] = round(dead_ratio, 4)
+    if live + dead >= settings.MAINTENANCE_MIN_ROWS and dead_ratio > settings.MAINTENANCE_DEAD_TUPLE_RATIO:
+        logger.info("Vacuuming knowledge_chunks (%.0f%% dead rows)", dead_ratio * 100)
+        cursor.execute("VACUUM (ANALYZE) knowledge_chunks")
+        MAINTENANCE_ACTIONS.labels(action="vacuum").inc()
+        report["vacuumed"] = True
+
+    bytes_per_row, live = _index_bytes_per_row(cursor)
+    cursor.execute("SELECT bytes_per_row FROM index_maintenance WHERE index_name = %s", (EMBEDDING_INDEX,))
+    row = cursor.fetchone()
+    baseline: Optional[float] = row[0] if row else None
+
+    if baseline and live >= settings.MAINTENANCE_MIN_ROWS and bytes_per_row > baseline * (1 + settings.MAINTENANCE_INDEX_BLOAT_RATIO):
+        logger.info("Rebuilding %s (%.0f bytes/row, baseline %.0f)", EMBEDDING_INDEX, bytes_per_row, baseline)
+        started = time.perf_counter()
+        cursor.execute("SET maintenance_work_mem = %s", (settings.MAINTENANCE_WORK_MEM,))
+        cursor.execute(f"REINDEX INDEX CONCURRENTLY {EMBEDDING_INDEX}")
+        STAGE_LATENCY.labels(stage="reindex").observe(time.perf_counter() - started)
+        MAINTENANCE_ACTIONS.labels(action="reindex").inc()
+        report["reindexed"] = True
+        bytes_per_row, live = _index_bytes_per_row(cursor)
+        baseline = None
+
+    # A denser index (or the first run) becomes the new baseline
+    if live >= settings.MAINTENANCE_MIN_ROWS and (baseline is None or bytes_per_row < baseline):
+        cursor.execute(
+            """
+            INSERT INTO index_maintenance (index_name, bytes_per_row, reindexed_at)
+            VALUES (%s, %s, NOW())
+            ON CONFLICT (index_name) DO UPDATE SET bytes_per_row = EXCLUDED.bytes_per_row, reindexed_at = EXCLUDED.reindexed_at
+            """,
+            (EMBEDDING_INDEX, bytes_per_row)
+        )
+        baseline = bytes_per_row
+
+    bloat = bytes_per_row / baseline - 1 if baseline else 0.0
+    INDEX_BLOAT_RATIO.set(bloat)
+    report["index_bloat_ratio"] = round(bloat, 4)
+    return report
+
+
+def run_maintenance_once() -> Dict[str, Any]:
+    """Expire, delete and compact; a no-op if another worker holds the lock."""
+    started = time.perf_counter()
+    conn = get_db_connection()
+    # Every statement commits on its own; VACUUM and REINDEX CONCURRENTLY require it
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (MAINTENANCE_LOCK_ID,))
+        if not cursor.fetchone()[0]:
+            return {"status": "skipped", "reason": "another worker is running maintenance"}
+        try:
+            report: Dict[str, Any] = {"status": "ok", "expired_documents": _apply_retention(cursor)}
+            report["deleted_chunks"], report["deleted_documents"] = _delete_pending(cursor)
+            if report["deleted_chunks"]:
+                # Sums can't be decremented without the deleted embeddings, so rebuild them
+                refresh_domain_centroids(cursor)
+            report["pruned_changes"] = _prune_change_log(cursor)
+            report["pruned_answers"] = _prune_answer_cache(cursor)
+            report.update(_maintain_index(cursor))
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MAINTENANCE_LOCK_ID,))
+    finally:
+        cursor.close()
+        conn.close()
+    STAGE_LATENCY.labels(stage="maintenance").observe(time.perf_counter() - started)
+    report["duration_seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+async def run_maintenance_loop():
+    """Background task: run maintenance every MAINTENANCE_INTERVAL or when requested."""
+    while True:
+        try:
+            report = await asyncio.to_thread(run_maintenance_once)
+            report["finished_at"] = time.time()
+            last_run.clear()
+            last_run.update(report)
+            if report.get("deleted_chunks") or report.get("expired_documents") or report.get("reindexed"):
+                logger.info("Maintenance run finished", extra={"maintenance": report})
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Maintenance run failed")
+        try:
+            await asyncio.wait_for(_wake.wait(), settings.MAINTENANCE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
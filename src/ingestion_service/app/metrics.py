@@ -0,0 +1,87 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+
+# Buckets from 1 ms up to ten minutes; large PDFs take a while to extract
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_LATENCY = Histogram(
+    "commandcore_ingestion_stage_seconds",
+    "Time spent per document processing stage",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+EMBEDDING_LATENCY = Histogram(
+    "commandcore_ingestion_embedding_seconds",
+    "Latency of individual embedding requests",
+    buckets=LATENCY_BUCKETS
+)
+EMBEDDED_TOKENS = Counter(
+    "commandcore_ingestion_embedded_tokens_total",
+    "Chunk tokens sent for embedding"
+)
+CHUNKS_STORED = Counter(
+    "commandcore_ingestion_chunks_stored_total",
+    "Chunks written to knowledge_chunks"
+)
+JOBS = Counter(
+    "commandcore_ingestion_jobs_total",
+    "Finished ingestion jobs",
+    ["status"]
+)
+ERRORS = Counter(
+    "commandcore_ingestion_errors_total",
+    "Errors raised while processing documents",
+    ["stage"]
+)
+JOBS_IN_PROGRESS = Gauge(
+    "commandcore_ingestion_jobs_in_progress",
+    "Documents currently being processed"
+)
+DEDUP_CHUNKS = Counter(
+    "commandcore_ingestion_dedup_chunks_total",
+    "Chunks checked for near-duplicates, by outcome",
+    ["outcome"]
+)
+EXTRACTION_CACHE = Counter(
+    "commandcore_ingestion_extraction_cache_total",
+    "Extraction cache lookups and evictions",
+    ["result"]
+)
+MAINTENANCE_DELETED = Counter(
+    "commandcore_ingestion_maintenance_deleted_total",
+    "Rows removed or expired by the maintenance job",
+    ["kind"]
+)
+MAINTENANCE_ACTIONS = Counter(
+    "commandcore_ingestion_maintenance_actions_total",
+    "VACUUM and REINDEX runs started by the maintenance job",
+    ["action"]
+)
+DEAD_TUPLE_RATIO = Gauge(
+    "commandcore_ingestion_chunks_dead_tuple_ratio",
+    "Share of dead rows in knowledge_chunks at the last maintenance run"
+)
+INDEX_BLOAT_RATIO = Gauge(
+    "commandcore_ingestion_vector_index_bloat_ratio",
+    "Growth of HNSW index bytes per live row since its last rebuild"
+)
+
+
+@contextmanager
+def timed_stage(stage: str, timings: Dict[str, float]) -> Iterator[None]:
+    """Time a job stage into the stage histogram and the job's `<stage>_ms` timings."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_LATENCY.labels(stage=stage).observe(elapsed)
+        timings[f"{stage}_ms"] = elapsed * 1000
+
+
+def render_metrics():
+    """Return the Prometheus text exposition and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,7 @@
+from commandcore_common.resilience import OpenAICaller, UpstreamUnavailable, openai_client, request_budget
+from .config import settings
+
+
+client = openai_client(settings)
+caller = OpenAICaller.from_settings(settings)
+call_openai = caller.call
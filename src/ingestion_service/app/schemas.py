@@ -46,6 +46,14 @@ class DocumentChunk(BaseModel):
     metadata: Dict[str, Any] = {}
 
 
+class ExtractedText(BaseModel):
+    text: str
+    # Character offset in `text` where each page starts (PDFs only)
+    page_offsets: List[int] = []
+    # 1-based numbers of pages that could not be extracted
+    failed_pages: List[int] = []
+
+
 class SupportedFileType(BaseModel):
     extension: str
     mime_type: str
@@ -57,3 +65,17 @@ class Domain(BaseModel):
     id: str
     name: str
     description: str
+
+
+class DocumentFilter(BaseModel):
+    domain: Optional[str] = None
+    classification: Optional[str] = None
+    author: Optional[str] = None
+    title: Optional[str] = None
+    created_before: Optional[datetime] = None
+    created_after: Optional[datetime] = None
+
+
+class DeleteDocumentsRequest(BaseModel):
+    filter: DocumentFilter
+    dry_run: bool = False
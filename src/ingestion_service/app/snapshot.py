@@ -0,0 +1,477 @@
+"""
+Export and import knowledge base snapshots.
+
+A snapshot is a directory holding:
+
+    manifest.json       counts, embedding model, checksums of every file
+                        and of the exported rows
+    documents.jsonl.gz  one document per line (id, source_info, timestamps)
+    chunks.jsonl.gz     chunk columns except the embedding, in chunk id order
+    chunk_ids.npy       int32 chunk ids, row-aligned with embeddings.npy
+    embeddings.npy      float32 matrix, one embedding per row
+
+Import bulk-loads the files with binary COPY inside one transaction, with the
+HNSW index dropped during the load and rebuilt afterwards using parallel
+maintenance workers, then checks row counts and the content checksum against
+the manifest. The near-duplicate index (MinHash signatures and LSH buckets)
+is rebuilt from the imported chunk texts rather than shipped in the
+snapshot. Usage (inside the ingestion container):
+
+    python -m app.snapshot export /app/data/snapshots/<name>
+    python -m app.snapshot import /app/data/snapshots/<name> [--replace]
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import struct
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+import psycopg2
+from .config import settings
+from .db_utils import get_db_connection, EMBEDDING_DIMENSIONS
+from .dedupe import band_buckets, minhash_signature
+from .maintenance import EMBEDDING_INDEX, refresh_domain_centroids
+from .logging_config import configure_logging
+
+
+logger = logging.getLogger(__name__)
+
+
+SNAPSHOT_FORMAT = 1
+
+# Same definition as sql/init/01_init_db.sql
+CREATE_EMBEDDING_INDEX = f"""
+    CREATE INDEX {EMBEDDING_INDEX} ON knowledge_chunks
+    USING hnsw (embedding vector_cosine_ops)
+    WITH (ef_construction = 64, m = 16)
+"""
+
+# Order-independent checksum of the chunk rows, computed by Postgres on both
+# ends so export and import agree regardless of client-side encoding
+CONTENT_CHECKSUM = """
+    SELECT COUNT(*), COALESCE(SUM(('x' || LEFT(md5(
+        kc.id::text || ':' || kc.document_id::text || ':' || kc.domain || ':' ||
+        md5(kc.chunk_text) || ':' || md5(kc.chunk_metadata::text) || ':' || md5(kc.embedding::text)
+    ), 15))::bit(60)::bigint::numeric), 0)::text
+    FROM knowledge_chunks kc
+    JOIN documents d ON d.id = kc.document_id
+    WHERE d.deleted_at IS NULL
+"""
+
+_PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_COPY_TRAILER = struct.pack("!h", -1)
+
+
+class SnapshotError(Exception):
+    """The snapshot is incomplete, corrupt or does not match the database."""
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+# Binary COPY field encoders
+
+def _int2(value: int) -> bytes:
+    return struct.pack("!h", value)
+
+
+def _int4(value: int) -> bytes:
+    return struct.pack("!i", value)
+
+
+def _int8(value: int) -> bytes:
+    return struct.pack("!q", value)
+
+
+def _bytea(value: bytes) -> bytes:
+    return value
+
+
+def _text(value: str) -> bytes:
+    return value.encode("utf-8")
+
+
+def _uuid(value: str) -> bytes:
+    return uuid.UUID(value).bytes
+
+
+def _jsonb(value: Any) -> bytes:
+    # jsonb binary format: version byte followed by the JSON text
+    return b"\x01" + json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _timestamptz(value: str) -> bytes:
+    delta = datetime.fromisoformat(value) - _PG_EPOCH
+    return struct.pack("!q", delta // timedelta(microseconds=1))
+
+
+def _vector(value: np.ndarray) -> bytes:
+    # pgvector's vector_recv format: dimensions, unused, big-endian float4s
+    return struct.pack("!hh", len(value), 0) + value.astype(">f4").tobytes()
+
+
+class _CopyStream(io.RawIOBase):
+    """File-like view of encoded COPY rows for cursor.copy_expert."""
+
+    def __init__(self, rows: Iterable[Tuple], encoders: List[Callable[[Any], bytes]]):
+        self._chunks = self._encode(rows, encoders)
+        self._buffer = b""
+
+    @staticmethod
+    def _encode(rows, encoders) -> Iterator[bytes]:
+        yield _COPY_HEADER
+        field_count = struct.pack("!h", len(encoders))
+        for row in rows:
+            parts = [field_count]
+            for value, encode in zip(row, encoders):
+                if value is None:
+                    parts.append(struct.pack("!i", -1))
+                else:
+                    data = encode(value)
+                    parts.append(struct.pack("!i", len(data)))
+                    parts.append(data)
+            yield b"".join(parts)
+        yield _COPY_TRAILER
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def export_snapshot(conn, directory: str) -> Dict[str, Any]:
+    """Write every live document and chunk to `directory`; returns the manifest."""
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    # One consistent view of the database for counts, rows and checksum
+    conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+    cursor = conn.cursor()
+
+    cursor.execute(CONTENT_CHECKSUM)
+    chunk_count, content_checksum = cursor.fetchone()
+
+    cursor.execute(
+        "SELECT id::text, source_info, created_at, updated_at FROM documents WHERE deleted_at IS NULL ORDER BY id"
+    )
+    document_count = 0
+    with gzip.open(os.path.join(directory, "documents.jsonl.gz"), "wt", encoding="utf-8") as f:
+        for document_id, source_info, created_at, updated_at in cursor:
+            f.write(json.dumps({
+                "id": document_id,
+                "source_info": source_info,
+                "created_at": _timestamp(created_at),
+                "updated_at": _timestamp(updated_at),
+            }) + "\n")
+            document_count += 1
+
+    embeddings = np.lib.format.open_memmap(
+        os.path.join(directory, "embeddings.npy"), mode="w+", dtype=np.float32, shape=(chunk_count, EMBEDDING_DIMENSIONS)
+    )
+    chunk_ids = np.zeros(chunk_count, dtype=np.int32)
+    rows = conn.cursor(name="snapshot_chunks")
+    rows.itersize = 5000
+    rows.execute(
+        """
+        SELECT kc.id, kc.document_id::text, kc.domain, kc.chunk_text, kc.chunk_metadata,
+               kc.created_at, kc.updated_at, vector_send(kc.embedding)
+        FROM knowledge_chunks kc
+        JOIN documents d ON d.id = kc.document_id
+        WHERE d.deleted_at IS NULL
+        ORDER BY kc.id
+        """
+    )
+    with gzip.open(os.path.join(directory, "chunks.jsonl.gz"), "wt", encoding="utf-8") as f:
+        for row_number, (chunk_id, document_id, domain, text, metadata, created_at, updated_at, embedding) in enumerate(rows):
+            chunk_ids[row_number] = chunk_id
+            embeddings[row_number] = np.frombuffer(embedding, dtype=">f4", offset=4)
+            f.write(json.dumps({
+                "id": chunk_id,
+                "document_id": document_id,
+                "domain": domain,
+                "text": text,
+                "metadata": metadata,
+                "created_at": _timestamp(created_at),
+                "updated_at": _timestamp(updated_at),
+            }) + "\n")
+    rows.close()
+    conn.rollback()
+    embeddings.flush()
+    del embeddings
+    np.save(os.path.join(directory, "chunk_ids.npy"), chunk_ids)
+
+    files = {}
+    for name in ("documents.jsonl.gz", "chunks.jsonl.gz", "chunk_ids.npy", "embeddings.npy"):
+        path = os.path.join(directory, name)
+        files[name] = {"sha256": _file_sha256(path), "bytes": os.path.getsize(path)}
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "embedding_model": settings.OPENAI_EMBEDDING_MODEL,
+        "dimensions": EMBEDDING_DIMENSIONS,
+        "documents": document_count,
+        "chunks": chunk_count,
+        "content_checksum": content_checksum,
+        "files": files,
+    }
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(
+        "Exported %d documents and %d chunks to %s in %.1fs",
+        document_count, chunk_count, directory, time.perf_counter() - started
+    )
+    return manifest
+
+
+def _read_manifest(directory: str) -> Dict[str, Any]:
+    path = os.path.join(directory, "manifest.json")
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"Cannot read {path}: {e}")
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise SnapshotError(f"Unsupported snapshot format {manifest.get('format')}")
+    if manifest["dimensions"] != EMBEDDING_DIMENSIONS:
+        raise SnapshotError(f"Snapshot has {manifest['dimensions']}-dimensional embeddings, expected {EMBEDDING_DIMENSIONS}")
+    for name, expected in manifest["files"].items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path) or _file_sha256(path) != expected["sha256"]:
+            raise SnapshotError(f"{name} is missing or does not match its checksum")
+    if manifest["embedding_model"] != settings.OPENAI_EMBEDDING_MODEL:
+        logger.warning(
+            "Snapshot embeddings come from %s but this service embeds with %s",
+            manifest["embedding_model"], settings.OPENAI_EMBEDDING_MODEL
+        )
+    return manifest
+
+
+def _read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _chunk_rows(directory: str) -> Iterator[Tuple]:
+    embeddings = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode="r")
+    chunk_ids = np.load(os.path.join(directory, "chunk_ids.npy"))
+    for row_number, chunk in enumerate(_read_jsonl(os.path.join(directory, "chunks.jsonl.gz"))):
+        if chunk_ids[row_number] != chunk["id"]:
+            raise SnapshotError(f"chunks.jsonl.gz and chunk_ids.npy disagree at row {row_number}")
+        yield (
+            chunk["id"], chunk["text"], embeddings[row_number], chunk["document_id"],
+            chunk["domain"], chunk["metadata"], chunk["created_at"], chunk["updated_at"]
+        )
+
+
+def _bucket_rows(directory: str, signatures) -> Iterator[Tuple]:
+    """
+    LSH bucket rows of the snapshot's original chunks, the ones ingest would
+    have indexed (not stored as a duplicate of another). Each chunk's id and
+    MinHash signature are written to `signatures` for _signature_rows.
+    """
+    for chunk in _read_jsonl(os.path.join(directory, "chunks.jsonl.gz")):
+        if "duplicate_of" in (chunk["metadata"] or {}):
+            continue
+        signature = minhash_signature(chunk["text"])
+        if signature is None:
+            continue
+        signatures.write(_int4(chunk["id"]) + signature.tobytes())
+        for band, bucket in band_buckets(signature):
+            yield chunk["domain"], band, bucket, chunk["id"]
+
+
+def _signature_rows(signatures) -> Iterator[Tuple]:
+    record_size = 4 + settings.DEDUP_NUM_PERM * 4
+    signatures.seek(0)
+    for record in iter(lambda: signatures.read(record_size), b""):
+        yield struct.unpack("!i", record[:4])[0], record[4:]
+
+
+def _change_rows(directory: str, operation: str) -> Iterator[Tuple]:
+    for chunk_id in np.load(os.path.join(directory, "chunk_ids.npy")):
+        yield int(chunk_id), operation
+
+
+def import_snapshot(
+    conn,
+    directory: str,
+    replace: bool = False,
+    index_workers: Optional[int] = None,
+    maintenance_work_mem: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Bulk-load a snapshot in one transaction and verify it. The target must
+    be empty unless `replace` is set, in which case its documents and chunks
+    are removed first. Returns the verified counts.
+    """
+    started = time.perf_counter()
+    manifest = _read_manifest(directory)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SET LOCAL synchronous_commit = off")
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM documents)")
+        if cursor.fetchone()[0]:
+            if not replace:
+                raise SnapshotError("Target database already has documents; pass --replace to overwrite them")
+            # TRUNCATE skips row triggers, so tell vector index replicas about the removals
+            cursor.execute("INSERT INTO knowledge_chunk_changes (chunk_id, operation) SELECT id, 'D' FROM knowledge_chunks")
+            # CASCADE also clears the tables keyed by chunk; the dedupe index is rebuilt below
+            cursor.execute("TRUNCATE knowledge_chunks, documents CASCADE")
+
+        # Loading into an unindexed table and building the graph once is far faster
+        cursor.execute(f"DROP INDEX IF EXISTS {EMBEDDING_INDEX}")
+        # The change log is filled in one COPY below instead of one trigger call per row
+        cursor.execute("ALTER TABLE knowledge_chunks DISABLE TRIGGER record_chunk_change")
+
+        load_started = time.perf_counter()
+        cursor.copy_expert(
+            "COPY documents (id, source_info, created_at, updated_at) FROM STDIN WITH (FORMAT binary)",
+            _CopyStream(
+                ((d["id"], d["source_info"], d["created_at"], d["updated_at"])
+                 for d in _read_jsonl(os.path.join(directory, "documents.jsonl.gz"))),
+                [_uuid, _jsonb, _timestamptz, _timestamptz]
+            )
+        )
+        cursor.copy_expert(
+            "COPY knowledge_chunks (id, chunk_text, embedding, document_id, domain, chunk_metadata, created_at, updated_at) "
+            "FROM STDIN WITH (FORMAT binary)",
+            _CopyStream(_chunk_rows(directory), [_int4, _text, _vector, _uuid, _text, _jsonb, _timestamptz, _timestamptz])
+        )
+        cursor.copy_expert(
+            "COPY knowledge_chunk_changes (chunk_id, operation) FROM STDIN WITH (FORMAT binary)",
+            _CopyStream(_change_rows(directory, "I"), [_int4, _text])
+        )
+        cursor.execute("ALTER TABLE knowledge_chunks ENABLE TRIGGER record_chunk_change")
+        signature_count = 0
+        if settings.DEDUP_MODE != "off":
+            # Buckets are streamed while signatures wait in a temporary file for their own COPY
+            with tempfile.TemporaryFile() as signatures:
+                cursor.copy_expert(
+                    "COPY chunk_lsh_buckets (domain, band, bucket, chunk_id) FROM STDIN WITH (FORMAT binary)",
+                    _CopyStream(_bucket_rows(directory, signatures), [_text, _int2, _int8, _int4])
+                )
+                cursor.copy_expert(
+                    "COPY chunk_signatures (chunk_id, signature) FROM STDIN WITH (FORMAT binary)",
+                    _CopyStream(_signature_rows(signatures), [_int4, _bytea])
+                )
+                signature_count = cursor.rowcount
+        # Ids were copied verbatim; new chunks must not collide with them
+        cursor.execute(
+            "SELECT setval(pg_get_serial_sequence('knowledge_chunks', 'id'), GREATEST((SELECT MAX(id) FROM knowledge_chunks), 1))"
+        )
+        refresh_domain_centroids(cursor)
+        load_seconds = time.perf_counter() - load_started
+
+        index_started = time.perf_counter()
+        cursor.execute("SET LOCAL maintenance_work_mem = %s", (maintenance_work_mem or settings.SNAPSHOT_MAINTENANCE_WORK_MEM,))
+        cursor.execute(
+            "SET LOCAL max_parallel_maintenance_workers = %s",
+            (index_workers if index_workers is not None else settings.SNAPSHOT_INDEX_BUILD_WORKERS,)
+        )
+        cursor.execute(CREATE_EMBEDDING_INDEX)
+        index_seconds = time.perf_counter() - index_started
+
+        cursor.execute("SELECT COUNT(*) FROM documents")
+        document_count = cursor.fetchone()[0]
+        cursor.execute(CONTENT_CHECKSUM)
+        chunk_count, content_checksum = cursor.fetchone()
+        if document_count != manifest["documents"] or chunk_count != manifest["chunks"]:
+            raise SnapshotError(
+                f"Loaded {document_count} documents and {chunk_count} chunks, "
+                f"manifest lists {manifest['documents']} and {manifest['chunks']}"
+            )
+        if content_checksum != manifest["content_checksum"]:
+            raise SnapshotError("Content checksum of the loaded chunks does not match the manifest")
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    # Fresh statistics so the planner costs the new table correctly
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute("ANALYZE documents")
+    cursor.execute("ANALYZE knowledge_chunks")
+    cursor.close()
+
+    result = {
+        "documents": document_count,
+        "chunks": chunk_count,
+        "signatures": signature_count,
+        "load_seconds": round(load_seconds, 1),
+        "index_seconds": round(index_seconds, 1),
+        "total_seconds": round(time.perf_counter() - started, 1),
+    }
+    logger.info("Imported snapshot %s", directory, extra={"snapshot": result})
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export or import a knowledge base snapshot")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write documents and chunks to a snapshot directory")
+    export_parser.add_argument("directory")
+    import_parser = commands.add_parser("import", help="Bulk-load a snapshot directory")
+    import_parser.add_argument("directory")
+    import_parser.add_argument("--replace", action="store_true", help="Remove existing documents and chunks first")
+    import_parser.add_argument("--index-workers", type=int, help="Parallel workers for the HNSW build")
+    import_parser.add_argument("--maintenance-work-mem", help="maintenance_work_mem for the HNSW build, e.g. 4GB")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    conn = get_db_connection()
+    try:
+        if args.command == "export":
+            result = export_snapshot(conn, args.directory)
+        else:
+            result = import_snapshot(
+                conn,
+                args.directory,
+                replace=args.replace,
+                index_workers=args.index_workers,
+                maintenance_work_mem=args.maintenance_work_mem
+            )
+    except SnapshotError as e:
+        logger.error("Snapshot %s failed: %s", args.command, e)
+        return 1
+    finally:
+        conn.close()
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
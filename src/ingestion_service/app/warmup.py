@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import os
+from typing import Dict
+import psycopg2
+from .config import settings
+from .db_utils import get_db_connection
+from .document_processor import get_encoder
+
+
+logger = logging.getLogger(__name__)
+
+
+# Startup steps and their state: pending, ok or failed
+readiness: Dict[str, str] = {
+    "database": "pending",
+    "upload_dir": "pending",
+    "tokenizer": "pending",
+}
+
+
+def is_ready() -> bool:
+    """Ready once every step has finished and the database is reachable."""
+    return readiness["database"] == "ok" and all(state != "pending" for state in readiness.values())
+
+
+def _check_database():
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM knowledge_chunks LIMIT 1")
+        cursor.close()
+    finally:
+        conn.close()
+
+
+async def warm_up():
+    """
+    Startup phase run before /ready reports ready: wait for the database,
+    create the upload directory and load the chunking tokenizer so the
+    first job doesn't pay for it.
+    """
+    try:
+        os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+        readiness["upload_dir"] = "ok"
+    except OSError as e:
+        logger.warning("Cannot create upload directory: %s", e)
+        readiness["upload_dir"] = "failed"
+
+    try:
+        await asyncio.to_thread(get_encoder)
+        readiness["tokenizer"] = "ok"
+    except Exception as e:
+        logger.warning("Tokenizer preload failed: %s", e)
+        readiness["tokenizer"] = "failed"
+
+    while True:
+        try:
+            await asyncio.to_thread(_check_database)
+            readiness["database"] = "ok"
+            break
+        except psycopg2.Error as e:
+            logger.warning("Database not reachable yet, retrying: %s", e)
+            await asyncio.sleep(settings.WARMUP_RETRY_SECONDS)
+
+    logger.info("Warm-up finished", extra={"readiness": dict(readiness)})
@@ -0,0 +1,179 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Deque, Dict, List, Optional
+from .config import settings
+from .metrics import ADMISSION_ACTIVE, ADMISSION_QUEUE_DEPTH, ADMISSION_QUEUE_TIME, ADMISSION_REJECTED
+
+
+# Lower value is served first
+PRIORITIES = {"interactive": 0, "batch": 1}
+DEFAULT_PRIORITY = "batch"
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("admission_priority", default=DEFAULT_PRIORITY)
+
+
+class Overloaded(Exception):
+    """A stage is saturated; the caller should retry after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: int, status_code: int = 429):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+def parse_priority(value: Optional[str]) -> str:
+    """Map a request's priority header to a known class."""
+    value = (value or "").strip().lower()
+    return value if value in PRIORITIES else DEFAULT_PRIORITY
+
+
+@contextmanager
+def request_priority(priority: str):
+    """Run the block, and any tasks it starts, under a priority class."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class StageLimiter:
+    """
+    Bounded concurrency for one pipeline stage with a priority wait queue.
+
+    Up to `limit` holders run at once. Further callers queue and are admitted
+    interactive-first, then in arrival order. With a `queue_size`, a caller
+    is refused straight away once that many are waiting (batch callers at
+    the lower `batch_queue_size`), and with a `queue_timeout` a caller that
+    waited too long gives up. Both raise Overloaded with a Retry-After
+    estimate from recent hold times.
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        limit: int,
+        queue_size: Optional[int] = None,
+        batch_queue_size: Optional[int] = None,
+        queue_timeout: Optional[float] = None
+    ):
+        self.stage = stage
+        self.limit = max(1, limit)
+        self.queue_size = queue_size
+        self.batch_queue_size = batch_queue_size if batch_queue_size is not None else queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: List[list] = []
+        self._seq = itertools.count()
+        self._hold_times: Deque[float] = deque(maxlen=100)
+        self.rejected = 0
+
+    def queued(self) -> int:
+        return sum(1 for entry in self._waiters if not entry[2].done())
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue is likely to have drained."""
+        if not self._hold_times:
+            return 1
+        average = sum(self._hold_times) / len(self._hold_times)
+        return max(1, math.ceil(average * (self.queued() + 1) / self.limit))
+
+    def _reject(self, priority: str, reason: str, status_code: int):
+        self.rejected += 1
+        ADMISSION_REJECTED.labels(stage=self.stage, priority=priority, reason=reason).inc()
+        raise Overloaded(
+            f"{self.stage} stage saturated ({reason}), retry later",
+            retry_after=self.retry_after(),
+            status_code=status_code
+        )
+
+    def _update_gauges(self):
+        ADMISSION_ACTIVE.labels(stage=self.stage).set(self.active)
+        ADMISSION_QUEUE_DEPTH.labels(stage=self.stage).set(self.queued())
+
+    def _release(self):
+        # Hand the slot straight to the best waiter that is still waiting
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self.active -= 1
+        self._update_gauges()
+
+    async def _acquire(self, priority: str) -> float:
+        started = time.monotonic()
+        if self.active < self.limit and not self.queued():
+            self.active += 1
+            self._update_gauges()
+            return 0.0
+
+        limit = self.batch_queue_size if priority == "batch" else self.queue_size
+        if limit is not None and self.queued() >= limit:
+            self._reject(priority, "queue_full", 429)
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [PRIORITIES[priority], next(self._seq), waiter])
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            ADMISSION_QUEUE_TIME.labels(stage=self.stage, priority=priority).observe(time.monotonic() - started)
+            self._update_gauges()
+            self._reject(priority, "queue_timeout", 503)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the caller went away
+                self._release()
+            self._update_gauges()
+            raise
+        return time.monotonic() - started
+
+    @asynccontextmanager
+    async def slot(self, timings: Optional[Dict[str, float]] = None):
+        """Hold one slot for the duration of the block."""
+        priority = _priority.get()
+        waited = await self._acquire(priority)
+        ADMISSION_QUEUE_TIME.labels(stage=self.stage, priority=priority).observe(waited)
+        if timings is not None:
+            timings[f"{self.stage}_queue_ms"] = timings.get(f"{self.stage}_queue_ms", 0.0) + waited * 1000
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._hold_times.append(time.monotonic() - started)
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.queued(),
+            "queue_size": self.queue_size,
+            "batch_queue_size": self.batch_queue_size,
+            "rejected": self.rejected,
+            "retry_after": self.retry_after(),
+        }
+
+
+# Whole query pipelines; the only stage that refuses work, the others just queue
+query_slots = StageLimiter(
+    "query",
+    settings.ADMISSION_MAX_QUERIES,
+    queue_size=settings.ADMISSION_QUEUE_SIZE,
+    batch_queue_size=settings.ADMISSION_BATCH_QUEUE_SIZE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT
+)
+llm_slots = StageLimiter("llm", settings.LLM_MAX_CONCURRENCY)
+embedding_slots = StageLimiter("embedding", settings.EMBEDDING_MAX_CONCURRENCY)
+
+
+def admission_stats() -> Dict[str, Any]:
+    return {limiter.stage: limiter.stats() for limiter in (query_slots, llm_slots, embedding_slots)}
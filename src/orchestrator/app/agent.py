@@ -1,11 +1,14 @@
-from openai import AsyncOpenAI
-from typing import List, Dict, Any
-import os
+from typing import List, Dict, Any, Optional, Tuple
 from .config import settings
-from .schemas import KnowledgeChunk
+from .schemas import PackedContext
+from .resilience import client, call_openai
+from .metrics import LLM_TOKENS
+from .query_log import record_tokens
+from .admission import llm_slots
+from .answer_cache import answer_key, get_answer, put_answer
 
-# Initialize the OpenAI client
-client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# Bump whenever the prompts below change so cached answers are not reused
+PROMPT_VERSION = "2"
 
 # System prompt for the agent
 SYSTEM_PROMPT = """
@@ -18,6 +21,26 @@ Instructions:
 3. Be concise and clear in your responses.
 4. Do not make up information that is not in the context.
 5. Format any code or technical terms appropriately using markdown.
+6. Give a comprehensive answer and cite sources using the format [1], [2], etc. corresponding to the numbered sources in the context.
+"""
+
+# Domain agents used when a query is not scoped to a single domain
+DOMAIN_AGENTS = {
+    "ai": "Artificial Intelligence",
+    "cloud": "Cloud Computing",
+    "virt-os": "Virtualisation/OS",
+}
+
+# System prompt for merging the drafts of several domain agents
+SYNTHESIS_PROMPT = """
+You are CommandCore, an AI assistant that combines draft answers written by domain specialists (AI, cloud computing, virtualization/OS) into one answer.
+
+Instructions:
+1. Only use information contained in the drafts.
+2. Merge overlapping points and resolve the perspectives of the different domains into a single coherent answer.
+3. Keep every citation in the format [1], [2], etc. exactly as it appears in the drafts.
+4. Ignore drafts that say they don't have enough information.
+5. Format any code or technical terms appropriately using markdown.
 """
 
 
@@ -27,42 +50,105 @@ def create_agent():
     return client
 
 
-async def get_agent_response(query: str, context: str, chunks: List[KnowledgeChunk]) -> str:
-    """Get a response from the agent for the given query and context."""
-    # Format the sources for citation
+async def _chat_completion(system_prompt: str, user_prompt: str) -> Tuple[str, Any]:
+    """
+    Run a chat completion through the resilience layer, falling back to a
+    cheaper model. Returns the model that was asked along with the response.
+    """
+    async def call(model: str, timeout: float):
+        return model, await client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.1,  # Lower temperature for more deterministic responses
+            max_tokens=1000,
+            timeout=timeout
+        )
+    
+    async with llm_slots.slot():
+        model, response = await call_openai(
+            "chat",
+            settings.OPENAI_MODEL,
+            call,
+            timeout=settings.OPENAI_CHAT_TIMEOUT,
+            fallback_model=settings.OPENAI_FALLBACK_MODEL
+        )
+    if response.usage is not None:
+        LLM_TOKENS.labels(model=response.model, kind="prompt").inc(response.usage.prompt_tokens)
+        LLM_TOKENS.labels(model=response.model, kind="completion").inc(response.usage.completion_tokens)
+        record_tokens(response.usage.prompt_tokens, response.usage.completion_tokens)
+    return model, response
+
+
+async def complete_chat(system_prompt: str, user_prompt: str) -> str:
+    """Run a chat completion and return the answer text."""
+    _, response = await _chat_completion(system_prompt, user_prompt)
+    return response.choices[0].message.content
+
+
+async def get_agent_response(query: str, context: PackedContext, domain: Optional[str] = None) -> str:
+    """
+    Get a response from the agent for the given query and packed context.
+    When a domain is given the agent answers as that domain's specialist.
+    Answers are reused for the same normalized query over the same context.
+    """
+    key = None
+    if settings.ANSWER_CACHE_ENABLED:
+        key = answer_key(query, settings.OPENAI_MODEL, PROMPT_VERSION, context, domain)
+        cached = await get_answer(key)
+        if cached is not None:
+            return cached
+    
+    # Static instructions first so upstream prompt-prefix caching can reuse them
+    system_prompt = SYSTEM_PROMPT
+    if domain in DOMAIN_AGENTS:
+        system_prompt += f"Answer from the perspective of a {DOMAIN_AGENTS[domain]} specialist.\n"
+    
+    # Format the sources for citation, one entry per source document
     sources = []
-    for i, chunk in enumerate(chunks):
-        title = chunk.source_info.get("title", "Unknown")
-        author = chunk.source_info.get("author", "Unknown")
-        date = chunk.source_info.get("publication_date", "Unknown")
-        sources.append(f"[{i+1}] {title} by {author}, {date}")
+    for source in context.sources:
+        sources.append(f"[{source.number}] {source.title} by {source.author}, {source.publication_date}")
     
     sources_text = "\n".join(sources)
     
-    # Create the prompt with context and query
+    # The question goes last: it is the part that varies most between requests
     user_prompt = f"""
-Question: {query}
-
 Context:
-{context}
+{context.text}
 
 Available Sources:
 {sources_text}
 
-Please provide a comprehensive answer to the question based on the context provided. 
-Cite sources using the format [1], [2], etc. corresponding to the source numbers above.
+Question: {query}
 """
     
     # Call the OpenAI API
-    response = await client.chat.completions.create(
-        model=settings.OPENAI_MODEL,
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt}
-        ],
-        temperature=0.1,  # Lower temperature for more deterministic responses
-        max_tokens=1000
+    model, response = await _chat_completion(system_prompt, user_prompt)
+    answer = response.choices[0].message.content
+    # Answers from the fallback model are not kept once the primary recovers
+    if key is not None and answer and model == settings.OPENAI_MODEL:
+        await put_answer(key, answer)
+    return answer
+
+
+async def synthesize_response(query: str, drafts: Dict[str, str]) -> str:
+    """Merge the drafts of several domain agents into a single answer."""
+    if len(drafts) == 1:
+        return next(iter(drafts.values()))
+    
+    drafts_text = "\n\n".join(
+        f"Draft from the {DOMAIN_AGENTS.get(domain, domain)} specialist:\n{draft}"
+        for domain, draft in drafts.items()
     )
     
-    # Return the generated response
-    return response.choices[0].message.content
+    user_prompt = f"""
+Question: {query}
+
+{drafts_text}
+
+Please combine these drafts into one comprehensive answer to the question.
+"""
+    
+    return await complete_chat(SYNTHESIS_PROMPT, user_prompt)
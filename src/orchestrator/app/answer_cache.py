@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+import psycopg2
+from .config import settings
+from .admission import Overloaded
+from .db_router import router, get_read_connection, release_connection
+from .metrics import CACHE_HITS
+from .schemas import PackedContext
+from .coalesce import normalize_query
+
+
+logger = logging.getLogger(__name__)
+
+
+def answer_key(query: str, model: str, prompt_version: str, context: PackedContext, domain: Optional[str] = None) -> Tuple:
+    """
+    Key an answer by everything that goes into its prompt: the normalized
+    question, model, prompt version, agent domain, the chunk IDs and a digest
+    of the exact context and source list. Re-ingested or edited chunks change
+    the digest, so stale answers are never served.
+    """
+    digest = hashlib.sha256(context.text.encode())
+    for source in context.sources:
+        digest.update(f"\x00{source.number}|{source.title}|{source.author}|{source.publication_date}".encode())
+    return (
+        normalize_query(query),
+        model,
+        prompt_version,
+        domain,
+        tuple(sorted(context.chunk_ids)),
+        digest.hexdigest(),
+    )
+
+
+class AnswerCache:
+    """
+    In-process LRU cache of generated answers with a TTL, in front of the
+    answer_cache table every worker shares.
+
+    Hits skip the chat completion entirely; entries expire after `ttl`
+    seconds (or the TTL they are put with) and the least recently used ones
+    are dropped beyond `max_size`.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self._entries: "OrderedDict[Tuple, Tuple[float, str]]" = OrderedDict()
+        self.max_size = max_size
+        self.ttl = ttl
+
+    def get(self, key: Tuple) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        CACHE_HITS.labels(cache="answers").inc()
+        return entry[1]
+
+    def put(self, key: Tuple, answer: str, ttl: Optional[float] = None):
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+answer_cache = AnswerCache(settings.ANSWER_CACHE_SIZE, settings.ANSWER_CACHE_TTL)
+
+
+def _digest(key: Tuple) -> str:
+    return hashlib.sha256(repr(key).encode()).hexdigest()
+
+
+def _load_shared(key: Tuple) -> Optional[Tuple[str, float]]:
+    conn = get_read_connection()
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """
+                SELECT answer, EXTRACT(EPOCH FROM expires_at - NOW())
+                FROM answer_cache
+                WHERE key_digest = %s AND expires_at > NOW()
+                """,
+                (_digest(key),)
+            )
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+    finally:
+        release_connection(conn)
+    return (row[0], float(row[1])) if row else None
+
+
+def _store_shared(key: Tuple, answer: str):
+    # An answer another worker already shares is left as it is, so only a
+    # missing or expired row costs a write on the primary
+    conn = router.connect_primary()
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """
+                INSERT INTO answer_cache (key_digest, answer, expires_at)
+                VALUES (%s, %s, NOW() + %s * INTERVAL '1 second')
+                ON CONFLICT (key_digest) DO UPDATE
+                SET answer = EXCLUDED.answer, expires_at = EXCLUDED.expires_at
+                WHERE answer_cache.expires_at <= NOW()
+                """,
+                (_digest(key), answer, settings.ANSWER_CACHE_TTL)
+            )
+            conn.commit()
+        finally:
+            cursor.close()
+    finally:
+        router.release(conn)
+
+
+async def get_answer(key: Tuple) -> Optional[str]:
+    """
+    Look an answer up in this worker's cache, then in the shared table.
+    The shared table being unavailable counts as a miss.
+    """
+    answer = answer_cache.get(key)
+    if answer is not None or not settings.ANSWER_CACHE_SHARED:
+        return answer
+    try:
+        shared = await asyncio.to_thread(_load_shared, key)
+    except (psycopg2.Error, Overloaded) as e:
+        logger.warning("Could not read the shared answer cache: %s", e)
+        return None
+    if shared is None:
+        return None
+    answer, ttl = shared
+    answer_cache.put(key, answer, ttl)
+    CACHE_HITS.labels(cache="answers_shared").inc()
+    return answer
+
+
+async def put_answer(key: Tuple, answer: str):
+    """Keep an answer in this worker's cache and share it with the others."""
+    answer_cache.put(key, answer)
+    if not settings.ANSWER_CACHE_SHARED:
+        return
+    try:
+        await asyncio.to_thread(_store_shared, key, answer)
+    except (psycopg2.Error, Overloaded) as e:
+        logger.warning("Could not write the shared answer cache: %s", e)
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from .metrics import EMBEDDING_BATCH_SIZE
+
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Merge concurrent single-input calls into one multi-input call.
+
+    The first request opens a batch; requests arriving within `window`
+    seconds join it, and it is sent as soon as it holds `max_batch` inputs
+    or the window closes. `send(inputs)` must return one result per input,
+    in order. Identical inputs in a batch share one slot, and a failed batch,
+    or one returning the wrong number of results, fails every request in it.
+    The batch runs in the context of the request that opened it (request
+    budget, priority).
+    """
+
+    def __init__(self, send: Callable[[List[str]], Awaitable[List]], window: float, max_batch: int):
+        self._send = send
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self.batches = 0
+        self.inputs = 0
+
+    async def submit(self, text: str):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(text, []).append(future)
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        task = asyncio.ensure_future(self._run(batch))
+        # Keep a reference until it finishes; the loop only holds weak ones
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    def _waiters(batch: Dict[str, List[asyncio.Future]]):
+        # A waiter whose request was cancelled no longer needs an outcome
+        return [future for futures in batch.values() for future in futures if not future.done()]
+
+    async def _run(self, batch: Dict[str, List[asyncio.Future]]):
+        texts = list(batch)
+        self.batches += 1
+        self.inputs += len(texts)
+        EMBEDDING_BATCH_SIZE.observe(len(texts))
+        try:
+            results = await self._send(texts)
+            if len(results) != len(texts):
+                raise ValueError(f"Batch call returned {len(results)} results for {len(texts)} inputs")
+        except asyncio.CancelledError:
+            for future in self._waiters(batch):
+                future.cancel()
+            raise
+        except Exception as e:
+            for future in self._waiters(batch):
+                future.set_exception(e)
+            return
+        for text, result in zip(texts, results):
+            for future in batch[text]:
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "inputs": self.inputs,
+            "mean_batch_size": round(self.inputs / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,92 @@
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from .config import settings
+from .metrics import CACHE_HITS
+from .schemas import QueryRequest
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query so trivially different spellings share a key."""
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+
+def retrieval_profile() -> str:
+    """Describe the settings that change what a query pipeline returns."""
+    return (
+        f"rerank={settings.RERANK_ENABLED}:{settings.RERANK_CANDIDATES}:{settings.RERANK_TOP_K}:{settings.MMR_LAMBDA}"
+        f"|multi_agent={settings.MULTI_AGENT_ENABLED}|budget={settings.CONTEXT_TOKEN_BUDGET}|model={settings.OPENAI_MODEL}"
+    )
+
+
+def query_scope(query_request: QueryRequest) -> Tuple:
+    """Everything besides its text that decides a query's answer."""
+    return (
+        query_request.domain or None,
+        query_request.read_after_lsn,
+        query_request.filters.json() if query_request.filters else None,
+        retrieval_profile()
+    )
+
+
+def query_key(query_request: QueryRequest) -> Tuple:
+    """Key under which identical concurrent queries share a pipeline run."""
+    return (normalize_query(query_request.query),) + query_scope(query_request)
+
+
+class SingleFlight:
+    """
+    Share one running pipeline between concurrent identical requests.
+
+    The first request for a key starts the work; requests arriving while it
+    runs await the same task and receive the same result or exception. The
+    task is shielded so a disconnecting caller does not cancel it for the
+    others. Per-key counters are kept for the most recent keys only.
+    """
+
+    def __init__(self, max_tracked_keys: int = 1000):
+        self._in_flight: Dict[Tuple, asyncio.Future] = {}
+        self._key_stats: "OrderedDict[Tuple, Dict[str, int]]" = OrderedDict()
+        self._max_tracked_keys = max_tracked_keys
+        self.executions = 0
+        self.coalesced = 0
+
+    def _record(self, key: Tuple, coalesced: bool):
+        stats = self._key_stats.pop(key, None) or {"requests": 0, "coalesced": 0}
+        stats["requests"] += 1
+        if coalesced:
+            stats["coalesced"] += 1
+            self.coalesced += 1
+            CACHE_HITS.labels(cache="coalesced").inc()
+        else:
+            self.executions += 1
+        self._key_stats[key] = stats
+        while len(self._key_stats) > self._max_tracked_keys:
+            self._key_stats.popitem(last=False)
+
+    async def run(self, key: Tuple, work: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        if task is not None:
+            self._record(key, coalesced=True)
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(work())
+        self._in_flight[key] = task
+        task.add_done_callback(lambda done: self._in_flight.pop(key) if self._in_flight.get(key) is done else None)
+        self._record(key, coalesced=False)
+        return await asyncio.shield(task)
+
+    def stats(self, top: Optional[int] = 20) -> Dict[str, Any]:
+        keys = sorted(self._key_stats.items(), key=lambda item: item[1]["coalesced"], reverse=True)
+        return {
+            "in_flight": len(self._in_flight),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "top_keys": [
+                {"query": key[0], "domain": key[1], **stats}
+                for key, stats in keys[:top]
+            ],
+        }
+
+
+query_flights = SingleFlight()
@@ -10,14 +10,146 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "postgrespassword")
     POSTGRES_DB: str = os.getenv("POSTGRES_DB", "commandcore")
     
+    # Read replica routing (comma-separated host[:port]; empty = read from POSTGRES_HOST)
+    POSTGRES_READ_HOSTS: str = os.getenv("POSTGRES_READ_HOSTS", "")
+    DB_CONNECT_TIMEOUT: int = 3                # Seconds before a replica counts as unreachable
+    DB_REPLICA_MAX_LAG_SECONDS: float = 10.0   # Replicas further behind are taken out of rotation
+    DB_REPLICA_RETRY_SECONDS: float = 30.0     # How long an unhealthy replica is skipped
+    DB_HEALTH_CHECK_INTERVAL: float = 5.0
+    DB_POOL_MIN: int = 2                       # Connections opened per host at startup
+    DB_POOL_MAX: int = 40                      # Keep above ADMISSION_MAX_QUERIES; checkouts past it get a 503
+    
+    # Warm start (see /ready)
+    DB_PREWARM_ENABLED: bool = os.getenv("DB_PREWARM_ENABLED", "false").lower() == "true"
+    DB_PREWARM_RELATIONS: str = "knowledge_chunks_embedding_idx,knowledge_chunks"  # Loaded with pg_prewarm on every host
+    WARMUP_OPENAI: bool = False                # Send one embedding request at startup to open the HTTP connection
+    WARMUP_RETRY_SECONDS: float = 2.0          # Delay between attempts to reach the database at startup
+    
     # OpenAI settings
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4-turbo")
+    OPENAI_FALLBACK_MODEL: str = os.getenv("OPENAI_FALLBACK_MODEL", "gpt-3.5-turbo")  # Used while OPENAI_MODEL is failing
+    OPENAI_EMBEDDING_MODEL: str = "text-embedding-ada-002"
+    
+    # Upstream resilience settings
+    REQUEST_BUDGET_SECONDS: float = 60.0     # Total time all OpenAI calls of one query may use
+    OPENAI_CHAT_TIMEOUT: float = 45.0        # Per-attempt timeout for completions
+    OPENAI_EMBEDDING_TIMEOUT: float = 10.0   # Per-attempt timeout for embeddings
+    OPENAI_MAX_RETRIES: int = 2
+    OPENAI_RETRY_BACKOFF: float = 0.25       # Seconds, doubled per retry
+    OPENAI_HEDGE_OPERATIONS: str = "embedding,chat"  # Calls that get a hedged duplicate after their p95
+    OPENAI_HEDGE_MIN_SAMPLES: int = 20       # Latency samples needed before hedging starts
+    OPENAI_BREAKER_WINDOW: int = 20          # Recent calls considered by the circuit breaker
+    OPENAI_BREAKER_MIN_CALLS: int = 10
+    OPENAI_BREAKER_ERROR_RATE: float = 0.5
+    OPENAI_BREAKER_COOLDOWN: float = 30.0    # Seconds an open circuit fails fast
+    
+    # Sampling profiler for slow or explicitly profiled (X-Profile: 1) queries
+    PROFILE_SLOW_THRESHOLD_MS: float = 5000.0  # Queries slower than this keep their stage timings as a trace; 0 disables. Stacks are only sampled with X-Profile
+    PROFILE_SAMPLE_INTERVAL_MS: float = 10.0   # Stack sampling period
+    PROFILE_TRACE_BUFFER: int = 50             # Traces kept for /v1/system/traces
+
+    # Logging settings
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")  # "json" or "text"
     
     # Application settings
     MAX_CHUNKS: int = 10
     SIMILARITY_THRESHOLD: float = 0.7
 
+    # Context assembly settings
+    CONTEXT_TOKEN_BUDGET: int = 3000      # Maximum prompt tokens spent on retrieved context
+    CONTEXT_MIN_PASSAGE_TOKENS: int = 50  # Don't add truncated passages shorter than this
+    CONTEXT_MAX_OVERLAP_CHARS: int = 2000 # Upper bound when searching for duplicated chunk overlap
+
+    # Retrieval searches run in a worker thread per connection
+    RETRIEVAL_STATEMENT_TIMEOUT_MS: int = 5000  # Caps each search statement, also one a timed-out caller left running; 0 = none
+
+    # Metadata-filtered retrieval (QueryRequest.filters)
+    FILTER_EXACT_MAX_ROWS: int = 5000         # Filtered subsets up to this many chunks are searched exactly
+    FILTER_HNSW_EF_SEARCH: int = 200          # hnsw.ef_search for filtered index scans
+    FILTER_HNSW_MAX_SCAN_TUPLES: int = 20000  # Stop an iterative filtered index scan after this many tuples
+
+    # Reranking settings
+    RERANK_ENABLED: bool = True
+    RERANK_CANDIDATES: int = 20           # Candidates over-fetched from the database
+    RERANK_TOP_K: int = 5                 # Chunks kept after MMR selection
+    MMR_LAMBDA: float = 0.7               # 1.0 = pure relevance, 0.0 = pure diversity
+    RERANK_CROSS_ENCODER_MODEL: str = ""  # Optional local cross-encoder, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2
+
+    # Multi-agent settings for queries without a domain
+    MULTI_AGENT_ENABLED: bool = True
+    DOMAIN_AGENT_TIMEOUT: float = 20.0    # Seconds a single domain agent may take
+
+    # Share one pipeline run between identical concurrent queries
+    QUERY_COALESCING_ENABLED: bool = True
+
+    # Document metadata cache (source_info is stored once per document)
+    DOCUMENT_CACHE_SIZE: int = 10000         # Documents kept in memory
+    DOCUMENT_CACHE_TTL: float = 300.0        # Seconds before a document's metadata is re-read
+
+    # Route unscoped queries to their likely domains via per-domain centroids
+    DOMAIN_ROUTING_ENABLED: bool = True
+    DOMAIN_ROUTING_CONFIDENCE: float = 0.8   # Probability the routed domains must cover, else search globally
+    DOMAIN_ROUTING_MAX_DOMAINS: int = 2      # Domains searched for a routed query
+    DOMAIN_ROUTING_TEMPERATURE: float = 0.02 # Softmax temperature over query-centroid cosine similarity
+    DOMAIN_ROUTING_MIN_CHUNKS: int = 50      # Domains with fewer chunks are not routed to
+    DOMAIN_ROUTING_REFRESH: float = 60.0     # Seconds between centroid reloads
+
+    # Exact answer cache keyed by query, model, prompt version and packed context
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIZE: int = 5000            # Answers kept in memory per worker
+    ANSWER_CACHE_SHARED: bool = True         # Also share answers between workers through Postgres
+    ANSWER_CACHE_TTL: float = 3600.0         # Seconds an answer may be reused
+
+    # Query log, written in batches in the background
+    QUERY_LOG_ENABLED: bool = True
+    QUERY_LOG_FLUSH_INTERVAL: float = 2.0    # Seconds between batched writes
+    QUERY_LOG_BATCH_SIZE: int = 500          # Rows per INSERT
+    QUERY_LOG_MAX_BUFFER: int = 10000        # Oldest unwritten rows are dropped beyond this
+    QUERY_LOG_RETENTION_DAYS: int = 30       # Older rows are pruned by the hot query job
+
+    # Precomputed answers for the most frequently asked questions, mined from the query log
+    HOT_QUERIES_ENABLED: bool = True
+    HOT_QUERY_TOP_N: int = 200               # Questions kept per domain (unscoped queries count as one domain)
+    HOT_QUERY_MIN_COUNT: int = 3             # Requests within the window before a question is precomputed
+    HOT_QUERY_WINDOW_HOURS: float = 168.0    # Query log window mined for hot questions
+    HOT_QUERY_REFRESH_INTERVAL: float = 300.0  # Seconds between mining runs
+    HOT_QUERY_REFRESH_BATCH: int = 50        # Answers (re)computed per run, bounding LLM spend
+    HOT_QUERY_SYNC_INTERVAL: float = 30.0    # Seconds between staleness checks and reloads of fresh answers; also the longest a stale one is served
+    HOT_ANSWER_CHECK_MAX_CHANGES: int = 500  # Chunks changed in a domain per check above which its answers are recomputed instead of compared
+
+    # Speculative retrieval for the draft a user is still typing (/v1/query/prefetch)
+    PREFETCH_ENABLED: bool = True
+    PREFETCH_TTL: float = 30.0               # Seconds a prefetched retrieval may be reused
+    PREFETCH_SIMILARITY: float = 0.95        # Cosine similarity at which an edited final query still reuses it
+    PREFETCH_MAX_SESSIONS: int = 1000        # Sessions whose prefetch is kept
+    PREFETCH_MAX_CONCURRENCY: int = 8        # Prefetches running at once; further drafts are skipped
+
+    # Admission control: bounded concurrency per stage and a priority wait queue
+    ADMISSION_MAX_QUERIES: int = 32          # Query pipelines running at once (each holds a DB connection)
+    ADMISSION_QUEUE_SIZE: int = 64           # Queued queries before interactive requests get a 429
+    ADMISSION_BATCH_QUEUE_SIZE: int = 16     # Queued queries before batch requests get a 429
+    ADMISSION_QUEUE_TIMEOUT: float = 10.0    # Seconds a query may wait before a 503
+    LLM_MAX_CONCURRENCY: int = 16            # Chat completions in flight
+    EMBEDDING_MAX_CONCURRENCY: int = 32      # Embedding calls in flight
+
+    # Query embedding micro-batching: concurrent queries share one embeddings request
+    EMBEDDING_BATCH_ENABLED: bool = True
+    EMBEDDING_BATCH_WINDOW_MS: float = 3.0   # How long the first query waits for others to join
+    EMBEDDING_BATCH_MAX_SIZE: int = 64       # Inputs per request; a full batch is sent at once
+
+    # In-process vector index replica (falls back to SQL when disabled or stale)
+    VECTOR_INDEX_ENABLED: bool = os.getenv("VECTOR_INDEX_ENABLED", "false").lower() == "true"
+    VECTOR_INDEX_DIR: str = "/app/data/vector_index"
+    VECTOR_INDEX_NPROBE: int = 8             # IVF lists scanned per query
+    VECTOR_INDEX_MIN_IVF_ROWS: int = 10000   # Below this the snapshot is one exact list
+    VECTOR_INDEX_TRAIN_SAMPLE: int = 20000   # Vectors sampled to train the IVF centroids
+    VECTOR_INDEX_SYNC_INTERVAL: float = 2.0  # Seconds between change table polls
+    VECTOR_INDEX_SYNC_BATCH: int = 5000      # Changes read per poll
+    VECTOR_INDEX_REBUILD_DELTA: int = 5000   # Rebuild the snapshot once this many rows changed
+    VECTOR_INDEX_MAX_STALENESS: float = 30.0 # Seconds without a sync before queries go to SQL
+
     class Config:
         env_file = ".env"
 
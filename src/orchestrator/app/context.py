@@ -0,0 +1,164 @@
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+import tiktoken
+from .config import settings
+from .schemas import KnowledgeChunk, ContextSource, PackedContext
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model: Optional[str] = None):
+    """Return the tokenizer for the chat model, falling back to cl100k_base."""
+    try:
+        return tiktoken.encoding_for_model(model or settings.OPENAI_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str) -> int:
+    """Count prompt tokens for the configured chat model."""
+    return len(get_tokenizer().encode(text))
+
+
+def _document_key(chunk: KnowledgeChunk) -> str:
+    """Key identifying the document a chunk was cut from."""
+    document_id = chunk.document_id or chunk.metadata.get("document_id")
+    if document_id:
+        return str(document_id)
+    return chunk.source_info.get("title", "Unknown")
+
+
+def _strip_overlap(previous: str, following: str, max_chars: int) -> str:
+    """
+    Remove the prefix of `following` that repeats the tail of `previous`.
+    Chunks are decoded from overlapping token windows, so the shared text is
+    an exact suffix/prefix match.
+    """
+    limit = min(len(previous), len(following), max_chars)
+    for size in range(limit, 0, -1):
+        if previous.endswith(following[:size]):
+            return following[size:]
+    return following
+
+
+def merge_chunks(chunks: List[KnowledgeChunk]) -> List[Dict[str, Any]]:
+    """
+    Group chunks per document and merge neighbouring chunks into passages.
+
+    Chunks carrying `start_token`/`end_token` metadata are ordered by position;
+    touching or overlapping windows are joined with the duplicated overlap
+    removed. Passages keep the best similarity of their chunks.
+    """
+    max_overlap_chars = settings.CONTEXT_MAX_OVERLAP_CHARS
+    groups: Dict[str, List[KnowledgeChunk]] = {}
+    for chunk in chunks:
+        groups.setdefault(_document_key(chunk), []).append(chunk)
+
+    passages = []
+    for key, group in groups.items():
+        positioned = [c for c in group if c.metadata.get("start_token") is not None]
+        unpositioned = [c for c in group if c.metadata.get("start_token") is None]
+        positioned.sort(key=lambda c: c.metadata["start_token"])
+
+        current: Optional[Dict[str, Any]] = None
+        for chunk in positioned:
+            start = chunk.metadata["start_token"]
+            end = chunk.metadata.get("end_token", start)
+            if current is not None and start <= current["end_token"]:
+                if end > current["end_token"]:
+                    current["text"] += _strip_overlap(current["text"], chunk.text, max_overlap_chars)
+                    current["end_token"] = end
+                current["chunk_ids"].append(chunk.id)
+                current["similarity"] = max(current["similarity"], chunk.similarity)
+                continue
+            if current is not None:
+                passages.append(current)
+            current = {
+                "document_key": key,
+                "source_info": chunk.source_info,
+                "text": chunk.text,
+                "end_token": end,
+                "chunk_ids": [chunk.id],
+                "similarity": chunk.similarity,
+            }
+        if current is not None:
+            passages.append(current)
+
+        seen_texts = set()
+        for chunk in unpositioned:
+            if chunk.text in seen_texts:
+                continue
+            seen_texts.add(chunk.text)
+            passages.append({
+                "document_key": key,
+                "source_info": chunk.source_info,
+                "text": chunk.text,
+                "end_token": None,
+                "chunk_ids": [chunk.id],
+                "similarity": chunk.similarity,
+            })
+
+    return passages
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> Tuple[str, int]:
+    """Cut text down to at most max_tokens tokens."""
+    encoder = get_tokenizer()
+    tokens = encoder.encode(text)
+    if len(tokens) <= max_tokens:
+        return text, len(tokens)
+    return encoder.decode(tokens[:max_tokens]), max_tokens
+
+
+def pack_context(chunks: List[KnowledgeChunk], token_budget: Optional[int] = None) -> PackedContext:
+    """
+    Assemble the prompt context from retrieved chunks.
+
+    Overlapping chunks of the same document are merged, citations are grouped
+    per source and passages are added in order of relevance until the token
+    budget is spent. The last passage that does not fit is truncated when
+    enough room is left for it to be useful.
+    """
+    budget = token_budget if token_budget is not None else settings.CONTEXT_TOKEN_BUDGET
+    passages = merge_chunks(chunks)
+    passages.sort(key=lambda p: p["similarity"], reverse=True)
+
+    sources: Dict[str, ContextSource] = {}
+    sections = []
+    used_tokens = 0
+    used_chunk_ids = []
+    separator_tokens = count_tokens("\n\n")
+
+    for passage in passages:
+        key = passage["document_key"]
+        source = sources.get(key)
+        number = source.number if source else len(sources) + 1
+        header = f"[{number}] "
+        remaining = budget - used_tokens - count_tokens(header)
+        if sections:
+            remaining -= separator_tokens
+        if remaining < settings.CONTEXT_MIN_PASSAGE_TOKENS:
+            break
+
+        text, text_tokens = _truncate_to_tokens(passage["text"], remaining)
+        if source is None:
+            info = passage["source_info"]
+            source = ContextSource(
+                number=number,
+                title=info.get("title", "Unknown Source"),
+                author=info.get("author", "Unknown Author"),
+                publication_date=info.get("publication_date", "Unknown Date"),
+                url=info.get("url"),
+            )
+            sources[key] = source
+        source.chunk_ids.extend(passage["chunk_ids"])
+        used_chunk_ids.extend(passage["chunk_ids"])
+
+        sections.append(header + text)
+        used_tokens += count_tokens(header) + text_tokens + (separator_tokens if len(sections) > 1 else 0)
+
+    return PackedContext(
+        text="\n\n".join(sections),
+        sources=list(sources.values()),
+        token_count=used_tokens,
+        chunk_ids=used_chunk_ids,
+    )
@@ -0,0 +1,286 @@
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from typing import List, Dict, Optional, Set, Tuple
+import psycopg2
+from psycopg2 import pool as pg_pool
+from .config import settings
+from .admission import Overloaded
+
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_hosts(value: str) -> List[Tuple[str, str]]:
+    """Parse a comma-separated list of host[:port] entries."""
+    hosts = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, _, port = entry.partition(":")
+        hosts.append((host, port or settings.POSTGRES_PORT))
+    return hosts
+
+
+def _connect_kwargs(host: str, port: str) -> Dict[str, object]:
+    return dict(
+        host=host,
+        port=port,
+        user=settings.POSTGRES_USER,
+        password=settings.POSTGRES_PASSWORD,
+        dbname=settings.POSTGRES_DB,
+        connect_timeout=settings.DB_CONNECT_TIMEOUT
+    )
+
+
+def _connect(host: str, port: str):
+    return psycopg2.connect(**_connect_kwargs(host, port))
+
+
+class DatabaseRouter:
+    """
+    Route retrieval reads across read replicas and everything else to the primary.
+
+    Replicas are used round-robin. A replica that fails to connect, or that a
+    health check finds lagging more than DB_REPLICA_MAX_LAG_SECONDS behind, is
+    skipped until it recovers. Reads fall back to the primary when no replica
+    is usable.
+
+    Connections come from a pool per host and go back with release(). Once
+    DB_POOL_MAX of a host's connections are checked out, further checkouts
+    raise Overloaded (503) rather than an internal error.
+
+    The pool of a replica taken out of rotation drains: requests still
+    holding its connections finish, each connection is closed on release,
+    and the pool once it is empty.
+
+    Checkouts may connect or wait on a replica, so async code checks out
+    through acquire_read_connection / acquire_primary_connection, which run
+    them in a worker thread; pools are only changed under the lock.
+    """
+
+    def __init__(self, primary: Tuple[str, str], replicas: List[Tuple[str, str]]):
+        self.primary = primary
+        self.replicas = replicas
+        self._down_until: Dict[Tuple[str, str], float] = {}
+        self._counter = itertools.count()
+        self._pools: Dict[Tuple[str, str], pg_pool.ThreadedConnectionPool] = {}
+        self._owners: Dict[int, pg_pool.ThreadedConnectionPool] = {}
+        self._draining: Set[pg_pool.ThreadedConnectionPool] = set()
+        self._lock = threading.Lock()
+
+    def _mark_down(self, replica: Tuple[str, str]):
+        self._down_until[replica] = time.monotonic() + settings.DB_REPLICA_RETRY_SECONDS
+        # Pooled connections to a failed host are likely dead too, but the
+        # ones checked out are left to the requests using them
+        with self._lock:
+            stale = self._pools.pop(replica, None)
+            if stale is not None:
+                self._draining.add(stale)
+        if stale is not None:
+            self._close_if_drained(stale)
+
+    def _close_if_drained(self, pool: pg_pool.ThreadedConnectionPool):
+        with self._lock:
+            if pool not in self._draining or any(owner is pool for owner in list(self._owners.values())):
+                return
+            self._draining.discard(pool)
+        pool.closeall()
+
+    def healthy_replicas(self) -> List[Tuple[str, str]]:
+        now = time.monotonic()
+        return [r for r in self.replicas if self._down_until.get(r, 0) <= now]
+
+    def _pool(self, host: Tuple[str, str]) -> pg_pool.ThreadedConnectionPool:
+        pool = self._pools.get(host)
+        if pool is not None:
+            return pool
+        # Opened outside the lock, which release() also takes; a pool opened
+        # concurrently for the same host is closed in favour of the first
+        pool = pg_pool.ThreadedConnectionPool(settings.DB_POOL_MIN, settings.DB_POOL_MAX, **_connect_kwargs(*host))
+        with self._lock:
+            current = self._pools.setdefault(host, pool)
+        if current is not pool:
+            pool.closeall()
+        return current
+
+    def _checkout(self, host: Tuple[str, str]):
+        pool = self._pool(host)
+        try:
+            conn = pool.getconn()
+            if conn.closed:
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+        except pg_pool.PoolError as e:
+            # Every connection is checked out; shed load like the admission queue does
+            raise Overloaded(f"Database connection pool for {host[0]}:{host[1]} exhausted: {e}", retry_after=1, status_code=503)
+        self._owners[id(conn)] = pool
+        return conn
+
+    def release(self, conn):
+        """Return a connection to its pool, discarding it if it is broken or its pool is draining."""
+        pool = self._owners.pop(id(conn), None)
+        if pool is None or pool.closed:
+            conn.close()
+            return
+        draining = pool in self._draining
+        discard = bool(conn.closed) or draining
+        if not discard:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        try:
+            pool.putconn(conn, close=discard)
+        except pg_pool.PoolError:
+            # The pool was closed while the connection was out
+            conn.close()
+        if draining:
+            self._close_if_drained(pool)
+
+    def warm_pools(self):
+        """
+        Open DB_POOL_MIN connections to the primary and every replica. Raises
+        if the primary is unreachable; unreachable replicas are marked down.
+        """
+        self._pool(self.primary)
+        for replica in self.replicas:
+            try:
+                self._pool(replica)
+            except psycopg2.OperationalError as e:
+                logger.warning("Read replica %s:%s unavailable at startup: %s", replica[0], replica[1], e)
+                self._mark_down(replica)
+
+    def hosts(self) -> List[Tuple[str, str]]:
+        return [self.primary] + self.healthy_replicas()
+
+    def connect_host(self, host: Tuple[str, str]):
+        return self._checkout(host)
+
+    def connect_primary(self):
+        return self._checkout(self.primary)
+
+    def connect_read(self, min_lsn: Optional[str] = None):
+        """
+        Connect to a healthy replica. With min_lsn (read-your-writes), only a
+        replica that has replayed WAL up to that position qualifies.
+        """
+        replicas = self.healthy_replicas()
+        if replicas:
+            start = next(self._counter)
+            for offset in range(len(replicas)):
+                replica = replicas[(start + offset) % len(replicas)]
+                try:
+                    conn = self._checkout(replica)
+                except psycopg2.OperationalError as e:
+                    logger.warning("Read replica %s:%s unavailable: %s", replica[0], replica[1], e)
+                    self._mark_down(replica)
+                    continue
+                except Overloaded:
+                    # A busy replica is skipped, not taken out of rotation
+                    continue
+                try:
+                    replayed = min_lsn is None or self._has_replayed(conn, min_lsn)
+                except psycopg2.Error as e:
+                    self.release(conn)
+                    logger.warning("Could not check replay position of %s:%s: %s", replica[0], replica[1], e)
+                    continue
+                except BaseException:
+                    self.release(conn)
+                    raise
+                if replayed:
+                    return conn
+                self.release(conn)
+        return self.connect_primary()
+
+    @staticmethod
+    def _has_replayed(conn, lsn: str) -> bool:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn", (lsn,))
+            return bool(cursor.fetchone()[0])
+        finally:
+            cursor.close()
+
+    def check_health(self):
+        """Probe every replica and take lagging or unreachable ones out of rotation."""
+        for replica in self.replicas:
+            try:
+                conn = _connect(*replica)
+            except psycopg2.OperationalError:
+                self._mark_down(replica)
+                continue
+            try:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT CASE
+                        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+                    END
+                    """
+                )
+                lag = cursor.fetchone()[0]
+                cursor.close()
+                if lag is not None and lag > settings.DB_REPLICA_MAX_LAG_SECONDS:
+                    logger.warning("Read replica %s:%s is %.1fs behind, skipping it", replica[0], replica[1], lag)
+                    self._mark_down(replica)
+                else:
+                    self._down_until.pop(replica, None)
+            except psycopg2.Error:
+                self._mark_down(replica)
+            finally:
+                conn.close()
+
+
+router = DatabaseRouter(
+    primary=(settings.POSTGRES_HOST, settings.POSTGRES_PORT),
+    replicas=_parse_hosts(settings.POSTGRES_READ_HOSTS)
+)
+
+
+def get_read_connection(min_lsn: Optional[str] = None):
+    """Connection for retrieval reads, load-balanced across read replicas."""
+    return router.connect_read(min_lsn)
+
+
+def release_connection(conn):
+    """Give a connection from get_read_connection back to its pool."""
+    router.release(conn)
+
+
+async def _checkout_in_thread(checkout, *args):
+    future = asyncio.ensure_future(asyncio.to_thread(checkout, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # The checkout still completes; its connection goes straight back
+        future.add_done_callback(
+            lambda done: router.release(done.result()) if not done.cancelled() and done.exception() is None else None
+        )
+        raise
+
+
+async def acquire_read_connection(min_lsn: Optional[str] = None):
+    """get_read_connection, with connects and replay checks off the event loop."""
+    return await _checkout_in_thread(router.connect_read, min_lsn)
+
+
+async def acquire_primary_connection():
+    """A primary connection, checked out without blocking the event loop."""
+    return await _checkout_in_thread(router.connect_primary)
+
+
+async def run_replica_health_checks():
+    """Background task: keep the replica rotation up to date."""
+    while True:
+        try:
+            await asyncio.to_thread(router.check_health)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Error checking read replicas")
+        await asyncio.sleep(settings.DB_HEALTH_CHECK_INTERVAL)
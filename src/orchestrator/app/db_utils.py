@@ -1,10 +1,29 @@
 import psycopg2
-import psycopg2.extras
-from typing import List, Dict, Any, Optional
-import openai
+from typing import Callable, List, Dict, Any, Optional, Tuple
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from .config import settings
-from .schemas import KnowledgeChunk
+from .schemas import KnowledgeChunk, MetadataFilter
+from .vectors import vector_literal, decode_vectors
+from .documents import document_cache
+from .rerank import rerank_chunks
+from .vector_index import get_vector_index
+from .resilience import client, call_openai
+from .metrics import CACHE_HITS, DOMAIN_ROUTING, FILTERED_SEARCH
+from .routing import domain_router
+from .admission import embedding_slots
+from .batching import MicroBatcher
+
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIMENSIONS = 1536
 
 
 def get_db_connection():
@@ -19,19 +38,330 @@ def get_db_connection():
     return conn
 
 
+async def generate_embeddings(texts: List[str]) -> List[List[float]]:
+    """Embed several texts in one OpenAI request, returned in input order."""
+    async def call(model: str, timeout: float):
+        return await client.embeddings.create(model=model, input=texts, timeout=timeout)
+    
+    async with embedding_slots.slot():
+        response = await call_openai(
+            "embedding",
+            settings.OPENAI_EMBEDDING_MODEL,
+            call,
+            timeout=settings.OPENAI_EMBEDDING_TIMEOUT
+        )
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+embedding_batcher = MicroBatcher(
+    generate_embeddings,
+    window=settings.EMBEDDING_BATCH_WINDOW_MS / 1000,
+    max_batch=settings.EMBEDDING_BATCH_MAX_SIZE
+)
+
+
 async def generate_embedding(query: str) -> List[float]:
-    """Generate embedding for the query using OpenAI API."""
-    try:
-        client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-        response = await client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=query
+    """
+    Generate embedding for the query using OpenAI API.
+    Concurrent queries are batched into one request (EMBEDDING_BATCH_*).
+    Raises UpstreamUnavailable instead of searching with a meaningless zero vector.
+    """
+    if settings.EMBEDDING_BATCH_ENABLED:
+        return await embedding_batcher.submit(query)
+    return (await generate_embeddings([query]))[0]
+
+
+# Server-side prepared statement over the canonical find_similar_chunks.
+# Embeddings come back in pgvector's binary format to skip text parsing.
+RETRIEVAL_STATEMENT = "retrieve_similar_chunks"
+PREPARE_RETRIEVAL = f"""
+    PREPARE {RETRIEVAL_STATEMENT} (text, vector(1536), text, float8, int, boolean) AS
+    SELECT id, chunk_text, document_id::text, similarity, chunk_metadata, vector_send(embedding)
+    FROM find_similar_chunks($1, $2, $3, $4, $5, $6)
+"""
+
+# Pooled connections that already have the statement prepared
+_prepared_connections: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def _ensure_prepared(cursor):
+    conn = cursor.connection
+    if conn not in _prepared_connections:
+        cursor.execute(PREPARE_RETRIEVAL)
+        _prepared_connections.add(conn)
+
+
+def attach_source_info(cursor, chunks: List[KnowledgeChunk]):
+    """Fill in each chunk's document metadata, read once per document."""
+    documents = document_cache.get_many(cursor, [chunk.document_id for chunk in chunks if chunk.document_id])
+    for chunk in chunks:
+        chunk.source_info = documents.get(chunk.document_id, {})
+
+
+def search_similar_chunks(
+    cursor,
+    query: str,
+    query_embedding: List[float],
+    domain_filter: Optional[str] = None,
+    similarity_threshold: float = 0.7,
+    max_results: int = 5,
+    include_embeddings: bool = False,
+    filters: Optional[MetadataFilter] = None
+) -> Tuple[List[KnowledgeChunk], Optional[np.ndarray]]:
+    """
+    Search for the chunks most similar to the query embedding, optionally
+    only among chunks of documents matching the metadata filters.
+    Unscoped searches are narrowed to the domains the query is routed to,
+    falling back to the whole corpus when routing is unsure or finds nothing.
+    """
+    if filters is not None and filters.is_empty():
+        filters = None
+    if domain_filter is None and settings.DOMAIN_ROUTING_ENABLED:
+        domains = domain_router.route(cursor, query_embedding)
+        if domains:
+            results = [
+                _search_partition(
+                    cursor, query, query_embedding, domain, similarity_threshold, max_results, include_embeddings, filters
+                )
+                for domain in domains
+            ]
+            chunks, embeddings = _merge_results(results, max_results)
+            if chunks:
+                return chunks, embeddings
+            DOMAIN_ROUTING.labels(outcome="global_fallback_empty").inc()
+    return _search_partition(
+        cursor, query, query_embedding, domain_filter, similarity_threshold, max_results, include_embeddings, filters
+    )
+
+
+# One worker thread per pooled connection runs its searches in order
+_search_threads: "weakref.WeakKeyDictionary[Any, ThreadPoolExecutor]" = weakref.WeakKeyDictionary()
+_search_threads_lock = threading.Lock()
+
+
+def _search_thread(conn) -> ThreadPoolExecutor:
+    with _search_threads_lock:
+        executor = _search_threads.get(conn)
+        if executor is None:
+            executor = _search_threads[conn] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search")
+            weakref.finalize(conn, executor.shutdown, wait=False)
+        return executor
+
+
+async def run_in_search_thread(conn, query: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run query(cursor, *args, **kwargs) on `conn` in the connection's worker
+    thread, so a slow query neither blocks the event loop nor escapes the
+    timeouts of its caller. Queries sharing a connection, like the domain
+    agents' searches, run one after another. A query whose caller gave up
+    still runs to the end, each statement capped at
+    RETRIEVAL_STATEMENT_TIMEOUT_MS; see searches_finished.
+    """
+    def run():
+        cursor = conn.cursor()
+        try:
+            if settings.RETRIEVAL_STATEMENT_TIMEOUT_MS > 0:
+                # Local to the transaction, which ends when the connection is released
+                cursor.execute(
+                    "SELECT set_config('statement_timeout', %s, true)", (str(settings.RETRIEVAL_STATEMENT_TIMEOUT_MS),)
+                )
+            return query(cursor, *args, **kwargs)
+        finally:
+            cursor.close()
+
+    context = contextvars.copy_context()
+    return await asyncio.wrap_future(_search_thread(conn).submit(context.run, run))
+
+
+async def search_in_thread(conn, *args, **kwargs) -> Tuple[List[KnowledgeChunk], Optional[np.ndarray]]:
+    """search_similar_chunks on `conn`, run through run_in_search_thread."""
+    return await run_in_search_thread(conn, search_similar_chunks, *args, **kwargs)
+
+
+async def searches_finished(conn):
+    """Wait for the searches still running on `conn`; call before releasing it."""
+    with _search_threads_lock:
+        executor = _search_threads.get(conn)
+    if executor is not None:
+        await asyncio.wrap_future(executor.submit(lambda: None))
+
+
+def _merge_results(
+    results: List[Tuple[List[KnowledgeChunk], Optional[np.ndarray]]],
+    max_results: int
+) -> Tuple[List[KnowledgeChunk], Optional[np.ndarray]]:
+    """Combine per-domain results into the overall top max_results by similarity."""
+    chunks = [chunk for partition, _ in results for chunk in partition]
+    order = sorted(range(len(chunks)), key=lambda i: chunks[i].similarity, reverse=True)[:max_results]
+    embeddings = None
+    if results and results[0][1] is not None:
+        embeddings = np.concatenate([partition_embeddings for _, partition_embeddings in results])[order]
+    return [chunks[i] for i in order], embeddings
+
+
+def _search_partition(
+    cursor,
+    query: str,
+    query_embedding: List[float],
+    domain_filter: Optional[str],
+    similarity_threshold: float,
+    max_results: int,
+    include_embeddings: bool,
+    filters: Optional[MetadataFilter] = None
+) -> Tuple[List[KnowledgeChunk], Optional[np.ndarray]]:
+    """
+    Run find_similar_chunks and convert the rows, optionally with their embeddings.
+    Served from the in-process vector index replica when it is loaded and fresh.
+    Document metadata is attached from the document cache either way.
+    """
+    if filters is not None:
+        # The replica has no document metadata, so filtered searches always go to SQL
+        return _search_filtered(
+            cursor, query_embedding, domain_filter, filters, similarity_threshold, max_results, include_embeddings
         )
-        return response.data[0].embedding
-    except Exception as e:
-        print(f"Error generating embedding: {str(e)}")
-        # Return a zero vector as fallback
-        return [0.0] * 1536
+    
+    index = get_vector_index()
+    if index is not None:
+        CACHE_HITS.labels(cache="vector_index").inc()
+        chunks, embeddings = index.search(
+            query_embedding,
+            domain_filter=domain_filter,
+            similarity_threshold=similarity_threshold,
+            max_results=max_results,
+            include_embeddings=include_embeddings
+        )
+        attach_source_info(cursor, chunks)
+        return chunks, embeddings
+    
+    _ensure_prepared(cursor)
+    cursor.execute(
+        f"EXECUTE {RETRIEVAL_STATEMENT} (%s, %s, %s, %s, %s, %s)",
+        (
+            query,
+            vector_literal(query_embedding),
+            domain_filter,
+            similarity_threshold,
+            max_results,
+            include_embeddings
+        )
+    )
+    return _to_results(cursor, cursor.fetchall(), include_embeddings)
+
+
+def _metadata_clause(filters: MetadataFilter) -> Tuple[str, List[Any]]:
+    """SQL conditions on documents `d` matching the filters, and their parameters."""
+    clauses, params = [], []
+    if filters.published_after:
+        clauses.append("d.publication_date >= %s")
+        params.append(filters.published_after)
+    if filters.published_before:
+        clauses.append("d.publication_date <= %s")
+        params.append(filters.published_before)
+    if filters.authors:
+        clauses.append("lower(d.author) = ANY(%s)")
+        params.append([author.lower() for author in filters.authors])
+    if filters.classifications:
+        clauses.append("lower(d.classification) = ANY(%s)")
+        params.append([classification.lower() for classification in filters.classifications])
+    return " AND ".join(clauses), params
+
+
+def _search_filtered(
+    cursor,
+    query_embedding: List[float],
+    domain_filter: Optional[str],
+    filters: MetadataFilter,
+    similarity_threshold: float,
+    max_results: int,
+    include_embeddings: bool
+) -> Tuple[List[KnowledgeChunk], Optional[np.ndarray]]:
+    """
+    Search only the chunks of documents matching the metadata filters.
+
+    A count capped at FILTER_EXACT_MAX_ROWS + 1 picks the plan. A subset that
+    small is ranked exactly, which is cheap and cannot miss matches. A larger
+    one is searched through the HNSW index with an iterative scan, so chunks
+    the filter rejects don't leave the result short.
+    """
+    clause, params = _metadata_clause(filters)
+    subset = f"kc.document_id IN (SELECT d.id FROM documents d WHERE d.deleted_at IS NULL AND {clause})"
+    if domain_filter:
+        subset += " AND kc.domain = %s"
+        params.append(domain_filter)
+    
+    cursor.execute(
+        f"SELECT COUNT(*) FROM (SELECT 1 FROM knowledge_chunks kc WHERE {subset} LIMIT %s) matching",
+        params + [settings.FILTER_EXACT_MAX_ROWS + 1]
+    )
+    matching = cursor.fetchone()[0]
+    if matching == 0:
+        FILTERED_SEARCH.labels(plan="empty").inc()
+        return _to_results(cursor, [], include_embeddings)
+    exact = matching <= settings.FILTER_EXACT_MAX_ROWS
+    FILTERED_SEARCH.labels(plan="exact" if exact else "hnsw").inc()
+    
+    if not exact:
+        cursor.execute(
+            """
+            SELECT set_config('hnsw.iterative_scan', 'relaxed_order', true),
+                   set_config('hnsw.ef_search', %s, true),
+                   set_config('hnsw.max_scan_tuples', %s, true)
+            """,
+            (str(settings.FILTER_HNSW_EF_SEARCH), str(settings.FILTER_HNSW_MAX_SCAN_TUPLES))
+        )
+    
+    # Adding zero to the distance keeps the planner off the HNSW index.
+    # Relaxed-order index results are sorted again outside the CTE.
+    vector = vector_literal(query_embedding)
+    order = "(kc.embedding <=> %s::vector) + 0" if exact else "kc.embedding <=> %s::vector"
+    cursor.execute(
+        f"""
+        WITH candidates AS MATERIALIZED (
+            SELECT kc.id, kc.chunk_text, kc.document_id, kc.chunk_metadata, kc.embedding,
+                   kc.embedding <=> %s::vector AS distance
+            FROM knowledge_chunks kc
+            WHERE {subset}
+            ORDER BY {order}
+            LIMIT %s
+        )
+        SELECT id, chunk_text, document_id::text, 1 - distance, chunk_metadata,
+               CASE WHEN %s THEN vector_send(embedding) END
+        FROM candidates
+        WHERE 1 - distance > %s
+        ORDER BY distance
+        """,
+        [vector] + params + [vector, max_results, include_embeddings, similarity_threshold]
+    )
+    rows = cursor.fetchall()
+    if not exact:
+        # Later searches in this transaction use the normal index settings;
+        # after an error the rollback on release undoes the SET LOCALs instead
+        cursor.execute("RESET hnsw.iterative_scan; RESET hnsw.ef_search; RESET hnsw.max_scan_tuples")
+
+    return _to_results(cursor, rows, include_embeddings)
+
+
+def _to_results(cursor, rows: List[Tuple], include_embeddings: bool) -> Tuple[List[KnowledgeChunk], Optional[np.ndarray]]:
+    """Convert retrieval rows into chunks with document metadata and decoded embeddings."""
+    # Rows are already trusted database values, so skip pydantic validation
+    chunks = [
+        KnowledgeChunk.construct(
+            id=chunk_id,
+            text=text,
+            source_info={},
+            similarity=similarity,
+            metadata=metadata or {},
+            document_id=document_id
+        )
+        for chunk_id, text, document_id, similarity, metadata, _ in rows
+    ]
+    attach_source_info(cursor, chunks)
+    
+    embeddings = None
+    if include_embeddings:
+        embeddings = decode_vectors([row[5] for row in rows], EMBEDDING_DIMENSIONS)
+    
+    return chunks, embeddings
 
 
 async def retrieve_similar_chunks(
@@ -39,48 +369,109 @@ async def retrieve_similar_chunks(
     query: str, 
     domain_filter: Optional[str] = None,
     similarity_threshold: float = 0.7,
-    max_results: int = 5
+    max_results: int = 5,
+    timings: Optional[Dict[str, float]] = None,
+    query_embedding: Optional[List[float]] = None,
+    filters: Optional[MetadataFilter] = None
 ) -> List[KnowledgeChunk]:
-    """Retrieve chunks similar to the query from the database."""
-    cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    chunks = []
+    """Retrieve chunks similar to the query, optionally within metadata filters."""
+    timings = timings if timings is not None else {}
     
     try:
-        # Generate embedding for the query
-        query_embedding = await generate_embedding(query)
+        # Generate embedding for the query unless the caller already has one
+        if query_embedding is None:
+            started = time.perf_counter()
+            query_embedding = await generate_embedding(query)
+            timings["embedding_ms"] = (time.perf_counter() - started) * 1000
         
-        # Use the find_similar_chunks function defined in the database
-        cursor.execute(
-            """
-            SELECT * FROM find_similar_chunks(%s, %s::vector(1536), %s, %s, %s)
-            """,
-            (
-                query,
-                query_embedding,
-                domain_filter,
-                similarity_threshold,
-                max_results
-            )
+        started = time.perf_counter()
+        chunks, _ = await search_in_thread(
+            conn,
+            query,
+            query_embedding,
+            domain_filter=domain_filter,
+            similarity_threshold=similarity_threshold,
+            max_results=max_results,
+            filters=filters
         )
+        timings["retrieval_ms"] = (time.perf_counter() - started) * 1000
+    
+    except Exception as e:
+        logger.error("Error retrieving similar chunks: %s", e)
+        raise e
+    
+    return chunks
+
+
+async def retrieve_reranked_chunks(
+    conn,
+    query: str,
+    domain_filter: Optional[str] = None,
+    similarity_threshold: float = 0.7,
+    max_results: int = 5,
+    timings: Optional[Dict[str, float]] = None,
+    query_embedding: Optional[List[float]] = None,
+    filters: Optional[MetadataFilter] = None
+) -> List[KnowledgeChunk]:
+    """
+    Over-fetch RERANK_CANDIDATES chunks with their embeddings and select the
+    final max_results with MMR so near-duplicates don't crowd out coverage.
+    """
+    timings = timings if timings is not None else {}
+    
+    try:
+        if query_embedding is None:
+            started = time.perf_counter()
+            query_embedding = await generate_embedding(query)
+            timings["embedding_ms"] = (time.perf_counter() - started) * 1000
         
-        rows = cursor.fetchall()
+        started = time.perf_counter()
+        candidates, embeddings = await search_in_thread(
+            conn,
+            query,
+            query_embedding,
+            domain_filter=domain_filter,
+            similarity_threshold=similarity_threshold,
+            max_results=max(settings.RERANK_CANDIDATES, max_results),
+            include_embeddings=True,
+            filters=filters
+        )
+        timings["retrieval_ms"] = (time.perf_counter() - started) * 1000
         
-        for row in rows:
-            chunks.append(
-                KnowledgeChunk(
-                    id=row['id'],
-                    text=row['chunk_text'],
-                    source_info=row['source_info'],
-                    similarity=row['similarity']
-                )
-            )
+        started = time.perf_counter()
+        chunks = await rerank_chunks(
+            query,
+            np.asarray(query_embedding, dtype=np.float32),
+            candidates,
+            embeddings,
+            top_k=max_results
+        )
+        timings["rerank_ms"] = (time.perf_counter() - started) * 1000
     
     except Exception as e:
-        # Log the error (in production, use proper logging)
-        print(f"Error retrieving similar chunks: {str(e)}")
+        logger.error("Error retrieving reranked chunks: %s", e)
         raise e
     
-    finally:
-        cursor.close()
-    
     return chunks
+
+
+async def retrieve_chunks(
+    conn,
+    query: str,
+    domain_filter: Optional[str] = None,
+    timings: Optional[Dict[str, float]] = None,
+    query_embedding: Optional[List[float]] = None,
+    filters: Optional[MetadataFilter] = None
+) -> List[KnowledgeChunk]:
+    """Retrieve a query's RERANK_TOP_K context chunks the way the pipeline is configured to."""
+    retrieve = retrieve_reranked_chunks if settings.RERANK_ENABLED else retrieve_similar_chunks
+    return await retrieve(
+        conn,
+        query,
+        domain_filter=domain_filter,
+        similarity_threshold=settings.SIMILARITY_THRESHOLD,
+        max_results=settings.RERANK_TOP_K,
+        timings=timings,
+        query_embedding=query_embedding,
+        filters=filters
+    )
@@ -0,0 +1,53 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Tuple
+from .config import settings
+from .metrics import CACHE_HITS
+
+
+class DocumentCache:
+    """
+    In-process LRU cache of document metadata (source_info) by document id.
+
+    Retrieval returns lean chunk rows that only reference their document;
+    the metadata for the documents not cached yet is read with one query
+    per search. Entries expire after `ttl` seconds so edits show up.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.max_size = max_size
+        self.ttl = ttl
+
+    def get_many(self, cursor, document_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        found: Dict[str, Dict[str, Any]] = {}
+        missing = []
+        for document_id in set(document_ids):
+            entry = self._entries.get(document_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(document_id)
+                found[document_id] = entry[1]
+            else:
+                missing.append(document_id)
+
+        if found:
+            CACHE_HITS.labels(cache="documents").inc(len(found))
+        if missing:
+            cursor.execute(
+                "SELECT id::text, source_info FROM documents WHERE id = ANY(%s::uuid[])",
+                (missing,)
+            )
+            for document_id, source_info in cursor.fetchall():
+                found[document_id] = source_info
+                self._entries[document_id] = (now + self.ttl, source_info)
+                self._entries.move_to_end(document_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return found
+
+    def invalidate(self, document_id: str):
+        self._entries.pop(document_id, None)
+
+
+document_cache = DocumentCache(settings.DOCUMENT_CACHE_SIZE, settings.DOCUMENT_CACHE_TTL)
@@ -0,0 +1,385 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import psycopg2
+import psycopg2.extras
+from .config import settings
+from .agent import PROMPT_VERSION
+from .admission import request_priority
+from .coalesce import normalize_query, retrieval_profile
+from .db_router import router, acquire_primary_connection, get_read_connection, release_connection
+from .db_utils import generate_embedding
+from .metrics import CACHE_HITS
+from .query_log import query_record
+from .schemas import QueryRequest, QueryResponse
+from .vectors import vector_literal
+
+
+logger = logging.getLogger(__name__)
+
+# Held by the one orchestrator worker refreshing precomputed answers
+HOT_QUERY_LOCK_ID = 0x686F7471
+
+# Held by the one orchestrator worker checking precomputed answers for staleness
+HOT_ANSWER_CHECK_LOCK_ID = 0x686F7461
+
+# Every chunk changed since the oldest position of a fresh answer, once, with
+# its latest change and current row (none once deleted), and the domains in
+# which more chunks changed than are worth comparing one by one
+CHANGED_CHUNKS = """
+    changed AS MATERIALIZED (
+        SELECT latest.chunk_id, latest.xid, kc.domain, kc.embedding
+        FROM (
+            SELECT DISTINCT ON (c.chunk_id) c.chunk_id, c.xid
+            FROM knowledge_chunk_changes c
+            WHERE c.xid >= (SELECT change_xid FROM precomputed_answers WHERE NOT stale ORDER BY change_xid LIMIT 1)
+              AND c.xid < %(xmin)s::xid8
+            ORDER BY c.chunk_id, c.xid DESC
+        ) latest
+        LEFT JOIN knowledge_chunks kc ON kc.id = latest.chunk_id
+    ),
+    flooded AS (
+        SELECT domain FROM changed WHERE domain IS NOT NULL GROUP BY domain HAVING COUNT(*) > %(max_changes)s
+    )
+"""
+
+# A precomputed answer is stale once it was computed with other settings,
+# changes it had yet to be checked against were pruned from the log, one of
+# its chunks belongs to a document queued for deletion, its domain had a bulk
+# change, or a change committed since it was last checked touched one of its
+# chunks or added or edited a chunk close enough to its query to be
+# retrieved for it
+STALE_CONDITION = """
+    p.profile <> %(profile)s
+    OR p.change_xid <= (SELECT pruned_xid FROM knowledge_chunk_changes_pruned)
+    OR EXISTS (
+        SELECT 1
+        FROM knowledge_chunks kc
+        JOIN documents d ON d.id = kc.document_id
+        WHERE kc.id = ANY(p.chunk_ids) AND d.deleted_at IS NOT NULL
+    )
+    OR EXISTS (SELECT 1 FROM flooded f WHERE p.domain = '' OR f.domain = p.domain)
+    OR EXISTS (
+        SELECT 1
+        FROM changed c
+        WHERE c.xid >= p.change_xid
+          AND (
+              c.chunk_id = ANY(p.chunk_ids)
+              OR (
+                  (p.domain = '' OR c.domain = p.domain)
+                  AND 1 - (c.embedding <=> p.embedding) > %(threshold)s
+              )
+          )
+    )
+"""
+
+
+def precompute_profile() -> str:
+    """Describe the settings a precomputed answer depends on."""
+    return f"{retrieval_profile()}|prompt={PROMPT_VERSION}|threshold={settings.SIMILARITY_THRESHOLD}"
+
+
+def _change_position(cursor) -> str:
+    """Every change with a lower xid has committed or rolled back."""
+    cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text")
+    return cursor.fetchone()[0]
+
+
+def _check_answers(cursor) -> int:
+    """
+    Mark the precomputed answers made stale by changes committed since they
+    were last checked, and move the others past those changes. An answer
+    recomputed meanwhile keeps its own position. Each changed chunk is
+    compared once per answer, and after a bulk change (more than
+    HOT_ANSWER_CHECK_MAX_CHANGES chunks in a domain) that domain's answers
+    are recomputed instead. Returns the number marked.
+    """
+    cursor.execute(
+        f"""
+        WITH {CHANGED_CHUNKS}
+        UPDATE precomputed_answers p
+        SET stale = checked.stale,
+            change_xid = CASE WHEN checked.stale THEN p.change_xid ELSE GREATEST(p.change_xid, %(xmin)s::xid8) END
+        FROM (
+            SELECT p.domain, p.query_key, p.computed_at, ({STALE_CONDITION}) AS stale
+            FROM precomputed_answers p
+            WHERE NOT p.stale
+        ) checked
+        WHERE p.domain = checked.domain AND p.query_key = checked.query_key AND p.computed_at = checked.computed_at
+        RETURNING checked.stale
+        """,
+        {
+            "profile": precompute_profile(),
+            "threshold": settings.SIMILARITY_THRESHOLD,
+            "max_changes": settings.HOT_ANSWER_CHECK_MAX_CHANGES,
+            "xmin": _change_position(cursor)
+        }
+    )
+    return sum(1 for (stale,) in cursor.fetchall() if stale)
+
+
+def _try_lock(conn, lock_id: int) -> bool:
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (lock_id,))
+        locked = cursor.fetchone()[0]
+        conn.commit()
+        return locked
+    finally:
+        cursor.close()
+
+
+def _unlock(conn, lock_id: int):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (lock_id,))
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+class HotAnswers:
+    """
+    The fresh precomputed answers, held by every worker and reloaded each
+    HOT_QUERY_SYNC_INTERVAL. One worker at a time checks the answers for
+    staleness before reloading, so an answer invalidated by a chunk change
+    can be served until the next check and reload.
+    """
+
+    def __init__(self):
+        self._answers: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    @staticmethod
+    def _key(query_request: QueryRequest) -> Tuple[str, str]:
+        return query_request.domain or "", normalize_query(query_request.query)
+
+    def has(self, query_request: QueryRequest) -> bool:
+        return self._key(query_request) in self._answers
+
+    def get(self, query_request: QueryRequest) -> Optional[QueryResponse]:
+        answer = self._answers.get(self._key(query_request))
+        if answer is None:
+            return None
+        CACHE_HITS.labels(cache="precomputed").inc()
+        return QueryResponse(
+            **answer,
+            query=query_request.query,
+            conversation_id=query_request.conversation_id
+        )
+
+    def load(self, cursor):
+        cursor.execute("SELECT domain, query_key, response FROM precomputed_answers WHERE NOT stale")
+        self._answers = {(domain, query_key): response for domain, query_key, response in cursor.fetchall()}
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+
+hot_answers = HotAnswers()
+
+
+def _plan_refresh(conn) -> Tuple[List[Tuple[str, str, int]], str]:
+    """
+    Prune the query log, find each domain's HOT_QUERY_TOP_N most asked
+    questions, drop precomputed answers that fell out of that list and return
+    the hot questions lacking a fresh answer (most asked first) along with
+    the current knowledge_chunk_changes position.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "DELETE FROM query_log WHERE logged_at < NOW() - %s * INTERVAL '1 day'",
+            (settings.QUERY_LOG_RETENTION_DAYS,)
+        )
+        # Filtered and failed requests don't have a shareable answer
+        cursor.execute(
+            """
+            WITH counts AS (
+                SELECT domain, query_key, mode() WITHIN GROUP (ORDER BY query) AS query, COUNT(*) AS requests
+                FROM query_log
+                WHERE logged_at > NOW() - %s * INTERVAL '1 hour' AND NOT filtered AND status = 200
+                GROUP BY domain, query_key
+                HAVING COUNT(*) >= %s
+            )
+            SELECT domain, query_key, query, requests
+            FROM (
+                SELECT counts.*, row_number() OVER (PARTITION BY domain ORDER BY requests DESC) AS rank
+                FROM counts
+            ) ranked
+            WHERE rank <= %s
+            ORDER BY requests DESC
+            """,
+            (settings.HOT_QUERY_WINDOW_HOURS, settings.HOT_QUERY_MIN_COUNT, settings.HOT_QUERY_TOP_N)
+        )
+        hot = cursor.fetchall()
+        domains = [row[0] for row in hot]
+        keys = [row[1] for row in hot]
+
+        cursor.execute(
+            """
+            DELETE FROM precomputed_answers p
+            WHERE (p.domain, p.query_key) NOT IN (SELECT * FROM unnest(%s::text[], %s::text[]))
+            """,
+            (domains, keys)
+        )
+        cursor.execute(
+            """
+            UPDATE precomputed_answers p
+            SET request_count = hot.requests
+            FROM unnest(%s::text[], %s::text[], %s::bigint[]) AS hot (domain, query_key, requests)
+            WHERE p.domain = hot.domain AND p.query_key = hot.query_key
+            """,
+            (domains, keys, [row[3] for row in hot])
+        )
+        # Taken before the answers are computed, so changes made meanwhile are
+        # checked against them
+        change_xid = _change_position(cursor)
+        _check_answers(cursor)
+        cursor.execute("SELECT domain, query_key FROM precomputed_answers WHERE NOT stale")
+        fresh = set(cursor.fetchall())
+        conn.commit()
+    finally:
+        cursor.close()
+
+    due = [(domain, query, requests) for domain, query_key, query, requests in hot if (domain, query_key) not in fresh]
+    return due, change_xid
+
+
+def _store_answer(conn, domain: str, query: str, embedding: List[float], response: QueryResponse,
+                  chunk_ids: List[int], change_xid: str, requests: int):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            INSERT INTO precomputed_answers
+                (domain, query_key, query, embedding, response, chunk_ids, profile, change_xid, stale, request_count, computed_at)
+            VALUES (%s, %s, %s, %s::vector, %s, %s::int[], %s, %s::xid8, FALSE, %s, NOW())
+            ON CONFLICT (domain, query_key) DO UPDATE
+            SET query = EXCLUDED.query,
+                embedding = EXCLUDED.embedding,
+                response = EXCLUDED.response,
+                chunk_ids = EXCLUDED.chunk_ids,
+                profile = EXCLUDED.profile,
+                change_xid = EXCLUDED.change_xid,
+                stale = FALSE,
+                request_count = EXCLUDED.request_count,
+                computed_at = NOW()
+            """,
+            (
+                domain,
+                normalize_query(query),
+                query,
+                vector_literal(embedding),
+                # Per-request fields are filled in when the answer is served
+                psycopg2.extras.Json(response.dict(exclude={"query", "conversation_id", "timestamp", "timings"})),
+                sorted(set(chunk_ids)),
+                precompute_profile(),
+                change_xid,
+                requests
+            )
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+async def refresh_hot_queries(compute: Callable[[QueryRequest], Awaitable[QueryResponse]]) -> int:
+    """
+    Precompute the answers of hot questions that have none or a stale one,
+    at most HOT_QUERY_REFRESH_BATCH per run, through the normal query
+    pipeline (`compute`) at batch priority. Returns the number refreshed.
+    Only one worker refreshes at a time.
+    """
+    conn = await acquire_primary_connection()
+    try:
+        if not await asyncio.to_thread(_try_lock, conn, HOT_QUERY_LOCK_ID):
+            return 0
+        try:
+            due, change_xid = await asyncio.to_thread(_plan_refresh, conn)
+            refreshed = 0
+            for domain, query, requests in due[:settings.HOT_QUERY_REFRESH_BATCH]:
+                try:
+                    with query_record() as record, request_priority("batch"):
+                        response = await compute(QueryRequest(query=query, domain=domain or None))
+                        embedding = await generate_embedding(query)
+                    await asyncio.to_thread(
+                        _store_answer, conn, domain, query, embedding, response, record["chunk_ids"], change_xid, requests
+                    )
+                    refreshed += 1
+                except Exception as e:
+                    # One failing question doesn't hold up the others
+                    logger.warning("Could not precompute answer for hot query %r: %s", query, e)
+            return refreshed
+        finally:
+            await asyncio.to_thread(_unlock, conn, HOT_QUERY_LOCK_ID)
+    finally:
+        router.release(conn)
+
+
+def check_hot_answers() -> Optional[int]:
+    """
+    Mark stale precomputed answers, unless another worker is already at it.
+    Returns the number marked, or None when skipped.
+    """
+    conn = router.connect_primary()
+    try:
+        if not _try_lock(conn, HOT_ANSWER_CHECK_LOCK_ID):
+            return None
+        try:
+            cursor = conn.cursor()
+            try:
+                marked = _check_answers(cursor)
+                conn.commit()
+                return marked
+            finally:
+                cursor.close()
+        finally:
+            _unlock(conn, HOT_ANSWER_CHECK_LOCK_ID)
+    finally:
+        router.release(conn)
+
+
+def _load_hot_answers():
+    conn = get_read_connection()
+    try:
+        cursor = conn.cursor()
+        try:
+            hot_answers.load(cursor)
+        finally:
+            cursor.close()
+    finally:
+        release_connection(conn)
+
+
+async def run_hot_answer_sync():
+    """Background task: keep this worker's precomputed answers current."""
+    while True:
+        try:
+            marked = await asyncio.to_thread(check_hot_answers)
+            if marked:
+                logger.info("Marked %d precomputed answers stale", marked)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Error checking precomputed answers: %s", e)
+        try:
+            await asyncio.to_thread(_load_hot_answers)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Error loading precomputed answers: %s", e)
+        await asyncio.sleep(settings.HOT_QUERY_SYNC_INTERVAL)
+
+
+async def run_hot_query_refresh(compute: Callable[[QueryRequest], Awaitable[QueryResponse]]):
+    """Background task: mine the query log and refresh precomputed answers."""
+    while True:
+        await asyncio.sleep(settings.HOT_QUERY_REFRESH_INTERVAL)
+        try:
+            refreshed = await refresh_hot_queries(compute)
+            if refreshed:
+                logger.info("Precomputed %d hot query answers", refreshed)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Error refreshing hot queries: %s", e)
@@ -1,18 +1,42 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import json
+import logging
+import asyncio
 import os
+import time
+import uuid
 from datetime import datetime, timezone
 import psycopg2
 import psycopg2.extras
-from openai import OpenAI, AsyncOpenAI
 
 from .config import settings
-from .db_utils import get_db_connection, retrieve_similar_chunks
+from .db_utils import get_db_connection, retrieve_chunks, embedding_batcher, searches_finished
 from .schemas import QueryRequest, QueryResponse, KnowledgeChunk
 from .agent import create_agent, get_agent_response
+from .context import pack_context
+from .multi_agent import answer_across_domains
+from .vector_index import run_vector_index_sync
+from .db_router import router, acquire_read_connection, release_connection, run_replica_health_checks
+from .resilience import request_budget, UpstreamUnavailable
+from .coalesce import query_flights, query_key
+from .admission import query_slots, admission_stats, parse_priority, request_priority, Overloaded
+from .logging_config import configure_logging
+from .profiling import profiled, profiling_requested, traces
+from .query_log import query_log, query_record, record_served_from, record_chunks, run_query_log_flusher
+from .hot_queries import hot_answers, run_hot_answer_sync, run_hot_query_refresh
+from .prefetch import Prefetched, prefetches, prefetch_retrieval
+from .warmup import warm_up, is_ready, readiness
+from .metrics import (
+    render_metrics, observe_timings, QUERY_LATENCY, QUERIES_IN_FLIGHT, DB_CONNECTIONS_OPEN,
+    CHUNKS_RETRIEVED, CONTEXT_TOKENS, ERRORS
+)
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="CommandCore Orchestrator Service")
 
@@ -25,8 +49,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize OpenAI client
-client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+
+@app.on_event("startup")
+async def start_background_tasks():
+    app.state.background_tasks = []
+    # Open pools and load tokenizers before /ready lets traffic in
+    app.state.background_tasks.append(asyncio.create_task(warm_up()))
+    # Keep the optional in-process vector index replica in sync in the background
+    if settings.VECTOR_INDEX_ENABLED:
+        app.state.background_tasks.append(asyncio.create_task(run_vector_index_sync()))
+    # Take lagging or unreachable read replicas out of rotation
+    if router.replicas:
+        app.state.background_tasks.append(asyncio.create_task(run_replica_health_checks()))
+    if settings.QUERY_LOG_ENABLED:
+        app.state.background_tasks.append(asyncio.create_task(run_query_log_flusher()))
+    # Serve the most asked questions from answers precomputed off the query log
+    if settings.HOT_QUERIES_ENABLED:
+        app.state.background_tasks.append(asyncio.create_task(run_hot_answer_sync()))
+        app.state.background_tasks.append(asyncio.create_task(run_hot_query_refresh(run_query_pipeline)))
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in getattr(app.state, "background_tasks", []):
+        task.cancel()
 
 
 @app.get("/")
@@ -40,75 +86,315 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.now(timezone.utc).isoformat()}
 
 
+@app.get("/ready")
+async def readiness_check():
+    # Ready only once the startup warm-up has finished
+    status_code = 200 if is_ready() else 503
+    return JSONResponse(
+        status_code=status_code,
+        content={"status": "ready" if status_code == 200 else "starting", "checks": readiness}
+    )
+
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus scrape endpoint
+    body, content_type = render_metrics()
+    return Response(content=body, headers={"Content-Type": content_type})
+
+
+@app.get("/v1/system/coalescing")
+async def coalescing_stats():
+    # In-flight deduplication counters for /v1/query
+    return query_flights.stats()
+
+
+@app.get("/v1/system/traces")
+async def list_traces():
+    # Recently captured slow or requested query profiles, newest first
+    return {"traces": traces.summaries()}
+
+
+@app.get("/v1/system/traces/{trace_id}")
+async def get_trace(trace_id: str, format: str = "json"):
+    # format=collapsed returns folded stacks for flamegraph.pl or speedscope
+    trace = traces.get(trace_id)
+    if trace is None:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "error": {
+                    "code": "TRACE_NOT_FOUND",
+                    "message": "Trace not found; it may have been evicted"
+                }
+            }
+        )
+    if format == "collapsed":
+        return PlainTextResponse(trace.collapsed())
+    return trace.to_dict()
+
+
+@app.get("/v1/system/hot-queries")
+async def hot_query_status():
+    # Precomputed answers this worker serves and the unwritten query log backlog
+    return {"precomputed_answers": len(hot_answers), "query_log_buffered": len(query_log)}
+
+
+@app.get("/v1/system/prefetch")
+async def prefetch_status():
+    # Speculative draft retrievals started, cancelled and reused
+    return prefetches.stats()
+
+
+@app.get("/v1/system/admission")
+async def admission_status():
+    # Slots, queue depth and rejections per pipeline stage
+    return {**admission_stats(), "embedding_batching": embedding_batcher.stats()}
+
+
 @app.post("/v1/query", response_model=QueryResponse)
-async def process_query(query_request: QueryRequest):
-    """Process a user query and return a response using RAG."""
-    print(f"Received query request: {query_request}")
+async def process_query(
+    query_request: QueryRequest,
+    response: Response,
+    x_request_priority: Optional[str] = Header(None),
+    x_profile: Optional[str] = Header(None)
+):
+    """
+    Process a user query and return a response using RAG.
+    The most asked questions are answered from precomputed results and
+    identical concurrent queries share a single pipeline run. The
+    X-Request-Priority header ("interactive" or "batch", the default)
+    decides the request's place in the admission queue. With X-Profile: 1
+    the pipeline runs on its own under the sampling profiler and the
+    X-Trace-Id response header names its trace in /v1/system/traces.
+    Every request is recorded in the query log.
+    """
+    logger.debug("Received query", extra={"domain": query_request.domain})
+    started = time.perf_counter()
+    status = 500
+    with request_priority(parse_priority(x_request_priority)), query_record() as record:
+        try:
+            result = await answer_query(query_request, response, x_profile)
+            status = 200
+            return result
+        except HTTPException as e:
+            status = e.status_code
+            raise
+        finally:
+            if settings.QUERY_LOG_ENABLED:
+                query_log.add(query_request, record, status, (time.perf_counter() - started) * 1000)
+
+
+async def answer_query(query_request: QueryRequest, response: Response, x_profile: Optional[str]) -> QueryResponse:
+    if profiling_requested(x_profile):
+        trace_id = uuid.uuid4().hex[:12]
+        response.headers["X-Trace-Id"] = trace_id
+        return await run_query_pipeline(query_request, profile_id=trace_id)
+    
+    # Precomputed answers reflect neither filters nor a specific commit
+    if settings.HOT_QUERIES_ENABLED and not query_request.filters and not query_request.read_after_lsn:
+        precomputed = hot_answers.get(query_request)
+        if precomputed is not None:
+            record_served_from("precomputed")
+            return precomputed
+    
+    # Reuse what was retrieved for the session's draft of this query
+    prefetched = None
+    if settings.PREFETCH_ENABLED and query_request.session_id:
+        prefetched = await prefetches.take(query_request)
+    
+    if not settings.QUERY_COALESCING_ENABLED:
+        return await run_query_pipeline(query_request, prefetched=prefetched)
+    
+    shared = await query_flights.run(
+        query_key(query_request),
+        lambda: run_query_pipeline(query_request, prefetched=prefetched)
+    )
+    # Followers get the shared answer echoed with their own query text
+    return shared.copy(update={
+        "query": query_request.query,
+        "conversation_id": query_request.conversation_id
+    })
+
+
+@app.post("/v1/query/prefetch", status_code=202)
+async def prefetch_query(query_request: QueryRequest):
+    """
+    Speculatively embed a draft query and retrieve its context while the user
+    is still typing, for a /v1/query with the same session_id to reuse. A new
+    draft cancels the session's previous prefetch. Returns at once.
+    """
+    if not query_request.session_id:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "error": {
+                    "code": "MISSING_SESSION_ID",
+                    "message": "Prefetching requires a session_id"
+                }
+            }
+        )
+    if not settings.PREFETCH_ENABLED:
+        return {"status": "disabled"}
+    if settings.HOT_QUERIES_ENABLED and not query_request.filters and hot_answers.has(query_request):
+        return {"status": "precomputed"}
+    return {"status": prefetches.start(query_request, lambda: prefetch_retrieval(query_request))}
+
+
+async def run_query_pipeline(
+    query_request: QueryRequest,
+    profile_id: Optional[str] = None,
+    prefetched: Optional[Prefetched] = None
+) -> QueryResponse:
+    """
+    Retrieve context for a query and generate the answer once admitted.
+    All OpenAI calls share REQUEST_BUDGET_SECONDS. The run is profiled when
+    profile_id is given; a slow run keeps its stage timings as a trace anyway.
+    A prefetched embedding and chunks replace those pipeline stages.
+    """
+    timings = {}
+    started = time.perf_counter()
+    record_served_from("pipeline", timings)
     try:
-        # Get database connection
-        print("Getting database connection...")
-        conn = get_db_connection()
-        
-        # Retrieve similar chunks from the database
-        print(f"Retrieving similar chunks for query: '{query_request.query}', domain: {query_request.domain}")
-        chunks = await retrieve_similar_chunks(
-            conn, 
-            query_request.query, 
-            domain_filter=query_request.domain if query_request.domain else None,
-            max_results=5
+        with profiled("query", timings, force=profile_id is not None, trace_id=profile_id, domain=query_request.domain):
+            async with query_slots.slot(timings):
+                with QUERIES_IN_FLIGHT.track_inprogress(), request_budget(settings.REQUEST_BUDGET_SECONDS):
+                    return await _run_query_pipeline(query_request, timings, prefetched)
+    except Overloaded as e:
+        logger.warning("Query rejected: %s", e)
+        ERRORS.labels(code="OVERLOADED").inc()
+        raise HTTPException(
+            status_code=e.status_code,
+            detail={
+                "error": {
+                    "code": "OVERLOADED",
+                    "message": str(e)
+                }
+            },
+            headers={"Retry-After": str(e.retry_after)}
         )
+    finally:
+        QUERY_LATENCY.observe(time.perf_counter() - started)
+        observe_timings(timings)
+        logger.info("Query finished", extra={"domain": query_request.domain, "timings_ms": timings})
+
+
+async def _run_query_pipeline(
+    query_request: QueryRequest,
+    timings: Dict[str, float],
+    prefetched: Optional[Prefetched] = None
+) -> QueryResponse:
+    query_embedding, prefetched_chunks = prefetched or (None, None)
+    conn = None
+    try:
+        # Get a read connection, honouring read-your-writes if requested
+        conn = await acquire_read_connection(min_lsn=query_request.read_after_lsn)
+        DB_CONNECTIONS_OPEN.inc()
         
-        print(f"Retrieved {len(chunks)} chunks")
+        # Queries without a domain are answered by all domain agents in parallel
+        if not query_request.domain and settings.MULTI_AGENT_ENABLED:
+            logger.debug("Fanning out query to domain agents")
+            response, context_sources, domain_status = await answer_across_domains(
+                conn,
+                query_request.query,
+                timings=timings,
+                filters=query_request.filters,
+                query_embedding=query_embedding,
+                prefetched=prefetched_chunks
+            )
+            logger.info("Domain agents finished", extra={"domain_status": domain_status})
+            return QueryResponse(
+                query=query_request.query,
+                response=response or "I couldn't find any relevant information to answer your query.",
+                sources=[
+                    {
+                        "title": source.title,
+                        "author": source.author,
+                        "publication_date": source.publication_date
+                    }
+                    for source in context_sources
+                ],
+                timings=timings,
+                domain_status=domain_status
+            )
+        
+        # Retrieve similar chunks from the database, unless a prefetch already did
+        if prefetched_chunks is not None and None in prefetched_chunks:
+            chunks = prefetched_chunks[None]
+        else:
+            chunks = await retrieve_chunks(
+                conn,
+                query_request.query,
+                domain_filter=query_request.domain if query_request.domain else None,
+                timings=timings,
+                query_embedding=query_embedding,
+                filters=query_request.filters
+            )
+        
+        CHUNKS_RETRIEVED.inc(len(chunks))
+        record_chunks(chunk.id for chunk in chunks)
         
         if not chunks:
-            print("No relevant chunks found, returning default response")
+            logger.debug("No relevant chunks found, returning default response")
             return QueryResponse(
                 query=query_request.query,
                 response="I couldn't find any relevant information to answer your query.",
-                sources=[]
+                sources=[],
+                timings=timings
             )
         
-        # Prepare context from chunks
-        context = "\n\n".join([chunk.text for chunk in chunks])
-        print(f"Prepared context with {len(context)} characters")
+        # Merge overlapping chunks and pack them into the prompt token budget
+        started = time.perf_counter()
+        context = pack_context(chunks)
+        timings["context_ms"] = (time.perf_counter() - started) * 1000
+        CONTEXT_TOKENS.inc(context.token_count)
         
         # Get response from agent
-        print("Getting response from agent...")
+        started = time.perf_counter()
         response = await get_agent_response(
             query=query_request.query,
-            context=context,
-            chunks=chunks
+            context=context
         )
-        print(f"Received response from agent: {response[:100]}...")
-        
-        # Extract unique sources from chunks
-        sources = []
-        source_titles = set()
-        for chunk in chunks:
-            title = chunk.source_info.get("title", "Unknown Source")
-            if title not in source_titles:
-                source_titles.add(title)
-                sources.append({
-                    "title": title,
-                    "author": chunk.source_info.get("author", "Unknown Author"),
-                    "publication_date": chunk.source_info.get("publication_date", "Unknown Date")
-                })
+        timings["llm_ms"] = (time.perf_counter() - started) * 1000
         
-        print(f"Extracted {len(sources)} unique sources")
+        # Sources are already grouped per document by the context packer
+        sources = [
+            {
+                "title": source.title,
+                "author": source.author,
+                "publication_date": source.publication_date
+            }
+            for source in context.sources
+        ]
         
         # Return response
-        print("Returning response")
         return QueryResponse(
             query=query_request.query,
             response=response,
-            sources=sources
+            sources=sources,
+            timings=timings
         )
         
+    except Overloaded:
+        # Turned into a 503 with Retry-After by run_query_pipeline
+        raise
+    
+    except UpstreamUnavailable as e:
+        logger.warning("Upstream unavailable while processing query: %s", e)
+        ERRORS.labels(code="UPSTREAM_UNAVAILABLE").inc()
+        raise HTTPException(
+            status_code=503,
+            detail={
+                "error": {
+                    "code": "UPSTREAM_UNAVAILABLE",
+                    "message": str(e)
+                }
+            }
+        )
+    
     except Exception as e:
-        # Log the error (in production, use proper logging)
-        print(f"Error processing query: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
+        logger.exception("Error processing query")
+        ERRORS.labels(code="QUERY_PROCESSING_ERROR").inc()
         raise HTTPException(
             status_code=500,
             detail={
@@ -118,3 +404,10 @@ async def process_query(query_request: QueryRequest):
                 }
             }
         )
+    
+    finally:
+        if conn is not None:
+            # Domain agents cut off by their timeouts may still be searching on it
+            await searches_finished(conn)
+            release_connection(conn)
+            DB_CONNECTIONS_OPEN.dec()
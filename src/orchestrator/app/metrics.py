@@ -0,0 +1,102 @@
+from typing import Dict
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+
+# Buckets from 1 ms up to a minute; LLM stages land in the upper half
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_LATENCY = Histogram(
+    "commandcore_orchestrator_stage_seconds",
+    "Time spent per query pipeline stage",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+QUERY_LATENCY = Histogram(
+    "commandcore_orchestrator_query_seconds",
+    "End-to-end /v1/query latency",
+    buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "commandcore_orchestrator_llm_tokens_total",
+    "Tokens used by chat completions",
+    ["model", "kind"]
+)
+CHUNKS_RETRIEVED = Counter(
+    "commandcore_orchestrator_chunks_retrieved_total",
+    "Chunks returned by retrieval"
+)
+CONTEXT_TOKENS = Counter(
+    "commandcore_orchestrator_context_tokens_total",
+    "Context tokens packed into prompts"
+)
+CACHE_HITS = Counter(
+    "commandcore_orchestrator_cache_hits_total",
+    "Requests served from a cache or shared in-flight result",
+    ["cache"]
+)
+ERRORS = Counter(
+    "commandcore_orchestrator_errors_total",
+    "Failed requests and upstream calls",
+    ["code"]
+)
+QUERIES_IN_FLIGHT = Gauge(
+    "commandcore_orchestrator_queries_in_flight",
+    "Query pipelines currently running"
+)
+DB_CONNECTIONS_OPEN = Gauge(
+    "commandcore_orchestrator_db_connections_open",
+    "Database connections currently held by query pipelines"
+)
+ADMISSION_QUEUE_TIME = Histogram(
+    "commandcore_orchestrator_admission_queue_seconds",
+    "Time spent waiting for a stage slot",
+    ["stage", "priority"],
+    buckets=LATENCY_BUCKETS
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "commandcore_orchestrator_admission_queue_depth",
+    "Requests waiting for a stage slot",
+    ["stage"]
+)
+ADMISSION_ACTIVE = Gauge(
+    "commandcore_orchestrator_admission_active",
+    "Stage slots currently held",
+    ["stage"]
+)
+ADMISSION_REJECTED = Counter(
+    "commandcore_orchestrator_admission_rejected_total",
+    "Requests refused because a stage was saturated",
+    ["stage", "priority", "reason"]
+)
+DOMAIN_ROUTING = Counter(
+    "commandcore_orchestrator_domain_routing_total",
+    "Unscoped retrievals by routing outcome",
+    ["outcome"]
+)
+QUERY_LOG_ROWS = Counter(
+    "commandcore_orchestrator_query_log_rows_total",
+    "Query log rows by outcome (written, dropped, failed)",
+    ["outcome"]
+)
+FILTERED_SEARCH = Counter(
+    "commandcore_orchestrator_filtered_search_total",
+    "Metadata-filtered searches by the plan chosen",
+    ["plan"]
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "commandcore_orchestrator_embedding_batch_size",
+    "Query embeddings sent per upstream embeddings request",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+
+
+def observe_timings(timings: Dict[str, float]):
+    """Feed a pipeline's `<stage>_ms` timings into the stage histogram."""
+    for name, milliseconds in timings.items():
+        if name.endswith("_ms"):
+            STAGE_LATENCY.labels(stage=name[:-3]).observe(milliseconds / 1000)
+
+
+def render_metrics():
+    """Return the Prometheus text exposition and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import re
+import time
+from typing import List, Dict, Any, Optional, Tuple
+from .config import settings
+from .db_utils import generate_embedding, retrieve_chunks, run_in_search_thread
+from .context import pack_context
+from .agent import DOMAIN_AGENTS, get_agent_response, synthesize_response
+from .routing import domain_router
+from .query_log import record_chunks
+from .schemas import ContextSource, KnowledgeChunk, MetadataFilter, PackedContext
+
+
+logger = logging.getLogger(__name__)
+
+
+CITATION_PATTERN = re.compile(r"\[(\d+)\]")
+
+
+async def run_domain_agent(
+    conn,
+    domain: str,
+    query: str,
+    query_embedding: List[float],
+    domain_count: int = len(DOMAIN_AGENTS),
+    filters: Optional[MetadataFilter] = None,
+    chunks: Optional[List[KnowledgeChunk]] = None
+) -> Optional[Tuple[PackedContext, str]]:
+    """Retrieve context from one domain, unless given, and draft an answer from it."""
+    if chunks is None:
+        chunks = await retrieve_chunks(conn, query, domain_filter=domain, query_embedding=query_embedding, filters=filters)
+    record_chunks(chunk.id for chunk in chunks)
+    if not chunks:
+        return None
+
+    # Each draft is merged later, so the domains share the prompt budget
+    context = pack_context(chunks, token_budget=settings.CONTEXT_TOKEN_BUDGET // domain_count)
+    draft = await get_agent_response(query=query, context=context, domain=domain)
+    return context, draft
+
+
+async def route_domains(conn, query_embedding: List[float]) -> List[str]:
+    """The domains whose agents should answer, all of them unless routing is confident."""
+    domains = list(DOMAIN_AGENTS)
+    if settings.DOMAIN_ROUTING_ENABLED:
+        # Refreshing the centroids queries the database
+        routed = await run_in_search_thread(conn, domain_router.route, query_embedding)
+        if routed:
+            domains = [domain for domain in domains if domain in routed] or domains
+    return domains
+
+
+def renumber_citations(draft: str, mapping: Dict[int, int]) -> str:
+    """Rewrite a draft's local [n] citations to the merged source numbering."""
+    def replace(match):
+        number = int(match.group(1))
+        return f"[{mapping.get(number, number)}]"
+    return CITATION_PATTERN.sub(replace, draft)
+
+
+async def answer_across_domains(
+    conn,
+    query: str,
+    timings: Optional[Dict[str, float]] = None,
+    filters: Optional[MetadataFilter] = None,
+    query_embedding: Optional[List[float]] = None,
+    prefetched: Optional[Dict[str, List[KnowledgeChunk]]] = None
+) -> Tuple[Optional[str], List[ContextSource], Dict[str, Any]]:
+    """
+    Fan an unscoped query out to the domain agents concurrently.
+
+    The query is embedded once and, when domain routing is confident, only
+    the agents of the routed domains run. Each agent then retrieves and
+    drafts under DOMAIN_AGENT_TIMEOUT; routing and retrieval run off the
+    event loop, so a slow database can't hold up the other agents or the
+    timeouts. Agents that time out are left out of the synthesis instead of
+    holding up the answer. Metadata filters apply to every agent's
+    retrieval. An embedding and per-domain chunks from a prefetch are used
+    instead of fetching them again. Returns the answer (None when no domain
+    had relevant context), the merged sources and a per-domain status report.
+    """
+    timings = timings if timings is not None else {}
+
+    if query_embedding is None:
+        started = time.perf_counter()
+        query_embedding = await generate_embedding(query)
+        timings["embedding_ms"] = (time.perf_counter() - started) * 1000
+
+    # A prefetch already routed the query and retrieved each domain's chunks
+    prefetched = prefetched or {}
+    domains = list(prefetched) or await route_domains(conn, query_embedding)
+
+    started = time.perf_counter()
+    tasks = {
+        domain: asyncio.ensure_future(
+            asyncio.wait_for(
+                run_domain_agent(conn, domain, query, query_embedding, len(domains), filters, prefetched.get(domain)),
+                timeout=settings.DOMAIN_AGENT_TIMEOUT
+            )
+        )
+        for domain in domains
+    }
+    await asyncio.wait(tasks.values())
+    timings["domain_agents_ms"] = (time.perf_counter() - started) * 1000
+
+    # Collect finished drafts in a stable domain order and merge their sources
+    report = {domain: "not_routed" for domain in DOMAIN_AGENTS if domain not in tasks}
+    drafts = {}
+    sources: List[ContextSource] = []
+    for domain, task in tasks.items():
+        error = task.exception()
+        if isinstance(error, asyncio.TimeoutError):
+            report[domain] = "timeout"
+            continue
+        if error is not None:
+            logger.warning("Domain agent '%s' failed: %s", domain, error)
+            report[domain] = "error"
+            continue
+        result = task.result()
+        if result is None:
+            report[domain] = "no_context"
+            continue
+
+        context, draft = result
+        mapping = {}
+        for source in context.sources:
+            mapping[source.number] = len(sources) + 1
+            sources.append(source.copy(update={"number": len(sources) + 1}))
+        drafts[domain] = renumber_citations(draft, mapping)
+        report[domain] = "ok"
+
+    if not drafts:
+        return None, [], report
+
+    started = time.perf_counter()
+    response = await synthesize_response(query, drafts)
+    timings["synthesis_ms"] = (time.perf_counter() - started) * 1000
+
+    return response, sources, report
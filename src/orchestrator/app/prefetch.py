@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from .config import settings
+from .admission import query_slots, request_priority
+from .coalesce import normalize_query, query_scope
+from .db_router import acquire_read_connection, release_connection
+from .db_utils import generate_embedding, retrieve_chunks, searches_finished
+from .metrics import CACHE_HITS
+from .multi_agent import route_domains
+from .resilience import request_budget
+from .schemas import KnowledgeChunk, QueryRequest
+
+
+logger = logging.getLogger(__name__)
+
+# Query embedding and the retrieved chunks by domain; None holds the chunks of
+# a single retrieval, domain names those of the domain agents. Chunks are
+# None when only the embedding can be reused.
+Prefetched = Tuple[List[float], Optional[Dict[Optional[str], List[KnowledgeChunk]]]]
+
+# A prefetch's result along with the WAL position its chunks were read at
+Fetched = Tuple[Prefetched, str]
+
+
+def _read_lsn(conn) -> str:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT (CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END)::text"
+        )
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+async def prefetch_retrieval(query_request: QueryRequest) -> Fetched:
+    """
+    Embed a draft query and retrieve its chunks the way the pipeline would.
+    Drafts are admitted through the query slots at batch priority and share
+    one REQUEST_BUDGET_SECONDS, like the queries they stand in for.
+    """
+    with request_priority("batch"):
+        async with query_slots.slot():
+            with request_budget(settings.REQUEST_BUDGET_SECONDS):
+                embedding = await generate_embedding(query_request.query)
+                conn = await acquire_read_connection(min_lsn=query_request.read_after_lsn)
+                try:
+                    lsn = _read_lsn(conn)
+                    if not query_request.domain and settings.MULTI_AGENT_ENABLED:
+                        domains = await route_domains(conn, embedding)
+                        chunks = {
+                            domain: await retrieve_chunks(
+                                conn, query_request.query, domain_filter=domain, query_embedding=embedding, filters=query_request.filters
+                            )
+                            for domain in domains
+                        }
+                    else:
+                        chunks = {
+                            None: await retrieve_chunks(
+                                conn,
+                                query_request.query,
+                                domain_filter=query_request.domain or None,
+                                query_embedding=embedding,
+                                filters=query_request.filters
+                            )
+                        }
+                finally:
+                    # A cancelled prefetch's search finishes before the connection is reused
+                    await searches_finished(conn)
+                    release_connection(conn)
+    return (embedding, chunks), lsn
+
+
+def _parse_lsn(lsn: str) -> int:
+    high, _, low = lsn.partition("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+def _read_after(lsn: str, query_request: QueryRequest) -> bool:
+    """Whether chunks read at `lsn` already reflect the query's read_after_lsn."""
+    if not query_request.read_after_lsn:
+        return True
+    try:
+        return _parse_lsn(lsn) >= _parse_lsn(query_request.read_after_lsn)
+    except ValueError:
+        return False
+
+
+def _log_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.debug("Prefetch failed: %s", task.exception())
+
+
+class Prefetch:
+    def __init__(self, query_request: QueryRequest, task: asyncio.Task):
+        self.query = normalize_query(query_request.query)
+        self.scope = query_scope(query_request)
+        self.task = task
+        self.expires = time.monotonic() + settings.PREFETCH_TTL
+
+
+class PrefetchCache:
+    """
+    The latest speculative retrieval per session, started from the draft the
+    user is still typing.
+
+    A session has at most one prefetch: a changed draft cancels the previous
+    one if it is still running. The final query claims the prefetch and
+    reuses its chunks when the normalized text is unchanged, or when it was
+    edited but its embedding is within PREFETCH_SIMILARITY of the draft's,
+    provided it shares the draft's coalescing scope (domain, filters,
+    read_after_lsn and retrieval settings) and the chunks were read at or
+    after its read_after_lsn. Entries expire after PREFETCH_TTL and only the
+    PREFETCH_MAX_SESSIONS most recent sessions are kept.
+    """
+
+    def __init__(self, max_sessions: int):
+        self._entries: "OrderedDict[str, Prefetch]" = OrderedDict()
+        self.max_sessions = max_sessions
+        self.started = 0
+        self.cancelled = 0
+        self.reused = 0
+        self.reused_near = 0
+        self.wasted = 0
+
+    def _discard(self, entry: Prefetch):
+        if not entry.task.done():
+            entry.task.cancel()
+            self.cancelled += 1
+        else:
+            self.wasted += 1
+
+    def _running(self) -> int:
+        return sum(1 for entry in self._entries.values() if not entry.task.done())
+
+    def start(self, query_request: QueryRequest, work: Callable[[], Awaitable[Fetched]]) -> str:
+        """Start prefetching a session's draft. Returns started, unchanged or skipped."""
+        now = time.monotonic()
+        session = query_request.session_id
+        current = self._entries.pop(session, None)
+        if current is not None:
+            if (
+                current.query == normalize_query(query_request.query)
+                and current.scope == query_scope(query_request)
+                and current.expires > now
+            ):
+                self._entries[session] = current
+                return "unchanged"
+            self._discard(current)
+
+        # Drafts are only a hint, so they never queue behind each other
+        if self._running() >= settings.PREFETCH_MAX_CONCURRENCY:
+            return "skipped"
+
+        task = asyncio.ensure_future(work())
+        task.add_done_callback(_log_failure)
+        self._entries[session] = Prefetch(query_request, task)
+        self.started += 1
+
+        while len(self._entries) > self.max_sessions:
+            self._discard(self._entries.popitem(last=False)[1])
+        return "started"
+
+    async def take(self, query_request: QueryRequest) -> Optional[Prefetched]:
+        """
+        Claim the session's prefetch for its final query. Returns None when
+        there is nothing to reuse; the final query's embedding alone when the
+        draft was too different.
+        """
+        entry = self._entries.pop(query_request.session_id, None)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic() or entry.scope != query_scope(query_request):
+            self._discard(entry)
+            return None
+
+        if entry.query == normalize_query(query_request.query):
+            # Waiting for a prefetch in progress beats starting over
+            try:
+                prefetched, lsn = await asyncio.shield(entry.task)
+            except asyncio.CancelledError:
+                if not entry.task.cancelled():
+                    raise
+                return None
+            except Exception:
+                return None
+            if not _read_after(lsn, query_request):
+                # The embedding doesn't depend on the data, the chunks do
+                self.wasted += 1
+                return prefetched[0], None
+            self.reused += 1
+            CACHE_HITS.labels(cache="prefetch").inc()
+            return prefetched
+
+        if not entry.task.done() or entry.task.cancelled() or entry.task.exception() is not None:
+            self._discard(entry)
+            return None
+        (draft_embedding, chunks), lsn = entry.task.result()
+        embedding = await generate_embedding(query_request.query)
+        draft, final = np.asarray(draft_embedding), np.asarray(embedding)
+        similarity = float(draft @ final / (np.linalg.norm(draft) * np.linalg.norm(final) or 1.0))
+        if similarity < settings.PREFETCH_SIMILARITY or not _read_after(lsn, query_request):
+            self.wasted += 1
+            return embedding, None
+        self.reused_near += 1
+        CACHE_HITS.labels(cache="prefetch_near").inc()
+        return embedding, chunks
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._entries),
+            "running": self._running(),
+            "started": self.started,
+            "cancelled": self.cancelled,
+            "reused": self.reused,
+            "reused_near": self.reused_near,
+            "wasted": self.wasted,
+        }
+
+
+prefetches = PrefetchCache(settings.PREFETCH_MAX_SESSIONS)
@@ -0,0 +1,8 @@
+from commandcore_common.profiling import Profiler, profiling_requested
+from .config import settings
+
+
+# Stacks are sampled on request only; slow runs keep their stage timings
+profiler = Profiler.from_settings(settings)
+profiled = profiler.profiled
+traces = profiler.traces
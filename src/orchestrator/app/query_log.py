@@ -0,0 +1,138 @@
+import asyncio
+import contextvars
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+import psycopg2
+import psycopg2.extras
+from .config import settings
+from .admission import Overloaded
+from .coalesce import normalize_query
+from .db_router import router
+from .metrics import QUERY_LOG_ROWS
+from .schemas import QueryRequest
+
+
+logger = logging.getLogger(__name__)
+
+_record: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("query_record", default=None)
+
+
+@contextmanager
+def query_record() -> Iterator[Dict[str, Any]]:
+    """
+    Collect what the pipeline did for a request: where the answer came from,
+    the retrieved chunk IDs, stage timings and tokens. Tasks started inside
+    the block share the same record, so a coalesced pipeline fills in the
+    record of the request that started it; followers keep "coalesced".
+    """
+    record = {"served_from": "coalesced", "chunk_ids": [], "timings": {}, "prompt_tokens": 0, "completion_tokens": 0}
+    token = _record.set(record)
+    try:
+        yield record
+    finally:
+        _record.reset(token)
+
+
+def record_served_from(source: str, timings: Optional[Dict[str, float]] = None):
+    record = _record.get()
+    if record is not None:
+        record["served_from"] = source
+        if timings is not None:
+            record["timings"] = timings
+
+
+def record_chunks(chunk_ids: Iterable[int]):
+    record = _record.get()
+    if record is not None:
+        record["chunk_ids"].extend(chunk_ids)
+
+
+def record_tokens(prompt_tokens: int, completion_tokens: int):
+    record = _record.get()
+    if record is not None:
+        record["prompt_tokens"] += prompt_tokens
+        record["completion_tokens"] += completion_tokens
+
+
+class QueryLog:
+    """
+    Rows for the query_log table, buffered in memory and written in batches
+    by run_query_log_flusher so requests never wait on the insert. While the
+    database is unreachable or behind, the oldest rows beyond `max_buffer`
+    are dropped instead of growing the buffer without bound.
+    """
+
+    def __init__(self, max_buffer: int):
+        self._rows: Deque[Tuple] = deque()
+        self.max_buffer = max_buffer
+
+    def add(self, query_request: QueryRequest, record: Dict[str, Any], status: int, latency_ms: float):
+        if len(self._rows) >= self.max_buffer:
+            self._rows.popleft()
+            QUERY_LOG_ROWS.labels(outcome="dropped").inc()
+        self._rows.append((
+            query_request.query,
+            normalize_query(query_request.query),
+            query_request.domain or "",
+            bool(query_request.filters and not query_request.filters.is_empty()),
+            record["served_from"],
+            status,
+            sorted(set(record["chunk_ids"])),
+            psycopg2.extras.Json(record["timings"]),
+            record["prompt_tokens"],
+            record["completion_tokens"],
+            latency_ms
+        ))
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _write(self, rows: List[Tuple]):
+        conn = router.connect_primary()
+        try:
+            cursor = conn.cursor()
+            psycopg2.extras.execute_values(
+                cursor,
+                """
+                INSERT INTO query_log (
+                    query, query_key, domain, filtered, served_from, status,
+                    chunk_ids, timings, prompt_tokens, completion_tokens, latency_ms
+                ) VALUES %s
+                """,
+                rows,
+                template="(%s, %s, %s, %s, %s, %s, %s::int[], %s, %s, %s, %s)",
+                page_size=len(rows)
+            )
+            conn.commit()
+            cursor.close()
+        finally:
+            router.release(conn)
+
+    async def flush(self):
+        """Write everything buffered so far, QUERY_LOG_BATCH_SIZE rows per insert."""
+        while self._rows:
+            batch = [self._rows.popleft() for _ in range(min(settings.QUERY_LOG_BATCH_SIZE, len(self._rows)))]
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except (psycopg2.Error, Overloaded) as e:
+                logger.warning("Could not write %d query log rows: %s", len(batch), e)
+                QUERY_LOG_ROWS.labels(outcome="failed").inc(len(batch))
+                return
+            QUERY_LOG_ROWS.labels(outcome="written").inc(len(batch))
+
+
+query_log = QueryLog(settings.QUERY_LOG_MAX_BUFFER)
+
+
+async def run_query_log_flusher():
+    """Background task: write the buffered query log every QUERY_LOG_FLUSH_INTERVAL."""
+    try:
+        while True:
+            await asyncio.sleep(settings.QUERY_LOG_FLUSH_INTERVAL)
+            await query_log.flush()
+    except asyncio.CancelledError:
+        # Keep what was logged before shutdown
+        await query_log.flush()
+        raise
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from functools import lru_cache
+from typing import List, Optional
+import numpy as np
+from .config import settings
+from .schemas import KnowledgeChunk
+
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length so dot products are cosine similarities."""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def mmr_select(
+    query_embedding: np.ndarray,
+    candidate_embeddings: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.7,
+    relevance: Optional[np.ndarray] = None
+) -> List[int]:
+    """
+    Select k candidate indices with maximal marginal relevance.
+
+    The candidate-to-candidate similarity matrix is computed in one matrix
+    product; each selection step is then a vectorized max over it.
+    `relevance` overrides the cosine similarity to the query, e.g. with
+    cross-encoder scores.
+    """
+    n_candidates = candidate_embeddings.shape[0]
+    if n_candidates == 0 or k <= 0:
+        return []
+    k = min(k, n_candidates)
+
+    candidates = normalize_rows(candidate_embeddings.astype(np.float32, copy=False))
+    if relevance is None:
+        query = normalize_rows(query_embedding.astype(np.float32, copy=False).reshape(1, -1))[0]
+        relevance = candidates @ query
+    pairwise = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of every candidate to anything already selected
+    redundancy = pairwise[selected[0]].copy()
+    available = np.ones(n_candidates, dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+
+    return selected
+
+
+@lru_cache(maxsize=1)
+def get_cross_encoder():
+    """
+    Load the optional local cross-encoder named by RERANK_CROSS_ENCODER_MODEL.
+    Returns None when no model is configured or sentence-transformers is missing.
+    """
+    if not settings.RERANK_CROSS_ENCODER_MODEL:
+        return None
+    try:
+        from sentence_transformers import CrossEncoder
+    except ImportError:
+        logger.warning("sentence-transformers is not installed, cross-encoder reranking disabled")
+        return None
+    return CrossEncoder(settings.RERANK_CROSS_ENCODER_MODEL)
+
+
+async def cross_encoder_scores(query: str, chunks: List[KnowledgeChunk]) -> Optional[np.ndarray]:
+    """Score (query, chunk) pairs with the cross-encoder, if one is configured."""
+    model = get_cross_encoder()
+    if model is None:
+        return None
+    pairs = [(query, chunk.text) for chunk in chunks]
+    scores = await asyncio.to_thread(model.predict, pairs)
+    return np.asarray(scores, dtype=np.float32)
+
+
+async def rerank_chunks(
+    query: str,
+    query_embedding: np.ndarray,
+    chunks: List[KnowledgeChunk],
+    embeddings: np.ndarray,
+    top_k: Optional[int] = None
+) -> List[KnowledgeChunk]:
+    """Pick a relevant but diverse subset of the over-fetched candidates."""
+    top_k = top_k or settings.RERANK_TOP_K
+    if len(chunks) <= 1:
+        return chunks[:top_k]
+
+    relevance = await cross_encoder_scores(query, chunks)
+    if relevance is not None:
+        # Bring cross-encoder logits onto the same 0..1 scale as cosine similarity
+        relevance = 1.0 / (1.0 + np.exp(-relevance))
+
+    selected = mmr_select(
+        query_embedding,
+        embeddings,
+        k=top_k,
+        lambda_mult=settings.MMR_LAMBDA,
+        relevance=relevance
+    )
+    return [chunks[i] for i in selected]
@@ -0,0 +1,77 @@
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .config import settings
+from .vectors import decode_vector
+from .metrics import DOMAIN_ROUTING
+
+
+logger = logging.getLogger(__name__)
+
+
+class DomainRouter:
+    """
+    Route unscoped queries to the domains their embedding is closest to.
+
+    Centroids are the normalised per-domain embedding sums kept in
+    domain_centroids by the ingestion service, re-read every
+    DOMAIN_ROUTING_REFRESH seconds. Query-to-centroid cosine scores are
+    turned into probabilities with a softmax; the query is routed to the
+    fewest top domains (at most DOMAIN_ROUTING_MAX_DOMAINS) whose combined
+    probability reaches DOMAIN_ROUTING_CONFIDENCE, and searches globally
+    otherwise.
+    """
+
+    def __init__(self):
+        self._domains: List[str] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._loaded_at = 0.0
+
+    def _refresh(self, cursor):
+        cursor.execute(
+            "SELECT domain, vector_send(embedding_sum) FROM domain_centroids WHERE chunk_count >= %s ORDER BY domain",
+            (settings.DOMAIN_ROUTING_MIN_CHUNKS,)
+        )
+        rows = cursor.fetchall()
+        self._loaded_at = time.monotonic()
+        if len(rows) < 2:
+            self._domains, self._centroids = [], None
+            return
+        centroids = np.stack([decode_vector(embedding_sum) for _, embedding_sum in rows])
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self._domains = [domain for domain, _ in rows]
+        self._centroids = centroids / np.maximum(norms, 1e-12)
+
+    def scores(self, cursor, query_embedding: List[float]) -> Dict[str, float]:
+        """Routing probability per domain; empty when there is nothing to route between."""
+        if time.monotonic() - self._loaded_at > settings.DOMAIN_ROUTING_REFRESH:
+            self._refresh(cursor)
+        if self._centroids is None:
+            return {}
+        query = np.asarray(query_embedding, dtype=np.float32)
+        similarities = self._centroids @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        logits = (similarities - similarities.max()) / settings.DOMAIN_ROUTING_TEMPERATURE
+        probabilities = np.exp(logits) / np.exp(logits).sum()
+        return dict(zip(self._domains, probabilities.tolist()))
+
+    def route(self, cursor, query_embedding: List[float]) -> Optional[List[str]]:
+        """The domains to search, most likely first, or None for a global search."""
+        scores = self.scores(cursor, query_embedding)
+        if not scores:
+            return None
+        ranked: List[Tuple[str, float]] = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        confidence = 0.0
+        for count, (_, probability) in enumerate(ranked[:settings.DOMAIN_ROUTING_MAX_DOMAINS], start=1):
+            confidence += probability
+            if confidence >= settings.DOMAIN_ROUTING_CONFIDENCE:
+                if count == len(ranked):
+                    # Every domain is as good as a global search
+                    break
+                DOMAIN_ROUTING.labels(outcome=f"routed_{count}").inc()
+                return [domain for domain, _ in ranked[:count]]
+        DOMAIN_ROUTING.labels(outcome="global_low_confidence").inc()
+        return None
+
+
+domain_router = DomainRouter()
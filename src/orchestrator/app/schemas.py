@@ -1,12 +1,30 @@
 from pydantic import BaseModel, Field
 from typing import Dict, List, Optional, Any
-from datetime import datetime
+from datetime import date, datetime
+
+
+class MetadataFilter(BaseModel):
+    # Publication date range, inclusive
+    published_after: Optional[date] = None
+    published_before: Optional[date] = None
+    # Any of these, matched case-insensitively
+    authors: List[str] = []
+    classifications: List[str] = []
+
+    def is_empty(self) -> bool:
+        return not (self.published_after or self.published_before or self.authors or self.classifications)
 
 
 class QueryRequest(BaseModel):
     query: str
     domain: Optional[str] = None
+    # Only retrieve chunks of documents matching these metadata filters
+    filters: Optional[MetadataFilter] = None
     conversation_id: Optional[str] = None
+    # commit_lsn of an ingestion job; the query is only served by a replica that has replayed it
+    read_after_lsn: Optional[str] = Field(None, regex=r"^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$")
+    # Client session, lets /v1/query reuse the session's /v1/query/prefetch retrieval
+    session_id: Optional[str] = None
 
 
 class SourceCitation(BaseModel):
@@ -21,6 +39,8 @@ class QueryResponse(BaseModel):
     response: str
     sources: List[Dict[str, Any]] = []
     conversation_id: Optional[str] = None
+    timings: Dict[str, float] = {}
+    domain_status: Dict[str, str] = {}
     timestamp: str = Field(default_factory=lambda: datetime.now().isoformat())
 
 
@@ -29,3 +49,21 @@ class KnowledgeChunk(BaseModel):
     text: str
     source_info: Dict[str, Any]
     similarity: float
+    metadata: Dict[str, Any] = {}
+    document_id: Optional[str] = None
+
+
+class ContextSource(BaseModel):
+    number: int
+    title: str
+    author: str
+    publication_date: str
+    url: Optional[str] = None
+    chunk_ids: List[int] = []
+
+
+class PackedContext(BaseModel):
+    text: str
+    sources: List[ContextSource] = []
+    token_count: int = 0
+    chunk_ids: List[int] = []
@@ -0,0 +1,433 @@
+"""
+In-process replica of the knowledge base for vector search.
+
+A snapshot of `knowledge_chunks` is written to VECTOR_INDEX_DIR as plain
+.npy files: unit-normalised embeddings sorted by IVF list, the list offsets
+and centroids, chunk ids, domains and document ids. Chunk text and metadata
+go to a JSON-lines file indexed by byte offset. Every uvicorn worker
+memory-maps the same files read-only, so the snapshot is shared through the
+page cache instead of being copied per process, and a record is only
+decoded once it is among the results.
+
+Changes made after the snapshot are read from the `knowledge_chunk_changes`
+table (filled by a trigger on `knowledge_chunks`) and kept in a small
+per-worker delta segment. The log is followed by (transaction id, seq)
+rather than seq alone, and only up to the xmin of the reader's snapshot:
+sequence numbers are handed out before commit, so a lower seq can become
+visible after a higher one was read, but no transaction older than xmin
+can. The sync thread builds each new delta separately and swaps it in, so
+searches running meanwhile see either the old delta or the new one. Once
+the delta grows past VECTOR_INDEX_REBUILD_DELTA one worker rebuilds the
+snapshot under a file lock and the others pick it up on their next sync. A
+replica that falls behind the log's pruning is rebuilt the same way.
+
+Documents queued for deletion keep their chunks until the ingestion
+service's maintenance job removes them, so each sync also reads the ids of
+those documents and searches skip their chunks.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import mmap
+import os
+import shutil
+import time
+from typing import List, Dict, Any, NamedTuple, Optional, Set, Tuple
+import numpy as np
+import psycopg2.extras
+from .config import settings
+from .schemas import KnowledgeChunk
+from .rerank import normalize_rows
+from .vectors import decode_vector, decode_vectors
+from .db_router import get_read_connection, release_connection
+
+
+logger = logging.getLogger(__name__)
+
+
+# Embeddings are read in pgvector's binary format
+CHUNK_COLUMNS = "id, chunk_text, document_id::text AS document_id, chunk_metadata, domain, vector_send(embedding) AS embedding"
+
+# Bumped whenever the snapshot layout changes; older snapshots are rebuilt
+SNAPSHOT_FORMAT = 4
+
+
+def _kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the vectors, returns unit centroids."""
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > settings.VECTOR_INDEX_TRAIN_SAMPLE:
+        sample = vectors[rng.choice(len(vectors), settings.VECTOR_INDEX_TRAIN_SAMPLE, replace=False)]
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for cluster in range(n_clusters):
+            members = sample[assignment == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+        centroids = normalize_rows(centroids)
+    return centroids
+
+
+def _row_to_record(row) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "text": row["chunk_text"],
+        "document_id": row["document_id"],
+        "metadata": row["chunk_metadata"] or {},
+        "domain": row["domain"],
+    }
+
+
+def build_snapshot(conn, index_dir: Optional[str] = None) -> str:
+    """
+    Export knowledge_chunks into a new IVF snapshot and point `current` at it.
+    Returns the snapshot directory.
+    """
+    index_dir = index_dir or settings.VECTOR_INDEX_DIR
+    os.makedirs(index_dir, exist_ok=True)
+    # The position and the rows have to come from the same database snapshot
+    conn.rollback()
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    try:
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        # Every change missing from the export was made by a transaction at or after xmin
+        cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text")
+        xmin = int(cursor.fetchone()[0])
+        cursor.execute(f"SELECT {CHUNK_COLUMNS} FROM knowledge_chunks ORDER BY id")
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.rollback()
+
+    dimensions = 1536
+    embeddings = normalize_rows(decode_vectors([r["embedding"] for r in rows], dimensions))
+    records = [_row_to_record(r) for r in rows]
+
+    n_lists = max(1, int(np.sqrt(len(records)))) if len(records) >= settings.VECTOR_INDEX_MIN_IVF_ROWS else 1
+    if n_lists > 1:
+        centroids = _kmeans(embeddings, n_lists)
+        assignment = np.argmax(embeddings @ centroids.T, axis=1)
+    else:
+        centroids = np.zeros((1, embeddings.shape[1]), dtype=np.float32)
+        assignment = np.zeros(len(records), dtype=np.int64)
+
+    # Store every IVF list as one contiguous block of rows
+    order = np.argsort(assignment, kind="stable")
+    offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(assignment, minlength=n_lists))
+
+    version = f"{int(time.time() * 1000)}-{os.getpid()}"
+    snapshot_dir = os.path.join(index_dir, version)
+    os.makedirs(snapshot_dir)
+    np.save(os.path.join(snapshot_dir, "embeddings.npy"), embeddings[order])
+    np.save(os.path.join(snapshot_dir, "ids.npy"), np.array([records[i]["id"] for i in order], dtype=np.int64))
+    np.save(os.path.join(snapshot_dir, "domains.npy"), np.array([records[i]["domain"] for i in order], dtype="U16"))
+    np.save(
+        os.path.join(snapshot_dir, "document_ids.npy"),
+        np.array([records[i]["document_id"] or "" for i in order], dtype="U36")
+    )
+    np.save(os.path.join(snapshot_dir, "centroids.npy"), centroids)
+    np.save(os.path.join(snapshot_dir, "offsets.npy"), offsets)
+    # One record per line; record_offsets[row]:record_offsets[row + 1] is its byte range
+    record_offsets = [0]
+    with open(os.path.join(snapshot_dir, "records.jsonl"), "wb") as f:
+        for i in order:
+            f.write(json.dumps(records[i]).encode() + b"\n")
+            record_offsets.append(f.tell())
+    np.save(os.path.join(snapshot_dir, "record_offsets.npy"), np.array(record_offsets, dtype=np.int64))
+    with open(os.path.join(snapshot_dir, "manifest.json"), "w") as f:
+        json.dump({"version": version, "format": SNAPSHOT_FORMAT, "xmin": xmin, "count": len(records), "lists": n_lists}, f)
+
+    # Atomically switch `current` to the new snapshot and drop older ones
+    current = os.path.join(index_dir, "current")
+    previous = os.path.realpath(current) if os.path.islink(current) else None
+    temp_link = os.path.join(index_dir, f".current-{version}")
+    os.symlink(version, temp_link)
+    os.replace(temp_link, current)
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if name in (version, "current", ".lock") or path == previous:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+    return snapshot_dir
+
+
+class Delta(NamedTuple):
+    """Rows changed since the snapshot; removed ids hide their snapshot rows."""
+    removed: frozenset
+    records: Dict[int, Dict[str, Any]]
+    ids: List[int]
+    matrix: np.ndarray
+
+
+class VectorIndex:
+    """Read-only snapshot plus per-worker delta of recent changes."""
+
+    def __init__(self, snapshot_dir: str):
+        with open(os.path.join(snapshot_dir, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.snapshot_dir = os.path.realpath(snapshot_dir)
+        self.embeddings = np.load(os.path.join(snapshot_dir, "embeddings.npy"), mmap_mode="r")
+        self.ids = np.load(os.path.join(snapshot_dir, "ids.npy"), mmap_mode="r")
+        self.domains = np.load(os.path.join(snapshot_dir, "domains.npy"), mmap_mode="r")
+        self.document_ids = np.load(os.path.join(snapshot_dir, "document_ids.npy"), mmap_mode="r")
+        self.centroids = np.load(os.path.join(snapshot_dir, "centroids.npy"))
+        self.offsets = np.load(os.path.join(snapshot_dir, "offsets.npy"))
+        self.record_offsets = np.load(os.path.join(snapshot_dir, "record_offsets.npy"), mmap_mode="r")
+        with open(os.path.join(snapshot_dir, "records.jsonl"), "rb") as f:
+            # mmap cannot map an empty file
+            self.records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.record_offsets[-1] else b""
+        # (transaction id, seq) of the last change folded into the delta
+        self.position: Tuple[int, int] = (self.manifest["xmin"], 0)
+        self.synced_at = time.monotonic()
+
+        # Replaced as a whole by apply_changes, never changed in place
+        self.delta = Delta(frozenset(), {}, [], np.empty((0, self.embeddings.shape[1]), dtype=np.float32))
+        # Documents queued for deletion whose chunks are not removed yet
+        self.deleted_documents: Set[str] = set()
+
+    @property
+    def delta_size(self) -> int:
+        return len(self.delta.records) + len(self.delta.removed)
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """Decode the snapshot record stored at `row`."""
+        return json.loads(self.records[self.record_offsets[row]:self.record_offsets[row + 1]])
+
+    def apply_changes(self, deleted_ids: List[int], rows: List[Any], position: Tuple[int, int]):
+        """Fold changes read from knowledge_chunk_changes into the delta."""
+        delta = self.delta
+        removed = set(delta.removed)
+        records = dict(delta.records)
+        embeddings = dict(zip(delta.ids, delta.matrix))
+        for chunk_id in deleted_ids:
+            removed.add(chunk_id)
+            records.pop(chunk_id, None)
+            embeddings.pop(chunk_id, None)
+        for row in rows:
+            removed.add(row["id"])
+            records[row["id"]] = _row_to_record(row)
+            embeddings[row["id"]] = normalize_rows(decode_vector(row["embedding"]).reshape(1, -1))[0]
+        ids = list(embeddings)
+        matrix = np.stack([embeddings[i] for i in ids]) if ids else np.empty((0, self.embeddings.shape[1]), dtype=np.float32)
+        self.delta = Delta(frozenset(removed), records, ids, matrix)
+        self.position = position
+
+    def mark_synced(self):
+        self.synced_at = time.monotonic()
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.monotonic() - self.synced_at < settings.VECTOR_INDEX_MAX_STALENESS
+
+    def search(
+        self,
+        query_embedding: List[float],
+        domain_filter: Optional[str] = None,
+        similarity_threshold: float = 0.7,
+        max_results: int = 5,
+        include_embeddings: bool = False
+    ) -> Tuple[List[KnowledgeChunk], Optional[np.ndarray]]:
+        """Same contract as db_utils.search_similar_chunks, served from memory."""
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+        # The sync thread may swap in new state while this runs
+        delta, deleted_documents = self.delta, self.deleted_documents
+
+        # Probe the closest IVF lists of the snapshot
+        n_probe = min(settings.VECTOR_INDEX_NPROBE, len(self.centroids))
+        lists = np.argsort(self.centroids @ query)[::-1][:n_probe]
+        rows = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists]) if len(lists) else np.empty(0, dtype=np.int64)
+        rows = np.sort(rows)
+        scores = self.embeddings[rows] @ query if len(rows) else np.empty(0, dtype=np.float32)
+        keep = scores > similarity_threshold
+        if domain_filter:
+            keep &= self.domains[rows] == domain_filter
+        rows, scores = rows[keep], scores[keep]
+
+        candidates = [
+            (float(score), None, row, None)
+            for row, score in zip(rows, scores)
+            if int(self.ids[row]) not in delta.removed
+            and str(self.document_ids[row]) not in deleted_documents
+        ]
+
+        if delta.ids:
+            delta_scores = delta.matrix @ query
+            for position, score in enumerate(delta_scores):
+                record = delta.records[delta.ids[position]]
+                if (
+                    score > similarity_threshold
+                    and (not domain_filter or record["domain"] == domain_filter)
+                    and record["document_id"] not in deleted_documents
+                ):
+                    candidates.append((float(score), record, None, position))
+
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        # Snapshot records are only decoded for the results
+        candidates = [
+            (score, record if record is not None else self.record(row), row, position)
+            for score, record, row, position in candidates[:max_results]
+        ]
+
+        chunks = [
+            KnowledgeChunk(
+                id=record["id"],
+                text=record["text"],
+                source_info={},
+                similarity=score,
+                metadata=record["metadata"],
+                document_id=record["document_id"]
+            )
+            for score, record, _, _ in candidates
+        ]
+
+        embeddings = None
+        if include_embeddings:
+            vectors = [
+                self.embeddings[row] if row is not None else delta.matrix[position]
+                for _, _, row, position in candidates
+            ]
+            embeddings = np.stack(vectors) if vectors else np.empty((0, self.embeddings.shape[1]), dtype=np.float32)
+
+        return chunks, embeddings
+
+
+_index: Optional[VectorIndex] = None
+
+
+def get_vector_index() -> Optional[VectorIndex]:
+    """Return the replica, or None when it is disabled, not loaded or stale."""
+    if _index is None or not _index.is_fresh:
+        return None
+    return _index
+
+
+def _has_usable_snapshot(current: str) -> bool:
+    try:
+        with open(os.path.join(current, "manifest.json")) as f:
+            return json.load(f).get("format") == SNAPSHOT_FORMAT
+    except (OSError, ValueError):
+        return False
+
+
+def _load_or_build() -> VectorIndex:
+    """Load the current snapshot, building it first if no worker has yet."""
+    index_dir = settings.VECTOR_INDEX_DIR
+    os.makedirs(index_dir, exist_ok=True)
+    current = os.path.join(index_dir, "current")
+    if not _has_usable_snapshot(current):
+        with open(os.path.join(index_dir, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not _has_usable_snapshot(current):
+                conn = get_read_connection()
+                try:
+                    build_snapshot(conn, index_dir)
+                finally:
+                    release_connection(conn)
+    return VectorIndex(current)
+
+
+def _missed_changes(conn, index: VectorIndex) -> bool:
+    """Whether changes the replica had yet to read were pruned from the log."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT pruned_xid::text FROM knowledge_chunk_changes_pruned")
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    return row is not None and int(row[0]) >= index.position[0]
+
+
+def _sync(index: VectorIndex) -> VectorIndex:
+    """Pull new changes into the delta, switching snapshots when needed."""
+    current = os.path.join(settings.VECTOR_INDEX_DIR, "current")
+    if os.path.realpath(current) != index.snapshot_dir:
+        index = VectorIndex(current)
+
+    conn = get_read_connection()
+    try:
+        missed = _missed_changes(conn, index)
+        if missed or index.delta_size > settings.VECTOR_INDEX_REBUILD_DELTA:
+            # Only one worker rebuilds; the rest keep serving their delta
+            with open(os.path.join(settings.VECTOR_INDEX_DIR, ".lock"), "w") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    if missed:
+                        # Not marked synced, so queries go to SQL until the new snapshot lands
+                        return index
+                else:
+                    if os.path.realpath(current) == index.snapshot_dir:
+                        build_snapshot(conn, settings.VECTOR_INDEX_DIR)
+                    index = VectorIndex(current)
+
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        try:
+            cursor.execute("SELECT id::text FROM documents WHERE deleted_at IS NOT NULL")
+            index.deleted_documents = {row[0] for row in cursor.fetchall()}
+
+            cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text")
+            xmin = int(cursor.fetchone()[0])
+            cursor.execute(
+                """
+                SELECT xid::text AS xid, seq, chunk_id, operation
+                FROM knowledge_chunk_changes
+                WHERE (xid, seq) > (%s::xid8, %s) AND xid < %s::xid8
+                ORDER BY xid, seq
+                LIMIT %s
+                """,
+                (str(index.position[0]), index.position[1], str(xmin), settings.VECTOR_INDEX_SYNC_BATCH)
+            )
+            changes = cursor.fetchall()
+            if len(changes) < settings.VECTOR_INDEX_SYNC_BATCH:
+                # Everything below xmin is read; a lagging replica's older xmin never moves the position back
+                position = max(index.position, (xmin, 0))
+            else:
+                position = (int(changes[-1]["xid"]), changes[-1]["seq"])
+            if not changes:
+                index.position = position
+                index.mark_synced()
+                return index
+
+            # Only the latest operation per chunk matters
+            latest = {}
+            for change in changes:
+                latest[change["chunk_id"]] = change["operation"]
+            deleted = [chunk_id for chunk_id, op in latest.items() if op == "D"]
+            upserted = [chunk_id for chunk_id, op in latest.items() if op != "D"]
+
+            rows = []
+            if upserted:
+                cursor.execute(f"SELECT {CHUNK_COLUMNS} FROM knowledge_chunks WHERE id = ANY(%s)", (upserted,))
+                rows = cursor.fetchall()
+            found = {row["id"] for row in rows}
+            deleted.extend(chunk_id for chunk_id in upserted if chunk_id not in found)
+
+            index.apply_changes(deleted, rows, position)
+            index.mark_synced()
+        finally:
+            cursor.close()
+    finally:
+        release_connection(conn)
+
+    return index
+
+
+async def run_vector_index_sync():
+    """Background task: load the replica and keep it in sync with Postgres."""
+    global _index
+    while True:
+        try:
+            if _index is None:
+                _index = await asyncio.to_thread(_load_or_build)
+                logger.info("Vector index loaded: %d chunks in %d lists", _index.manifest["count"], _index.manifest["lists"])
+            _index = await asyncio.to_thread(_sync, _index)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Queries fall back to SQL while the replica is unavailable
+            logger.error("Error syncing vector index: %s", e)
+        await asyncio.sleep(settings.VECTOR_INDEX_SYNC_INTERVAL)
@@ -0,0 +1,33 @@
+from typing import List, Sequence, Union
+import numpy as np
+
+
+# pgvector's binary format (vector_send): int16 dimensions, int16 unused,
+# then big-endian float4 values. The 4-byte header is one float4 slot.
+_HEADER_SLOTS = 1
+_WIRE_DTYPE = np.dtype(">f4")
+
+
+def vector_literal(embedding: Union[Sequence[float], np.ndarray]) -> str:
+    """
+    Render an embedding as a pgvector literal. psycopg2 can only send text
+    parameters, and this is far cheaper for the server to parse than the
+    numeric ARRAY[...] psycopg2 builds from a Python list.
+    """
+    if isinstance(embedding, np.ndarray):
+        # Shortest round-trip digits for the array's own precision
+        return "[" + ",".join(embedding.astype(str)) + "]"
+    return "[" + ",".join(map(repr, embedding)) + "]"
+
+
+def decode_vector(value) -> np.ndarray:
+    """Decode one vector_send() value into a float32 array."""
+    return np.frombuffer(value, dtype=_WIRE_DTYPE)[_HEADER_SLOTS:].astype(np.float32)
+
+
+def decode_vectors(values: List, dimensions: int) -> np.ndarray:
+    """Decode vector_send() values of equal dimensions into one float32 matrix."""
+    if not values:
+        return np.empty((0, dimensions), dtype=np.float32)
+    matrix = np.frombuffer(b"".join(values), dtype=_WIRE_DTYPE).reshape(len(values), dimensions + _HEADER_SLOTS)
+    return matrix[:, _HEADER_SLOTS:].astype(np.float32)
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from typing import Dict
+import psycopg2
+from .config import settings
+from .context import get_tokenizer
+from .db_router import router
+from .db_utils import generate_embedding
+from .rerank import get_cross_encoder
+
+
+logger = logging.getLogger(__name__)
+
+
+# Startup steps and their state: pending, ok, skipped or failed
+readiness: Dict[str, str] = {
+    "database": "pending",
+    "prewarm": "pending",
+    "tokenizer": "pending",
+    "cross_encoder": "pending",
+    "openai": "pending",
+}
+
+
+def is_ready() -> bool:
+    """Ready once every step has finished and the database is reachable."""
+    return readiness["database"] == "ok" and all(state != "pending" for state in readiness.values())
+
+
+def _prewarm_host(host) -> int:
+    """Load the retrieval index and table pages into one host's buffer cache."""
+    conn = router.connect_host(host)
+    try:
+        cursor = conn.cursor()
+        blocks = 0
+        for relation in settings.DB_PREWARM_RELATIONS.split(","):
+            relation = relation.strip()
+            if relation:
+                cursor.execute("SELECT pg_prewarm(%s::regclass)", (relation,))
+                blocks += cursor.fetchone()[0]
+        cursor.close()
+        return blocks
+    finally:
+        router.release(conn)
+
+
+async def _warm_database():
+    # Nothing works without the primary, so keep trying until it answers
+    while True:
+        try:
+            await asyncio.to_thread(router.warm_pools)
+            readiness["database"] = "ok"
+            break
+        except psycopg2.OperationalError as e:
+            logger.warning("Database not reachable yet, retrying: %s", e)
+            await asyncio.sleep(settings.WARMUP_RETRY_SECONDS)
+
+    if not settings.DB_PREWARM_ENABLED:
+        readiness["prewarm"] = "skipped"
+        return
+    try:
+        for host in router.hosts():
+            blocks = await asyncio.to_thread(_prewarm_host, host)
+            logger.info("Prewarmed %d blocks on %s:%s", blocks, host[0], host[1])
+        readiness["prewarm"] = "ok"
+    except psycopg2.Error as e:
+        # Usually the pg_prewarm extension is missing; serve cold rather than not at all
+        logger.warning("Index prewarm failed: %s", e)
+        readiness["prewarm"] = "failed"
+
+
+async def _warm_models():
+    try:
+        await asyncio.to_thread(get_tokenizer)
+        if settings.OPENAI_FALLBACK_MODEL:
+            await asyncio.to_thread(get_tokenizer, settings.OPENAI_FALLBACK_MODEL)
+        readiness["tokenizer"] = "ok"
+    except Exception as e:
+        # Requests will retry loading it, so this only costs the first query
+        logger.warning("Tokenizer preload failed: %s", e)
+        readiness["tokenizer"] = "failed"
+
+    if not (settings.RERANK_ENABLED and settings.RERANK_CROSS_ENCODER_MODEL):
+        readiness["cross_encoder"] = "skipped"
+        return
+    try:
+        loaded = await asyncio.to_thread(get_cross_encoder)
+        readiness["cross_encoder"] = "ok" if loaded is not None else "failed"
+    except Exception as e:
+        logger.warning("Cross-encoder preload failed: %s", e)
+        readiness["cross_encoder"] = "failed"
+
+
+async def _warm_openai():
+    if not settings.WARMUP_OPENAI:
+        readiness["openai"] = "skipped"
+        return
+    try:
+        await generate_embedding("warm up")
+        readiness["openai"] = "ok"
+    except Exception as e:
+        logger.warning("OpenAI warm-up request failed: %s", e)
+        readiness["openai"] = "failed"
+
+
+async def warm_up():
+    """
+    Startup phase run before /ready reports ready: open the connection
+    pools, optionally prewarm the vector index pages, load the tokenizers
+    and cross-encoder, and optionally open the OpenAI connection.
+    """
+    await asyncio.gather(_warm_database(), _warm_models(), _warm_openai())
+    logger.info("Warm-up finished", extra={"readiness": dict(readiness)})
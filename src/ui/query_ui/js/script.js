@@ -20,6 +20,15 @@ document.addEventListener('DOMContentLoaded', function() {
     let currentResponse = '';
     let sessionHistory = [];
     let streamingController = null;
+    let prefetchController = null;
+    let prefetchTimer = null;
+    let lastPrefetch = '';
+    // Lets the orchestrator reuse retrieval prefetched while the user types
+    const sessionId = (window.crypto && crypto.randomUUID)
+        ? crypto.randomUUID()
+        : Date.now().toString(36) + Math.random().toString(36).slice(2);
+    const PREFETCH_DEBOUNCE_MS = 400;
+    const PREFETCH_MIN_LENGTH = 12;
 
     // Event Listeners
     submitButton.addEventListener('click', handleSubmit);
@@ -38,13 +47,73 @@ document.addEventListener('DOMContentLoaded', function() {
         developerSettingsBtn.addEventListener('click', toggleDeveloperSettings);
     }
 
-    // Auto-resize textarea as user types
+    // Auto-resize textarea as user types, and prefetch once they pause
     queryInput.addEventListener('input', function() {
         this.style.height = 'auto';
         this.style.height = (this.scrollHeight) + 'px';
+        schedulePrefetch();
     });
+    domainSelector.addEventListener('change', schedulePrefetch);
 
     // Functions
+    function buildRequestBody(query, domain) {
+        const requestBody = {
+            query: query,
+            session_id: sessionId
+        };
+
+        if (domain && domain !== 'All Domains') {
+            requestBody.domain = domain;
+        }
+        return requestBody;
+    }
+
+    function cancelPrefetch() {
+        clearTimeout(prefetchTimer);
+        prefetchTimer = null;
+        if (prefetchController) {
+            prefetchController.abort();
+            prefetchController = null;
+        }
+    }
+
+    function schedulePrefetch() {
+        clearTimeout(prefetchTimer);
+        prefetchTimer = setTimeout(prefetchDraft, PREFETCH_DEBOUNCE_MS);
+    }
+
+    async function prefetchDraft() {
+        const query = queryInput.value.trim();
+        const requestBody = buildRequestBody(query, domainSelector.value);
+        const key = JSON.stringify(requestBody);
+        if (query.length < PREFETCH_MIN_LENGTH || key === lastPrefetch) {
+            return;
+        }
+        lastPrefetch = key;
+
+        // The server cancels the session's older prefetch; drop our request too
+        if (prefetchController) {
+            prefetchController.abort();
+        }
+        prefetchController = new AbortController();
+        try {
+            await fetch('/api/orchestrator/v1/query/prefetch', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-Request-Priority': 'batch'
+                },
+                body: key,
+                signal: prefetchController.signal
+            });
+        } catch (error) {
+            // Prefetching is only an optimisation; the query works without it
+            if (error.name !== 'AbortError') {
+                console.debug('Prefetch failed:', error);
+            }
+        }
+    }
+
     async function handleSubmit() {
         console.log('Submit button clicked');
         const query = queryInput.value.trim();
@@ -55,6 +124,10 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
 
+        // A pending draft prefetch is superseded by the query itself
+        cancelPrefetch();
+        lastPrefetch = '';
+
         // Save current query
         currentQuery = query;
         console.log('Query:', query);
@@ -99,13 +172,7 @@ document.addEventListener('DOMContentLoaded', function() {
         // Create new abort controller
         streamingController = new AbortController();
         
-        const requestBody = {
-            query: query
-        };
-
-        if (domain && domain !== 'All Domains') {
-            requestBody.domain = domain;
-        }
+        const requestBody = buildRequestBody(query, domain);
 
         console.log('Request body:', JSON.stringify(requestBody));
         console.log('Sending request to: /api/orchestrator/v1/query');
@@ -117,7 +184,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 response = await fetch('/api/orchestrator/v1/query', {
                     method: 'POST',
                     headers: {
-                        'Content-Type': 'application/json'
+                        'Content-Type': 'application/json',
+                        'X-Request-Priority': 'interactive'
                     },
                     body: JSON.stringify(requestBody),
                     signal: streamingController.signal
@@ -0,0 +1,26 @@
+"""
+Shared setup for the component tests, which need no database, OpenAI or
+running services:
+
+    python -m pytest -q tests --ignore=tests/test_api.py
+
+The orchestrator's package is importable as `app` and the ingestion
+service's as `ingestion_app`, since both services name their package `app`.
+"""
+
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+os.environ.setdefault("OPENAI_API_KEY", "test")
+sys.path[:0] = [str(ROOT / "src" / "orchestrator"), str(ROOT / "src" / "common")]
+
+if "ingestion_app" not in sys.modules:
+    _package = ROOT / "src" / "ingestion_service" / "app"
+    _spec = importlib.util.spec_from_file_location(
+        "ingestion_app", _package / "__init__.py", submodule_search_locations=[str(_package)]
+    )
+    sys.modules["ingestion_app"] = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(sys.modules["ingestion_app"])
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Mock OpenAI-compatible server for load testing CommandCore.
+
+Serves /v1/embeddings and /v1/chat/completions (including streaming) with
+configurable latency distributions and error rates, so the orchestrator and
+ingestion service can be driven at high load without real API calls.
+Point the services at it with OPENAI_BASE_URL=http://<host>:9000/v1.
+
+Embeddings are deterministic hashed bag-of-words vectors: texts that share
+words get similar vectors, so retrieval over a seeded corpus behaves
+roughly like the real thing.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DIMENSIONS = 1536
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+app = FastAPI(title="Mock OpenAI API")
+config = argparse.Namespace()
+
+
+def embed_text(text: str) -> list:
+    """Deterministic hashed bag-of-words embedding, unit length."""
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    for word in WORD_PATTERN.findall(text.lower()):
+        digest = hashlib.md5(word.encode()).digest()
+        index = int.from_bytes(digest[:4], "little") % DIMENSIONS
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+
+def sample_latency(median: float, sigma: float) -> float:
+    """Lognormal latency around the median; sigma controls the tail."""
+    if median <= 0:
+        return 0.0
+    return random.lognormvariate(np.log(median), sigma)
+
+
+def maybe_fail():
+    """Return an error response for a configured fraction of requests."""
+    if random.random() < config.error_rate:
+        return JSONResponse(
+            status_code=random.choice([429, 500, 503]),
+            content={"error": {"message": "Injected mock failure", "type": "server_error"}}
+        )
+    return None
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    await asyncio.sleep(sample_latency(config.embedding_latency, config.embedding_sigma))
+    failure = maybe_fail()
+    if failure:
+        return failure
+
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    data = [
+        {"object": "embedding", "index": i, "embedding": embed_text(text)}
+        for i, text in enumerate(inputs)
+    ]
+    tokens = sum(len(text.split()) for text in inputs)
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "text-embedding-ada-002"),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+    }
+
+
+def _answer_words(n_words: int) -> list:
+    return [f"word{i % 50}" for i in range(n_words)]
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "gpt-4-turbo")
+    prompt_tokens = sum(len(m.get("content", "").split()) for m in body.get("messages", []))
+    words = _answer_words(config.completion_tokens)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    # Time to first token, then a steady per-token rate
+    await asyncio.sleep(sample_latency(config.chat_latency, config.chat_sigma))
+    failure = maybe_fail()
+    if failure:
+        return failure
+
+    if body.get("stream"):
+        async def stream():
+            for word in words:
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(config.token_interval)
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    await asyncio.sleep(config.token_interval * len(words))
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": "Mock answer [1]: " + " ".join(words)},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words)
+        }
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mock OpenAI API for load testing")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Median embedding latency in seconds")
+    parser.add_argument("--embedding-sigma", type=float, default=0.3, help="Lognormal sigma of embedding latency")
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="Median time to first token in seconds")
+    parser.add_argument("--chat-sigma", type=float, default=0.5, help="Lognormal sigma of time to first token")
+    parser.add_argument("--token-interval", type=float, default=0.01, help="Seconds between completion tokens")
+    parser.add_argument("--completion-tokens", type=int, default=150, help="Tokens per completion")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    return parser.parse_args(argv)
+
+
+def main():
+    global config
+    config = parse_args()
+    uvicorn.run(app, host=config.host, port=config.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
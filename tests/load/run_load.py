@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Load driver for the CommandCore orchestrator.
+
+Sends synthetic /v1/query traffic either closed-loop (a fixed number of
+concurrent clients) or open-loop (Poisson arrivals at a target rate) and
+reports throughput, error rates and p50/p95/p99 latency end to end and per
+pipeline stage, using the `timings` returned with each response.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from seed_corpus import DOMAINS, make_text
+
+
+class Results:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.stages: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Counter = Counter()
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, status: str, seconds: float, timings: Optional[Dict[str, float]] = None):
+        self.statuses[status] += 1
+        if status == "200":
+            self.latencies.append(seconds * 1000)
+            for name, milliseconds in (timings or {}).items():
+                if name.endswith("_ms"):
+                    self.stages[name[:-3]].append(milliseconds)
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+    }
+
+
+class QueryGenerator:
+    """Synthetic queries; a fraction is drawn from a small hot set to model repeats."""
+
+    def __init__(self, seed: int, hot_set: int, repeat_fraction: float, unscoped_fraction: float):
+        self.rng = random.Random(seed)
+        self.repeat_fraction = repeat_fraction
+        self.unscoped_fraction = unscoped_fraction
+        self.hot = [self._fresh() for _ in range(hot_set)]
+
+    def _fresh(self) -> Dict[str, Optional[str]]:
+        domain = self.rng.choice(list(DOMAINS))
+        query = make_text(self.rng, domain, self.rng.randint(5, 12))
+        scoped = self.rng.random() >= self.unscoped_fraction
+        return {"query": query, "domain": domain if scoped else None}
+
+    def next(self) -> Dict[str, Optional[str]]:
+        if self.hot and self.rng.random() < self.repeat_fraction:
+            return self.rng.choice(self.hot)
+        return self._fresh()
+
+
+async def send_query(client: httpx.AsyncClient, url: str, payload: Dict, results: Results, args):
+    started = time.perf_counter()
+    try:
+        response = await client.post(
+            url,
+            json=payload,
+            headers={"X-Request-Priority": args.priority},
+            timeout=args.timeout
+        )
+        elapsed = time.perf_counter() - started
+        timings = response.json().get("timings") if response.status_code == 200 else None
+        results.record(str(response.status_code), elapsed, timings)
+    except httpx.TimeoutException:
+        results.record("timeout", time.perf_counter() - started)
+    except httpx.HTTPError as e:
+        results.record(type(e).__name__, time.perf_counter() - started)
+
+
+async def run_closed_loop(args, generator: QueryGenerator, results: Results):
+    """Each of `concurrency` clients sends its next query as soon as the last returns."""
+    url = f"{args.url}/v1/query"
+    deadline = time.perf_counter() + args.duration
+    limits = httpx.Limits(max_connections=args.concurrency)
+
+    async with httpx.AsyncClient(limits=limits) as client:
+        async def worker():
+            while time.perf_counter() < deadline:
+                await send_query(client, url, generator.next(), results, args)
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+
+
+async def run_open_loop(args, generator: QueryGenerator, results: Results):
+    """Poisson arrivals at `rate` per second, independent of response times."""
+    url = f"{args.url}/v1/query"
+    deadline = time.perf_counter() + args.duration
+    tasks = set()
+
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=None)) as client:
+        while time.perf_counter() < deadline:
+            task = asyncio.ensure_future(send_query(client, url, generator.next(), results, args))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            await asyncio.sleep(random.expovariate(args.rate))
+        if tasks:
+            await asyncio.gather(*tasks)
+
+
+def build_report(args, results: Results) -> Dict:
+    elapsed = (results.finished or time.perf_counter()) - results.started
+    total = sum(results.statuses.values())
+    errors = total - results.statuses.get("200", 0)
+    return {
+        "mode": "open" if args.rate else "closed",
+        "concurrency": None if args.rate else args.concurrency,
+        "target_rate": args.rate,
+        "duration_s": round(elapsed, 2),
+        "requests": total,
+        "throughput_rps": round(results.statuses.get("200", 0) / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "statuses": dict(results.statuses),
+        "latency_ms": summarize(results.latencies),
+        "stages_ms": {stage: summarize(values) for stage, values in sorted(results.stages.items())},
+    }
+
+
+def print_report(report: Dict):
+    def fmt(value):
+        return "-" if value is None else f"{value:.1f}"
+
+    print(f"Mode: {report['mode']}  requests: {report['requests']}  duration: {report['duration_s']}s")
+    print(f"Throughput: {report['throughput_rps']} req/s  error rate: {report['error_rate']:.2%}")
+    print(f"Statuses: {report['statuses']}")
+    print(f"{'stage':<20}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    rows = [("end_to_end", report["latency_ms"])] + list(report["stages_ms"].items())
+    for name, stats in rows:
+        print(f"{name:<20}{stats['count']:>8}{fmt(stats['p50']):>10}{fmt(stats['p95']):>10}{fmt(stats['p99']):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the CommandCore orchestrator")
+    parser.add_argument("--url", default="http://localhost:8001", help="Orchestrator base URL")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to generate load for")
+    parser.add_argument("--concurrency", type=int, default=10, help="Closed-loop client count")
+    parser.add_argument("--rate", type=float, default=None, help="Open-loop arrival rate (req/s); overrides --concurrency")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--hot-set", type=int, default=20, help="Size of the repeated query set")
+    parser.add_argument("--repeat-fraction", type=float, default=0.2, help="Fraction of queries drawn from the hot set")
+    parser.add_argument("--unscoped-fraction", type=float, default=0.2, help="Fraction of queries without a domain")
+    parser.add_argument("--priority", default="batch", choices=["interactive", "batch"], help="Admission priority class")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the report as JSON to this path")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    generator = QueryGenerator(args.seed, args.hot_set, args.repeat_fraction, args.unscoped_fraction)
+    results = Results()
+    runner = run_open_loop if args.rate else run_closed_loop
+    asyncio.run(runner(args, generator, results))
+    results.finished = time.perf_counter()
+
+    report = build_report(args, results)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["requests"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Seed the knowledge_chunks table with a synthetic corpus for load testing.
+
+Chunks are built from a per-domain vocabulary and embedded with the mock
+server's hashed bag-of-words embedding, so queries generated by
+run_load.py retrieve them through the normal pgvector path.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+
+import psycopg2
+from psycopg2.extras import Json, execute_values
+
+from mock_openai import embed_text
+
+DOMAINS = {
+    "ai": "model training inference neural network transformer attention embedding gradient dataset token prompt agent",
+    "cloud": "kubernetes container cluster autoscaling region latency storage bucket network load balancer serverless",
+    "virt-os": "hypervisor kernel virtual machine scheduler memory paging filesystem driver process thread interrupt",
+}
+COMMON_WORDS = "the a of and to in for with on by is are how what why when which system performance design".split()
+SEED_TAG = "loadtest"
+
+
+def make_text(rng: random.Random, domain: str, n_words: int) -> str:
+    vocabulary = DOMAINS[domain].split()
+    words = [rng.choice(vocabulary) if rng.random() < 0.6 else rng.choice(COMMON_WORDS) for _ in range(n_words)]
+    return " ".join(words)
+
+
+def seed(conn, chunks_per_domain: int, chunk_words: int, chunks_per_document: int, seed_value: int, batch_size: int = 500):
+    rng = random.Random(seed_value)
+    cursor = conn.cursor()
+    total = 0
+    for domain in DOMAINS:
+        rows = []
+        for i in range(chunks_per_domain):
+            if i % chunks_per_document == 0:
+                document_id = str(uuid.UUID(int=rng.getrandbits(128)))
+                source_info = {
+                    "title": f"Load test {domain} document {i // chunks_per_document}",
+                    "author": "Load Test",
+                    "publication_date": "2024-01-01",
+                    "url": None,
+                    "seed": SEED_TAG,
+                }
+                cursor.execute(
+                    "INSERT INTO documents (id, source_info) VALUES (%s, %s) ON CONFLICT (id) DO NOTHING",
+                    (document_id, Json(source_info))
+                )
+            chunk_index = i % chunks_per_document
+            text = make_text(rng, domain, chunk_words)
+            metadata = {
+                "chunk_index": chunk_index,
+                "start_token": chunk_index * chunk_words,
+                "end_token": (chunk_index + 1) * chunk_words,
+            }
+            rows.append((text, str(embed_text(text)), document_id, domain, Json(metadata)))
+            if len(rows) >= batch_size:
+                _insert(cursor, rows)
+                total += len(rows)
+                rows = []
+        if rows:
+            _insert(cursor, rows)
+            total += len(rows)
+        conn.commit()
+        print(f"Seeded {chunks_per_domain} chunks for domain '{domain}'")
+    cursor.close()
+    return total
+
+
+def _insert(cursor, rows):
+    execute_values(
+        cursor,
+        """
+        INSERT INTO knowledge_chunks (chunk_text, embedding, document_id, domain, chunk_metadata)
+        VALUES %s
+        """,
+        rows,
+        template="(%s, %s::vector(1536), %s::uuid, %s, %s)"
+    )
+
+
+def clear(conn):
+    cursor = conn.cursor()
+    # Chunks go with their documents (ON DELETE CASCADE)
+    cursor.execute("DELETE FROM documents WHERE source_info->>'seed' = %s", (SEED_TAG,))
+    deleted = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    return deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a synthetic pgvector corpus for load testing")
+    parser.add_argument("--chunks-per-domain", type=int, default=2000)
+    parser.add_argument("--chunk-words", type=int, default=200)
+    parser.add_argument("--chunks-per-document", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--clear", action="store_true", help="Remove previously seeded chunks first")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        host=os.getenv("POSTGRES_HOST", "localhost"),
+        port=os.getenv("POSTGRES_PORT", "5432"),
+        user=os.getenv("POSTGRES_USER", "postgres"),
+        password=os.getenv("POSTGRES_PASSWORD", "postgrespassword"),
+        dbname=os.getenv("POSTGRES_DB", "commandcore")
+    )
+    try:
+        if args.clear:
+            print(f"Removed {clear(conn)} previously seeded documents")
+        started = time.time()
+        total = seed(conn, args.chunks_per_domain, args.chunk_words, args.chunks_per_document, args.seed)
+        print(f"Seeded {total} chunks in {time.time() - started:.1f}s")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from app.admission import Overloaded, StageLimiter, request_priority
+
+
+def test_stage_limiter_admits_interactive_first():
+    limiter = StageLimiter("test", 1)
+    order = []
+
+    async def hold(name, priority, started):
+        with request_priority(priority):
+            async with limiter.slot():
+                started.set()
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+    async def main():
+        first_started = asyncio.Event()
+        first = asyncio.ensure_future(hold("first", "batch", first_started))
+        await first_started.wait()
+        queued = [
+            asyncio.ensure_future(hold("batch", "batch", asyncio.Event())),
+            asyncio.ensure_future(hold("interactive", "interactive", asyncio.Event())),
+        ]
+        await asyncio.gather(first, *queued)
+
+    asyncio.run(main())
+    assert order == ["first", "interactive", "batch"]
+    assert limiter.active == 0
+
+
+def test_stage_limiter_sheds_batch_before_interactive():
+    limiter = StageLimiter("test", 1, queue_size=1, batch_queue_size=0, queue_timeout=0.05)
+
+    async def main():
+        async with limiter.slot():
+            with request_priority("batch"), pytest.raises(Overloaded) as full:
+                async with limiter.slot():
+                    pass
+            with request_priority("interactive"), pytest.raises(Overloaded) as timed_out:
+                async with limiter.slot():
+                    pass
+        return full.value, timed_out.value
+
+    full, timed_out = asyncio.run(main())
+    assert full.status_code == 429 and full.retry_after >= 1
+    assert timed_out.status_code == 503
+    assert limiter.rejected == 2
+    assert limiter.active == 0 and limiter.queued() == 0
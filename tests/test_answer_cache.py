@@ -0,0 +1,21 @@
+from app.answer_cache import AnswerCache
+
+
+def test_answer_cache_evicts_least_recently_used():
+    cache = AnswerCache(max_size=2, ttl=60)
+    cache.put(("a",), "A")
+    cache.put(("b",), "B")
+    assert cache.get(("a",)) == "A"
+    cache.put(("c",), "C")
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) == "A" and cache.get(("c",)) == "C"
+    assert len(cache) == 2
+
+
+def test_answer_cache_expires_entries():
+    cache = AnswerCache(max_size=10, ttl=0)
+    cache.put(("a",), "A")
+    cache.put(("b",), "B", ttl=60)
+    assert cache.get(("a",)) is None
+    assert cache.get(("b",)) == "B"
+    assert len(cache) == 1
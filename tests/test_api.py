@@ -45,6 +45,27 @@ def test_health_endpoints():
     
     return True
 
+def test_metrics_endpoints():
+    """Test that both services expose Prometheus metrics."""
+    print("\nTesting metrics endpoints...")
+    
+    for name, url, metric in [
+        ("Ingestion", INGESTION_API_URL, "commandcore_ingestion_stage_seconds"),
+        ("Orchestrator", ORCHESTRATOR_API_URL, "commandcore_orchestrator_stage_seconds")
+    ]:
+        try:
+            response = requests.get(f"{url}/metrics")
+            if response.status_code == 200 and metric in response.text:
+                print(f"✅ {name} service metrics endpoint passed")
+            else:
+                print(f"❌ {name} service metrics endpoint failed: {response.status_code}")
+                return False
+        except Exception as e:
+            print(f"❌ {name} service metrics endpoint failed: {str(e)}")
+            return False
+    
+    return True
+
 def test_file_upload():
     """Test document upload to the ingestion service."""
     print("\nTesting file upload...")
@@ -163,6 +184,9 @@ def main():
         print("\n❌ Health check tests failed. Make sure all services are running.")
         sys.exit(1)
     
+    # Test metrics endpoints
+    test_metrics_endpoints()
+    
     # Test file upload
     job_id = test_file_upload()
     
@@ -0,0 +1,45 @@
+import asyncio
+
+from app.batching import MicroBatcher
+
+
+def test_micro_batcher_shares_identical_inputs():
+    sent = []
+
+    async def send(texts):
+        sent.append(texts)
+        return [text.upper() for text in texts]
+
+    async def main():
+        batcher = MicroBatcher(send, window=0.01, max_batch=10)
+        return await asyncio.gather(batcher.submit("a"), batcher.submit("b"), batcher.submit("a"))
+
+    assert asyncio.run(main()) == ["A", "B", "A"]
+    assert sent == [["a", "b"]]
+
+
+def test_micro_batcher_fails_every_waiter_on_result_count_mismatch():
+    async def send(texts):
+        return texts[:-1]
+
+    async def main():
+        batcher = MicroBatcher(send, window=0.01, max_batch=10)
+        return await asyncio.wait_for(
+            asyncio.gather(batcher.submit("a"), batcher.submit("b"), batcher.submit("a"), return_exceptions=True),
+            timeout=1
+        )
+
+    results = asyncio.run(main())
+    assert len(results) == 3
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_micro_batcher_fails_every_waiter_when_the_call_raises():
+    async def send(texts):
+        raise RuntimeError("batch failed")
+
+    async def main():
+        batcher = MicroBatcher(send, window=0.01, max_batch=2)
+        return await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+
+    assert [str(result) for result in asyncio.run(main())] == ["batch failed", "batch failed"]
@@ -0,0 +1,41 @@
+import asyncio
+
+from app.coalesce import SingleFlight
+
+
+def test_single_flight_shares_one_run():
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(flights.run(("q",), work) for _ in range(3)))
+
+    assert asyncio.run(main()) == ["answer"] * 3
+    assert len(calls) == 1
+    assert (flights.executions, flights.coalesced) == (1, 2)
+
+
+def test_single_flight_propagates_errors_and_runs_again():
+    flights = SingleFlight()
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def main():
+        results = await asyncio.gather(flights.run(("q",), failing), flights.run(("q",), failing), return_exceptions=True)
+        # A finished run is not reused by later requests
+        results.append(await flights.run(("q",), lambda: asyncio.sleep(0, result="recovered")))
+        return results
+
+    first, second, third = asyncio.run(main())
+    assert isinstance(first, RuntimeError) and first is second
+    assert third == "recovered"
+    assert len(calls) == 1
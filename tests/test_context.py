@@ -0,0 +1,73 @@
+import pytest
+
+from app.context import get_tokenizer, merge_chunks, pack_context
+from app.schemas import KnowledgeChunk
+
+
+def _chunk(chunk_id, text, similarity, document_id="doc-a", start=None, end=None, title="Guide"):
+    metadata = {"start_token": start, "end_token": end} if start is not None else {}
+    return KnowledgeChunk(
+        id=chunk_id,
+        text=text,
+        source_info={"title": title, "author": "Ops Team", "publication_date": "2024-01-01"},
+        similarity=similarity,
+        metadata=metadata,
+        document_id=document_id
+    )
+
+
+@pytest.fixture
+def tokenizer():
+    # tiktoken downloads its encodings on first use
+    try:
+        return get_tokenizer()
+    except Exception as e:
+        pytest.skip(f"tokenizer unavailable: {e}")
+
+
+def test_merge_chunks_joins_overlapping_windows_once():
+    passages = merge_chunks([
+        _chunk(2, "nodes restart failed pods. Services route traffic.", 0.8, start=8, end=20),
+        _chunk(1, "Kubernetes schedules pods onto nodes restart failed pods.", 0.9, start=0, end=12),
+    ])
+    assert len(passages) == 1
+    assert passages[0]["text"] == "Kubernetes schedules pods onto nodes restart failed pods. Services route traffic."
+    assert passages[0]["chunk_ids"] == [1, 2]
+    assert passages[0]["similarity"] == 0.9
+
+
+def test_merge_chunks_keeps_separate_documents_and_drops_repeated_text():
+    passages = merge_chunks([
+        _chunk(1, "Hypervisors isolate guests.", 0.9, document_id="doc-a"),
+        _chunk(2, "Hypervisors isolate guests.", 0.8, document_id="doc-a"),
+        _chunk(3, "Containers share the host kernel.", 0.7, document_id="doc-b", title="Containers"),
+    ])
+    assert [(p["document_key"], p["chunk_ids"]) for p in passages] == [("doc-a", [1]), ("doc-b", [3])]
+
+
+def test_pack_context_numbers_sources_by_relevance(tokenizer):
+    context = pack_context([
+        _chunk(1, "Containers share the host kernel.", 0.7, document_id="doc-b", title="Containers"),
+        _chunk(2, "Hypervisors isolate guests.", 0.9, document_id="doc-a", title="Virtualization"),
+        _chunk(3, "Type 1 hypervisors run on bare metal.", 0.8, document_id="doc-a", title="Virtualization"),
+    ], token_budget=1000)
+    assert context.text.split("\n\n") == [
+        "[1] Hypervisors isolate guests.",
+        "[1] Type 1 hypervisors run on bare metal.",
+        "[2] Containers share the host kernel.",
+    ]
+    assert [(source.title, source.chunk_ids) for source in context.sources] == [("Virtualization", [2, 3]), ("Containers", [1])]
+    assert context.chunk_ids == [2, 3, 1]
+    assert 0 < context.token_count <= 1000
+
+
+def test_pack_context_stops_at_the_token_budget(tokenizer):
+    long_text = " ".join(["virtualization"] * 200)
+    context = pack_context([
+        _chunk(1, long_text, 0.9, document_id="doc-a"),
+        _chunk(2, "Containers share the host kernel.", 0.7, document_id="doc-b"),
+    ], token_budget=80)
+    # The first passage is truncated to the budget; nothing useful fits after it
+    assert context.chunk_ids == [1]
+    assert context.token_count <= 80
+    assert len(context.sources) == 1
@@ -0,0 +1,25 @@
+from ingestion_app import dedupe
+
+TEXT = (
+    "Kubernetes schedules containers onto nodes in a cluster and restarts them when they fail, "
+    "while services give each set of pods a stable address inside the cluster network."
+)
+
+
+def test_minhash_near_duplicates_share_a_band():
+    signature = dedupe.minhash_signature(TEXT)
+    edited = dedupe.minhash_signature(TEXT + " Last reviewed in March 2024.")
+    assert dedupe.estimated_similarity(signature, dedupe.minhash_signature(TEXT.upper())) == 1.0
+    assert dedupe.estimated_similarity(signature, edited) >= 0.7
+    assert set(dedupe.band_buckets(signature)) & set(dedupe.band_buckets(edited))
+
+
+def test_minhash_unrelated_texts_do_not_collide():
+    signature = dedupe.minhash_signature(TEXT)
+    other = dedupe.minhash_signature(
+        "Gradient descent updates the weights of a neural network by stepping against the gradient of the loss."
+    )
+    assert dedupe.estimated_similarity(signature, other) < 0.2
+    assert not set(dedupe.band_buckets(signature)) & set(dedupe.band_buckets(other))
+    assert len(dedupe.band_buckets(signature)) == dedupe.settings.DEDUP_BANDS
+    assert dedupe.minhash_signature("  ...  ") is None
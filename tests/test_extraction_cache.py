@@ -0,0 +1,50 @@
+import os
+
+from ingestion_app.extraction_cache import ExtractionCache, content_key
+from ingestion_app.schemas import ExtractedText
+
+EXTRACTED = ExtractedText(text="Page one.\fPage two.", page_offsets=[0, 10])
+METADATA = {"title": "Runbook", "author": "Ops Team"}
+
+
+def test_content_key_depends_on_the_bytes_only(tmp_path):
+    first, copy, other = tmp_path / "a.pdf", tmp_path / "b.pdf", tmp_path / "c.pdf"
+    first.write_bytes(b"%PDF-1.4 same")
+    copy.write_bytes(b"%PDF-1.4 same")
+    other.write_bytes(b"%PDF-1.4 different")
+    assert content_key(str(first)) == content_key(str(copy))
+    assert content_key(str(first)) != content_key(str(other))
+
+
+def test_cache_round_trips_text_offsets_and_metadata(tmp_path):
+    cache = ExtractionCache(str(tmp_path), max_bytes=1 << 20)
+    assert cache.get("ab" * 32) is None
+    cache.put("ab" * 32, EXTRACTED, METADATA)
+    assert cache.get("ab" * 32) == (EXTRACTED, METADATA)
+
+
+def test_unreadable_entry_is_a_miss_and_removed(tmp_path):
+    cache = ExtractionCache(str(tmp_path), max_bytes=1 << 20)
+    cache.put("cd" * 32, EXTRACTED, METADATA)
+    path = cache._path("cd" * 32)
+    with open(path, "wb") as f:
+        f.write(b"not zlib")
+    assert cache.get("cd" * 32) is None
+    assert not os.path.exists(path)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ExtractionCache(str(tmp_path), max_bytes=1 << 20)
+    keys = [f"{i:02x}" * 32 for i in range(3)]
+    for age, key in enumerate(keys):
+        cache.put(key, EXTRACTED, METADATA)
+        os.utime(cache._path(key), (1000 + age, 1000 + age))
+    entry_size = os.path.getsize(cache._path(keys[0]))
+    # A hit makes the oldest entry the most recently used
+    assert cache.get(keys[0]) is not None
+
+    # Room for three entries: adding a fourth evicts down to 90% of the budget
+    cache.max_bytes = entry_size * 3
+    cache.put("ff" * 32, EXTRACTED, METADATA)
+    assert [cache.get(key) is not None for key in keys] == [True, False, False]
+    assert cache.get("ff" * 32) == (EXTRACTED, METADATA)
@@ -0,0 +1,29 @@
+from datetime import date
+
+from app.db_utils import _metadata_clause
+from app.schemas import MetadataFilter
+
+
+def test_every_filter_field_adds_a_condition_on_documents():
+    clause, params = _metadata_clause(MetadataFilter(
+        published_after=date(2023, 1, 1),
+        published_before=date(2023, 12, 31),
+        authors=["Ops Team", "SRE"],
+        classifications=["Internal"]
+    ))
+    assert clause == (
+        "d.publication_date >= %s AND d.publication_date <= %s"
+        " AND lower(d.author) = ANY(%s) AND lower(d.classification) = ANY(%s)"
+    )
+    assert params == [date(2023, 1, 1), date(2023, 12, 31), ["ops team", "sre"], ["internal"]]
+
+
+def test_only_given_fields_are_matched():
+    assert _metadata_clause(MetadataFilter(authors=["SRE"])) == ("lower(d.author) = ANY(%s)", [["sre"]])
+    assert _metadata_clause(MetadataFilter()) == ("", [])
+
+
+def test_empty_filters_are_recognised():
+    assert MetadataFilter().is_empty()
+    assert MetadataFilter(authors=[], classifications=[]).is_empty()
+    assert not MetadataFilter(published_after=date(2024, 1, 1)).is_empty()
@@ -0,0 +1,43 @@
+import asyncio
+
+from app.prefetch import PrefetchCache
+from app.schemas import QueryRequest
+
+PREFETCHED = ([0.1, 0.2], {None: ["chunk"]})
+
+
+def _claim(draft, final, lsn="0/10"):
+    async def main():
+        cache = PrefetchCache(max_sessions=10)
+        assert cache.start(draft, lambda: asyncio.sleep(0, result=(PREFETCHED, lsn))) == "started"
+        return await cache.take(final), cache
+
+    return asyncio.run(main())
+
+
+def test_prefetch_is_reused_within_the_same_scope():
+    prefetched, cache = _claim(
+        QueryRequest(query="What is a hypervisor", session_id="s", domain="virt-os"),
+        QueryRequest(query="what is a hypervisor?", session_id="s", domain="virt-os")
+    )
+    assert prefetched == PREFETCHED
+    assert cache.reused == 1
+
+
+def test_prefetch_is_not_reused_across_scopes():
+    prefetched, cache = _claim(
+        QueryRequest(query="What is a hypervisor", session_id="s", domain="virt-os"),
+        QueryRequest(query="What is a hypervisor", session_id="s", domain="cloud")
+    )
+    assert prefetched is None
+    assert cache.reused == 0
+
+
+def test_prefetch_read_before_read_after_lsn_keeps_only_the_embedding():
+    prefetched, cache = _claim(
+        QueryRequest(query="What is a hypervisor", session_id="s", read_after_lsn="0/20"),
+        QueryRequest(query="What is a hypervisor", session_id="s", read_after_lsn="0/20"),
+        lsn="0/10"
+    )
+    assert prefetched == (PREFETCHED[0], None)
+    assert cache.wasted == 1
@@ -0,0 +1,73 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from commandcore_common.profiling import Profiler, profiling_requested
+
+
+def _busy_wait(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_requested_profile_samples_the_running_stack():
+    profiler = Profiler(slow_threshold_ms=0, sample_interval_ms=1, trace_buffer=10)
+
+    async def handle():
+        with profiler.profiled("query", timings={"retrieval_ms": 1.5}, force=True, domain="cloud") as trace:
+            _busy_wait(0.2)
+        return trace
+
+    trace = asyncio.run(handle())
+    assert profiler.traces.get(trace.id) is trace
+    summary = trace.summary()
+    assert summary["reason"] == "requested" and summary["labels"] == {"domain": "cloud"}
+    assert summary["samples"] > 0
+    assert "_busy_wait" in trace.collapsed()
+    assert trace.to_dict()["timings"] == {"retrieval_ms": 1.5}
+
+
+def test_unrequested_runs_are_kept_only_when_slow():
+    profiler = Profiler(slow_threshold_ms=50, sample_interval_ms=1, trace_buffer=10)
+
+    async def handle(seconds):
+        with profiler.profiled("query", timings={"total_ms": seconds * 1000}) as trace:
+            await asyncio.sleep(seconds)
+        return trace
+
+    fast, slow = asyncio.run(handle(0)), asyncio.run(handle(0.08))
+    assert profiler.traces.get(fast.id) is None
+    kept = profiler.traces.get(slow.id)
+    assert kept.summary()["reason"] == "slow" and kept.summary()["samples"] == 0
+    assert kept.timings == {"total_ms": 80.0}
+
+
+def test_profiling_is_off_without_a_request_or_threshold():
+    profiler = Profiler(slow_threshold_ms=0, sample_interval_ms=1, trace_buffer=10)
+
+    async def handle():
+        with profiler.profiled("query") as trace:
+            return trace
+
+    assert asyncio.run(handle()) is None
+    assert profiler.traces.summaries() == []
+
+
+def test_trace_buffer_keeps_the_most_recent_newest_first():
+    profiler = Profiler(slow_threshold_ms=0, sample_interval_ms=1, trace_buffer=2)
+
+    async def handle(name):
+        with profiler.profiled(name, force=True):
+            pass
+
+    for name in ("first", "second", "third"):
+        asyncio.run(handle(name))
+    assert [summary["name"] for summary in profiler.traces.summaries()] == ["third", "second"]
+
+
+def test_profiler_from_settings_and_header_parsing():
+    settings = SimpleNamespace(PROFILE_SLOW_THRESHOLD_MS=250.0, PROFILE_SAMPLE_INTERVAL_MS=5.0, PROFILE_TRACE_BUFFER=3)
+    profiler = Profiler.from_settings(settings)
+    assert profiler.slow_threshold_ms == 250.0
+    assert [profiling_requested(value) for value in ("1", " TRUE ", "on", "0", "", None)] == [True, True, True, False, False, False]
@@ -0,0 +1,38 @@
+import asyncio
+
+import numpy as np
+
+from app.rerank import mmr_select, rerank_chunks
+from app.schemas import KnowledgeChunk
+
+QUERY = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+# Two near-copies of the most relevant passage and a less relevant, different one
+CANDIDATES = np.array([
+    [0.95, 0.31, 0.0],
+    [0.94, 0.34, 0.0],
+    [0.90, 0.0, 0.436],
+], dtype=np.float32)
+
+
+def test_mmr_select_prefers_a_diverse_second_pick():
+    assert mmr_select(QUERY, CANDIDATES, k=2, lambda_mult=0.5) == [0, 2]
+
+
+def test_mmr_select_with_pure_relevance_ranks_by_similarity():
+    assert mmr_select(QUERY, CANDIDATES, k=3, lambda_mult=1.0) == [0, 1, 2]
+
+
+def test_mmr_select_uses_given_relevance_and_clamps_k():
+    relevance = np.array([0.1, 0.2, 0.9], dtype=np.float32)
+    assert mmr_select(QUERY, CANDIDATES, k=10, lambda_mult=1.0, relevance=relevance) == [2, 1, 0]
+    assert mmr_select(QUERY, CANDIDATES[:0], k=3) == []
+    assert mmr_select(QUERY, CANDIDATES, k=0) == []
+
+
+def test_rerank_chunks_keeps_top_k_diverse_chunks():
+    chunks = [
+        KnowledgeChunk(id=i, text=f"passage {i}", source_info={}, similarity=float(CANDIDATES[i] @ QUERY))
+        for i in range(len(CANDIDATES))
+    ]
+    selected = asyncio.run(rerank_chunks("query", QUERY, chunks, CANDIDATES, top_k=2))
+    assert [chunk.id for chunk in selected] == [0, 2]
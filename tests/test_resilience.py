@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from commandcore_common.resilience import OpenAICaller
+
+
+def _caller():
+    caller = OpenAICaller(
+        hedge_operations="chat",
+        hedge_min_samples=1,
+        max_retries=0,
+        retry_backoff=0.01,
+        breaker_window=20,
+        breaker_min_calls=10,
+        breaker_error_rate=0.5,
+        breaker_cooldown=30
+    )
+    # A p95 of 10ms makes every slower attempt send a hedge
+    caller.latencies.record("chat", "model", 0.01)
+    return caller
+
+
+def test_hedged_call_takes_the_faster_request_and_cancels_the_other():
+    caller = _caller()
+    started, cancelled = [], []
+
+    async def call(model, timeout):
+        # The first request stalls; the hedge sent after the p95 answers quickly
+        slow = not started
+        started.append(1)
+        try:
+            await asyncio.sleep(1 if slow else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        return "slow" if slow else "hedge"
+
+    async def main():
+        result = await caller.call("chat", "model", call, timeout=5)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(main()) == "hedge"
+    assert len(started) == 2 and len(cancelled) == 1
+
+
+def test_cancelled_caller_cancels_every_hedged_request():
+    caller = _caller()
+    started, cancelled = [], []
+
+    async def call(model, timeout):
+        started.append(1)
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def main():
+        task = asyncio.ensure_future(caller.call("chat", "model", call, timeout=5))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert len(started) == 2 and len(cancelled) == 2
@@ -0,0 +1,66 @@
+import struct
+
+import numpy as np
+
+from app.routing import DomainRouter
+
+
+def _wire(vector):
+    """vector_send() output for `vector`."""
+    return struct.pack(">hh", len(vector), 0) + np.asarray(vector, dtype=">f4").tobytes()
+
+
+class _Cursor:
+    """Serves domain_centroids rows and counts the reloads."""
+
+    def __init__(self, sums):
+        self.rows = [(domain, _wire(embedding_sum)) for domain, embedding_sum in sums.items()]
+        self.queries = 0
+
+    def execute(self, query, params=None):
+        self.queries += 1
+
+    def fetchall(self):
+        return self.rows
+
+
+# Sums of many chunk embeddings; only their direction matters
+CENTROIDS = {
+    "cloud": [400.0, 0.0, 0.0],
+    "security": [0.0, 90.0, 0.0],
+    "virt-os": [0.0, 0.0, 7.0],
+}
+
+
+def test_confident_query_is_routed_to_one_domain():
+    cursor = _Cursor(CENTROIDS)
+    assert DomainRouter().route(cursor, [0.9, 0.1, 0.1]) == ["cloud"]
+
+
+def test_query_between_two_domains_is_routed_to_both():
+    cursor = _Cursor(CENTROIDS)
+    assert sorted(DomainRouter().route(cursor, [0.0, 0.7, 0.7])) == ["security", "virt-os"]
+
+
+def test_ambiguous_query_searches_globally():
+    cursor = _Cursor(CENTROIDS)
+    router = DomainRouter()
+    scores = router.scores(cursor, [1.0, 1.0, 1.0])
+    assert sorted(scores) == ["cloud", "security", "virt-os"]
+    assert abs(sum(scores.values()) - 1.0) < 1e-6
+    assert router.route(cursor, [1.0, 1.0, 1.0]) is None
+
+
+def test_centroids_are_reloaded_only_after_the_refresh_interval():
+    cursor = _Cursor(CENTROIDS)
+    router = DomainRouter()
+    router.route(cursor, [1.0, 0.0, 0.0])
+    router.route(cursor, [0.0, 1.0, 0.0])
+    assert cursor.queries == 1
+
+
+def test_a_single_domain_is_not_routed():
+    cursor = _Cursor({"cloud": CENTROIDS["cloud"]})
+    router = DomainRouter()
+    assert router.scores(cursor, [1.0, 0.0, 0.0]) == {}
+    assert router.route(cursor, [1.0, 0.0, 0.0]) is None
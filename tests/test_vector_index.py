@@ -0,0 +1,115 @@
+import struct
+
+import numpy as np
+import pytest
+
+from app.vector_index import VectorIndex, build_snapshot
+
+DIMENSIONS = 1536
+
+
+def _wire(vector):
+    """vector_send() output for `vector`."""
+    return struct.pack(">hh", len(vector), 0) + np.asarray(vector, dtype=">f4").tobytes()
+
+
+def _row(chunk_id, vector, domain="cloud", document_id="doc-a"):
+    return {
+        "id": chunk_id,
+        "chunk_text": f"chunk {chunk_id}",
+        "document_id": document_id,
+        "chunk_metadata": {"page": chunk_id},
+        "domain": domain,
+        "embedding": _wire(vector),
+    }
+
+
+class _Cursor:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchone(self):
+        # The snapshot's xmin
+        return ("100",)
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class _Connection:
+    """Just enough of a connection for build_snapshot's export query."""
+
+    def __init__(self, rows):
+        self._rows = rows
+
+    def rollback(self):
+        pass
+
+    def cursor(self, cursor_factory=None):
+        return _Cursor(self._rows)
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).normal(size=(4, DIMENSIONS)).astype(np.float32)
+
+
+@pytest.fixture
+def index(tmp_path, vectors):
+    rows = [_row(1, vectors[0]), _row(2, vectors[1]), _row(3, vectors[2], domain="virt-os", document_id="doc-b")]
+    build_snapshot(_Connection(rows), str(tmp_path))
+    return VectorIndex(str(tmp_path / "current"))
+
+
+def test_search_reads_records_from_the_snapshot(index, vectors):
+    chunks, embeddings = index.search(vectors[1], similarity_threshold=0.5, include_embeddings=True)
+    assert [(chunk.id, chunk.text, chunk.metadata, chunk.document_id) for chunk in chunks] == [(2, "chunk 2", {"page": 2}, "doc-a")]
+    assert embeddings.shape == (1, DIMENSIONS)
+    assert chunks[0].similarity == pytest.approx(1.0, abs=1e-5)
+    assert index.position == (100, 0)
+
+
+def test_search_filters_by_domain(index, vectors):
+    assert index.search(vectors[2], domain_filter="cloud", similarity_threshold=0.5)[0] == []
+    assert [chunk.id for chunk in index.search(vectors[2], domain_filter="virt-os", similarity_threshold=0.5)[0]] == [3]
+
+
+def test_delta_replaces_and_removes_snapshot_rows(index, vectors):
+    # Chunk 1 is deleted and chunk 2 re-embedded with a new vector
+    index.apply_changes([1], [_row(2, vectors[3])], (101, 4))
+    assert index.search(vectors[0], similarity_threshold=0.5)[0] == []
+    assert index.search(vectors[1], similarity_threshold=0.5)[0] == []
+    chunks, embeddings = index.search(vectors[3], similarity_threshold=0.5, include_embeddings=True)
+    assert [chunk.id for chunk in chunks] == [2]
+    assert embeddings.shape == (1, DIMENSIONS)
+    assert index.position == (101, 4)
+    assert index.delta_size == 3
+
+
+def test_apply_changes_leaves_the_previous_delta_intact(index, vectors):
+    index.apply_changes([], [_row(4, vectors[3])], (101, 1))
+    before = index.delta
+    index.apply_changes([4], [], (101, 2))
+    # A search holding the old delta still sees a consistent state
+    assert before.ids == [4] and 4 in before.records and before.matrix.shape == (1, DIMENSIONS)
+    assert index.delta.ids == [] and 4 in index.delta.removed
+
+
+def test_search_skips_documents_queued_for_deletion(index, vectors):
+    index.apply_changes([], [_row(4, vectors[3], document_id="doc-b")], (101, 1))
+    index.deleted_documents = {"doc-b"}
+    assert index.search(vectors[2], similarity_threshold=0.5)[0] == []
+    assert index.search(vectors[3], similarity_threshold=0.5)[0] == []
+    assert [chunk.id for chunk in index.search(vectors[0], similarity_threshold=0.5)[0]] == [1]
+
+
+def test_empty_snapshot_loads_and_finds_nothing(tmp_path, vectors):
+    build_snapshot(_Connection([]), str(tmp_path))
+    index = VectorIndex(str(tmp_path / "current"))
+    assert index.search(vectors[0]) == ([], None)